@@ -0,0 +1,18 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+{
+    'name': 'Prometheus Metrics',
+    'version': '1.0',
+    'category': 'Hidden/Tools',
+    'summary': "Expose in-process counters and histograms on /metrics",
+    'description': """
+    Expose the metrics recorded by other modules in the Prometheus text format.
+    - Counters and histograms are kept in memory by each worker.
+    - Samples are labelled with the worker pid, to be summed by the scraper.
+    - /metrics is disabled until a metrics_token is set in the server configuration,
+      and then requires it as an "Authorization: Bearer" header.
+    """,
+    'depends': ['base'],
+    'data': [],
+    'installable': True,
+    'license': 'LGPL-3',
+}
@@ -0,0 +1,31 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import hmac
+
+from werkzeug.exceptions import Forbidden
+
+from odoo import http
+from odoo.http import request
+from odoo.tools import config
+
+from ..metrics import CONTENT_TYPE, REGISTRY
+
+
+class Metrics(http.Controller):
+
+    @http.route('/metrics', type='http', auth='none', methods=['GET'], save_session=False)
+    def metrics(self):
+        """Render the metrics of this worker for a scraper sending the ``metrics_token`` server option.
+
+        The token is read from the configuration file rather than the database,
+        as the request is not bound to one; the route is disabled when unset.
+        """
+        token = config.get('metrics_token')
+        if not token:
+            raise request.not_found()
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            raise Forbidden()
+        # the metrics live in the memory of the worker serving the request:
+        # nothing is read from the database
+        return request.make_response(REGISTRY.render(), headers=[('Content-Type', CONTENT_TYPE)])
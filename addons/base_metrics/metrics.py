@@ -0,0 +1,187 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+"""In-process metrics, rendered in the Prometheus text format on ``/metrics``.
+
+Modules declare their metrics once, at import time::
+
+    from odoo.addons.base_metrics.metrics import REGISTRY
+
+    IMPORTED = REGISTRY.counter('statements_imported_total', "Statements imported.")
+    DURATION = REGISTRY.histogram('import_seconds', "Import duration.", ['phase'])
+
+    IMPORTED.inc_on_commit(env.cr)
+    with DURATION.time(phase='parse'):
+        ...
+
+Counters of database work use ``inc_on_commit``, so the work of rolled back
+transactions (failed requests, retried serialization failures) is not counted.
+
+Each worker process keeps its own values in memory: recording a sample takes
+a lock and a dictionary update, and never touches the database. Every sample
+is rendered with a ``worker`` label holding the process id, so the scraper
+sums the series over the workers it reached, and a restarted worker shows up
+as a new series instead of a counter reset.
+"""
+
+import bisect
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value, quote=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or not all(name in labels for name in self.labelnames):
+            raise ValueError(f"Metric {self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        """Yield ``(sample_name, labels, value)``, labels being a list of ``(name, value)``."""
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} cannot be decreased")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc_on_commit(self, cr, amount=1, **labels):
+        """Increase the counter once the transaction of ``cr`` is committed."""
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} cannot be decreased")
+        self._key(labels)
+        cr.postcommit.add(functools.partial(self.inc, amount, **labels))
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # the last slot counts the values above the largest bucket
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels):
+        """Observe the duration of a ``with`` block, or of each call when used as a decorator."""
+        self._key(labels)
+        return self._timer(labels)
+
+    @contextlib.contextmanager
+    def _timer(self, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get(self, **labels):
+        """Return ``(count, sum)`` of the observed values."""
+        counts, total = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts), total
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', [*labels, ('le', _format_value(float(bound)))], cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    """Set of metrics of the current process, rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not metric_class or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Return all the metrics in the Prometheus text exposition format."""
+        worker = ('worker', str(os.getpid()))
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {_escape(metric.documentation, quote=False)}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, labels, value in metric._samples():
+                label_str = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in [*labels, worker])
+                lines.append(f"{sample_name}{{{label_str}}} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,95 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import os
+from types import SimpleNamespace
+
+from odoo.tests import common, tagged
+from odoo.tools.misc import Callbacks
+
+from odoo.addons.base_metrics.metrics import Registry
+
+
+@tagged('post_install', '-at_install')
+class TestMetrics(common.BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = Registry()
+        self.worker = f'worker="{os.getpid()}"'
+
+    def test_counter(self):
+        counter = self.registry.counter('statements_total', "Statements.", ['state'])
+        counter.inc(state='posted')
+        counter.inc(2, state='posted')
+        counter.inc(state='draft')
+        self.assertEqual(counter.get(state='posted'), 3)
+        self.assertEqual(counter.get(state='cancel'), 0)
+        with self.assertRaises(ValueError):
+            counter.inc(-1, state='posted')
+        with self.assertRaises(ValueError):
+            counter.inc(kind='posted')
+
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines, [
+            '# HELP statements_total Statements.',
+            '# TYPE statements_total counter',
+            f'statements_total{{state="draft",{self.worker}}} 1',
+            f'statements_total{{state="posted",{self.worker}}} 3',
+        ])
+
+    def test_counter_on_commit(self):
+        counter = self.registry.counter('bills_total', "Bills.", ['state'])
+        cr = SimpleNamespace(postcommit=Callbacks())
+        counter.inc_on_commit(cr, 2, state='posted')
+        counter.inc_on_commit(cr, state='posted')
+        with self.assertRaises(ValueError):
+            counter.inc_on_commit(cr, state_id='posted')
+        self.assertEqual(counter.get(state='posted'), 0, "Nothing is counted before the commit")
+        cr.postcommit.run()
+        self.assertEqual(counter.get(state='posted'), 3)
+
+        counter.inc_on_commit(cr, state='posted')
+        cr.postcommit.clear()
+        cr.postcommit.run()
+        self.assertEqual(counter.get(state='posted'), 3, "Rolled back transactions are not counted")
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('phase_seconds', "Phases.", ['phase'], buckets=(1.0, 0.1))
+        histogram.observe(0.05, phase='parse')
+        histogram.observe(0.1, phase='parse')
+        histogram.observe(3, phase='parse')
+        self.assertEqual(histogram.get(phase='parse'), (3, 3.15))
+
+        output = self.registry.render()
+        self.assertIn(f'phase_seconds_bucket{{phase="parse",le="0.1",{self.worker}}} 2\n', output)
+        self.assertIn(f'phase_seconds_bucket{{phase="parse",le="1.0",{self.worker}}} 2\n', output)
+        self.assertIn(f'phase_seconds_bucket{{phase="parse",le="+Inf",{self.worker}}} 3\n', output)
+        self.assertIn(f'phase_seconds_count{{phase="parse",{self.worker}}} 3\n', output)
+
+        @histogram.time(phase='post')
+        def post():
+            return 'done'
+
+        self.assertEqual(post(), 'done')
+        post()
+        with histogram.time(phase='extract'):
+            pass
+        self.assertEqual(histogram.get(phase='post')[0], 2)
+        self.assertEqual(histogram.get(phase='extract')[0], 1)
+        with self.assertRaises(ValueError):
+            histogram.time(step='post')
+
+    def test_register_twice(self):
+        counter = self.registry.counter('lines_total', "Lines.", ['kind'])
+        self.assertIs(self.registry.counter('lines_total', "Lines.", ['kind']), counter)
+        with self.assertRaises(ValueError):
+            self.registry.histogram('lines_total', "Lines.", ['kind'])
+        with self.assertRaises(ValueError):
+            self.registry.counter('lines_total', "Lines.")
+
+    def test_escape_labels(self):
+        counter = self.registry.counter('errors_total', "Errors,\nby message.", ['message'])
+        counter.inc(message='bad "value" \\ here')
+        output = self.registry.render()
+        self.assertIn('# HELP errors_total Errors,\\nby message.\n', output)
+        self.assertIn(f'errors_total{{message="bad \\"value\\" \\\\ here",{self.worker}}} 1\n', output)
@@ -9,7 +9,7 @@
         and facilitates reconciliation with Odoo partners and accounts.
     """,
     'author': 'AthmanZiri',
-    'depends': ['base', 'account', 'mail'],
+    'depends': ['base', 'account', 'mail', 'base_metrics'],
     'data': [
         'security/ir.model.access.csv',
         'data/product_data.xml',
@@ -0,0 +1,22 @@
+"""Import metrics of the Safaricom statements, exposed by ``base_metrics`` on ``/metrics``."""
+
+from odoo.addons.base_metrics.metrics import REGISTRY
+
+STATEMENTS_IMPORTED = REGISTRY.counter(
+    'safaricom_statements_imported_total',
+    "Safaricom statements imported from their PDF.",
+)
+STATEMENTS_POSTED = REGISTRY.counter(
+    'safaricom_statements_posted_total',
+    "Safaricom statements posted as customer invoices.",
+)
+STATEMENT_LINES_PARSED = REGISTRY.counter(
+    'safaricom_statement_lines_parsed_total',
+    "Lines parsed from the Safaricom statements, per kind.",
+    ['kind'],
+)
+STATEMENT_PHASE_SECONDS = REGISTRY.histogram(
+    'safaricom_statement_phase_seconds',
+    "Duration of the Safaricom statement import phases.",
+    ['phase'],
+)
@@ -5,6 +5,8 @@ import io
 import re
 from datetime import datetime
 
+from ..metrics import STATEMENTS_IMPORTED, STATEMENTS_POSTED, STATEMENT_LINES_PARSED, STATEMENT_PHASE_SECONDS
+
 # Try importing pypdf, handle if not present
 try:
     from pypdf import PdfReader
@@ -65,11 +67,17 @@ class SafaricomStatement(models.Model):
             raise UserError(_("pypdf library is missing. Please install it (pip install pypdf)."))
 
         # Basic structure to hold extracted data
-        extracted_text = self._extract_text_from_pdf()
+        with STATEMENT_PHASE_SECONDS.time(phase='extract'):
+            extracted_text = self._extract_text_from_pdf()
         self.text_content = extracted_text
-        self._parse_extracted_text(extracted_text)
+        with STATEMENT_PHASE_SECONDS.time(phase='parse'):
+            self._parse_extracted_text(extracted_text)
         
         self.state = 'imported'
+        STATEMENTS_IMPORTED.inc_on_commit(self.env.cr)
+        STATEMENT_LINES_PARSED.inc_on_commit(self.env.cr, len(self.invoice_line_ids), kind='invoice')
+        STATEMENT_LINES_PARSED.inc_on_commit(self.env.cr, len(self.payment_ids), kind='payment')
+        STATEMENT_LINES_PARSED.inc_on_commit(self.env.cr, len(self.adjustment_ids), kind='adjustment')
 
     def _extract_text_from_pdf(self):
         """Extracts text content from the uploaded PDF."""
@@ -345,6 +353,7 @@ class SafaricomStatement(models.Model):
             return 0.0
         return float(amount_str.replace(',', ''))
 
+    @STATEMENT_PHASE_SECONDS.time(phase='post')
     def action_post_statement(self):
         """
         Finalize import and create Odoo Invoices for each Partner.
@@ -416,6 +425,7 @@ class SafaricomStatement(models.Model):
                 line.odoo_invoice_id = move.id
         
         self.state = 'posted'
+        STATEMENTS_POSTED.inc_on_commit(self.env.cr)
 
     def _get_safaricom_taxes(self):
         """
@@ -1,7 +1,7 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 {
     'name': 'Sale Commission Partner',
-    'version': '1.3',
+    'version': '1.8',
     'category': 'Sales/Commission',
     'sequence': 105,
     'summary': "Manage commissions for external partners (Agents)",
@@ -11,10 +11,11 @@
     - Select Agents on Sale Order Lines.
     - Generate Vendor Bills for accrued commissions.
     """,
-    'depends': ['sale_commission', 'sale_commission_margin_paid', 'sale_margin', 'account'],
+    'depends': ['sale_commission', 'sale_commission_margin_paid', 'sale_margin', 'account', 'base_metrics'],
     'data': [
         'data/product_data.xml',
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'wizard/sale_commission_add_multiple_partner_views.xml',
         'wizard/sale_commission_refresh_views.xml',
         'views/sale_commission_partner_views.xml',
@@ -24,8 +25,14 @@
         'views/res_partner_views.xml',
         'views/sale_order_views.xml',
         'views/account_move_views.xml',
+        'views/sale_commission_partner_event_views.xml',
+        'views/sale_commission_refresh_job_views.xml',
+        'views/sale_commission_partner_ledger_views.xml',
+        'views/sale_commission_bill_job_views.xml',
         'report/sale_commission_partner_report.xml',
+        'data/sale_commission_partner_summary_data.xml',
         'wizard/sale_commission_make_bill_views.xml',
+        'wizard/sale_commission_partner_export_views.xml',
     ],
     'installable': True,
     'post_init_hook': 'post_init_hook',
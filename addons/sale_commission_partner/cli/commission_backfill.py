@@ -0,0 +1,88 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from odoo import api, SUPERUSER_ID, sql_db
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+def _backfill_shard(dbname, shard, options):
+    """Worker entry point: backfill one ``(company_id, id_from, id_to)`` shard."""
+    company_id, id_from, id_to = shard
+    with Registry(dbname).cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        return env['account.move']._backfill_partner_commission_shard(
+            company_id, id_from, id_to,
+            force=options['force'],
+            chunk_size=options['chunk_size'],
+            commit=True,
+            run=options['run'],
+        )
+
+
+class CommissionBackfill(Command):
+    """Backfill partner commission locks on posted invoices, in parallel and resumable chunks."""
+    name = 'commission_backfill'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+        )
+        parser.add_argument('-c', '--config', help="Odoo configuration file")
+        parser.add_argument('-d', '--database', help="Database to backfill")
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker processes (default: 4)")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Invoices per committed chunk (default: 5000)")
+        parser.add_argument('--block-size', type=int, default=50000, help="Invoice id range per shard (default: 50000)")
+        parser.add_argument('--run', default='default', help="Checkpoint name; reuse it to resume a run")
+        parser.add_argument('--reset', action='store_true', help="Forget the checkpoints of this run and start over")
+        parser.add_argument('--force', action='store_true', help="Unlock and recompute already locked lines")
+        opts = parser.parse_args(cmdargs)
+
+        config_args = []
+        if opts.config:
+            config_args += ['-c', opts.config]
+        if opts.database:
+            config_args += ['-d', opts.database]
+        config.parse_config(config_args, setup_logging=True)
+        dbname = config['db_name']
+        if isinstance(dbname, list):
+            dbname = dbname[0] if dbname else None
+        if not dbname:
+            sys.exit("No database given; use -d/--database.")
+
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            if opts.reset:
+                env['sale.commission.backfill.checkpoint'].search([('run', '=', opts.run)]).unlink()
+            shards = env['account.move']._get_partner_commission_backfill_shards(block_size=opts.block_size)
+        total = sum(count for *_shard, count in shards)
+        _logger.info("Commission backfill %r: %s invoices in %s shards, %s workers", opts.run, total, len(shards), opts.workers)
+
+        # Workers are forked: they must not inherit open database connections.
+        sql_db.close_all()
+        options = {'force': opts.force, 'chunk_size': opts.chunk_size, 'run': opts.run}
+        started = time.monotonic()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=opts.workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = {
+                pool.submit(_backfill_shard, dbname, (company_id, id_from, id_to), options): (company_id, id_from)
+                for company_id, id_from, id_to, _count in shards
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                processed += future.result()
+                elapsed = max(time.monotonic() - started, 1e-6)
+                _logger.info(
+                    "Commission backfill %r: %s/%s shards, %s invoices, %.1f invoices/s",
+                    opts.run, done, len(shards), processed, processed / elapsed,
+                )
@@ -0,0 +1,485 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import argparse
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from odoo import api, fields, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+class CommissionDataGenerator:
+    """Generate partner commission data at production scale.
+
+    Reference data (companies, nested product categories, products, plans with
+    product and category rules, agents and their assignments) is created once
+    through the ORM. Invoices are then inserted with bulk SQL, cloned from one
+    posted template invoice per company: every column of the template rows is
+    copied and only the generated values are overridden, so the columns added
+    by other installed modules keep consistent values.
+
+    Generated invoices are balanced (agent product lines and one receivable
+    line), posted, and a share of them flagged paid. They are not linked to
+    sales orders and no payments are created.
+    """
+    NAME = 'Loadgen'
+
+    def __init__(self, env, companies=2, agents=2000, products=1000, plans=10,
+                 category_depth=3, category_fanout=5, lines_per_invoice=5, days=365, paid_ratio=0.7):
+        self.env = env
+        self.company_count = companies
+        self.agent_count = agents
+        self.product_count = products
+        self.plan_count = plans
+        self.category_depth = category_depth
+        self.category_fanout = category_fanout
+        self.lines_per_invoice = lines_per_invoice
+        self.days = days
+        self.paid_ratio = paid_ratio
+        self.date_from = fields.Date.context_today(env['res.partner']) - timedelta(days=days)
+
+    # ------------------------------------------------------------
+    # Reference data
+    # ------------------------------------------------------------
+
+    def setup(self):
+        """Create the reference data missing for the configured sizes; return it per company."""
+        companies = self._ensure_companies()
+        categories = self._ensure_categories()
+        products = self._ensure_products(categories, companies)
+        customer = self._ensure_records('res.partner', [{'name': f'{self.NAME} Customer'}])
+        per_company = {}
+        for index, company in enumerate(companies):
+            env = self.env(context={'allowed_company_ids': company.ids})
+            plans = self._ensure_plans(env, company, categories, products)
+            agents = self._ensure_agents(env, company, plans, index)
+            per_company[company] = {
+                'agents': agents,
+                'template': self._ensure_template(env, company, customer, products[:1], agents[:1]),
+            }
+        self.env.cr.commit()
+        self.products = products
+        return per_company
+
+    def _ensure_records(self, model, vals_list, batch_size=1000):
+        """Return the records named as in ``vals_list``, creating the missing ones in batches."""
+        Model = self.env[model].with_context(active_test=False, tracking_disable=True)
+        names = [vals['name'] for vals in vals_list]
+        existing = {record.name: record for record in Model.search([('name', 'in', names)])}
+        missing = [vals for vals in vals_list if vals['name'] not in existing]
+        for start in range(0, len(missing), batch_size):
+            for record in Model.create(missing[start:start + batch_size]):
+                existing[record.name] = record
+        return Model.browse([existing[name].id for name in names])
+
+    def _ensure_companies(self):
+        companies = self.env.company
+        names = [f'{self.NAME} Company {index}' for index in range(1, self.company_count)]
+        for name in names:
+            company = self.env['res.company'].search([('name', '=', name)], limit=1)
+            if not company:
+                company = self.env['res.company'].create({'name': name, 'currency_id': self.env.company.currency_id.id})
+                self.env['account.chart.template'].try_loading('generic_coa', company, install_demo=False)
+            companies |= company
+        self.env.user.company_ids |= companies
+        return companies
+
+    def _ensure_categories(self):
+        """Return the categories of a ``category_fanout``-ary tree of ``category_depth`` levels, leaves last."""
+        levels = [self._ensure_records('product.category', [{'name': self.NAME}])]
+        for depth in range(1, self.category_depth + 1):
+            parents = levels[-1]
+            levels.append(self._ensure_records('product.category', [{
+                'name': f'{self.NAME} {depth}.{index}',
+                'parent_id': parents[index // self.category_fanout].id,
+            } for index in range(len(parents) * self.category_fanout)]))
+        return self.env['product.category'].concat(*levels)
+
+    def _ensure_products(self, categories, companies):
+        leaves = categories[-(self.category_fanout ** self.category_depth):]
+        products = self._ensure_records('product.product', [{
+            'name': f'{self.NAME} Product {index}',
+            'categ_id': leaves[index % len(leaves)].id,
+            'list_price': 10.0 + index % 500,
+            'type': 'service',
+            'taxes_id': False,
+        } for index in range(self.product_count)])
+        for company in companies:
+            for product in products.with_company(company):
+                if not product.standard_price:
+                    product.standard_price = product.list_price * 0.6
+        return products
+
+    def _ensure_plans(self, env, company, categories, products):
+        plans = env['sale.commission.plan'].with_context(active_test=False).search([
+            ('name', '=like', f'{self.NAME} {company.id}/%'),
+        ])
+        for index in range(len(plans), self.plan_count):
+            rules = [{'type': 'amount_invoiced', 'rate': 0.02 + index % 5 / 100}]
+            rules += [{
+                'type': 'amount_invoiced',
+                'rate': 0.05 + rule / 100,
+                'product_categ_id': categories[(index * 7 + rule * 13) % len(categories)].id,
+            } for rule in range(3)]
+            rules += [{
+                'type': 'margin_invoice_paid' if rule % 2 else 'amount_invoiced',
+                'rate': 0.10 + rule / 100,
+                'product_id': products[(index * 11 + rule * 17) % len(products)].id,
+            } for rule in range(2)]
+            plan = env['sale.commission.plan'].create({
+                'name': f'{self.NAME} {company.id}/{index}',
+                'user_type': 'partner',
+                'company_ids': [fields.Command.set(company.ids)],
+                'achievement_ids': [fields.Command.create(rule) for rule in rules],
+            })
+            plan.action_approve()
+            plans |= plan
+        return plans.sorted('id')
+
+    def _ensure_agents(self, env, company, plans, company_index):
+        agents = self._ensure_records('res.partner', [
+            {'name': f'{self.NAME} Agent {company_index}-{index}'}
+            for index in range(self.agent_count // self.company_count)
+        ])
+        assigned = env['sale.commission.plan.partner'].search([('partner_id', 'in', agents.ids)]).partner_id
+        PlanPartner = env['sale.commission.plan.partner']
+        for plan_index, plan in enumerate(plans):
+            plan_agents = agents.filtered(lambda agent: agent not in assigned and agent.id % len(plans) == plan_index)
+            PlanPartner._bulk_assign(plan, [(agent.id, self.date_from, False) for agent in plan_agents])
+        return agents
+
+    def _ensure_template(self, env, company, customer, product, agent):
+        """Return the posted invoice whose rows are cloned for ``company``."""
+        ref = f'{self.NAME} template {company.id}'
+        template = env['account.move'].search([('ref', '=', ref), ('state', '=', 'posted')], limit=1)
+        if not template:
+            template = env['account.move'].create({
+                'move_type': 'out_invoice',
+                'partner_id': customer.id,
+                'ref': ref,
+                'invoice_date': self.date_from,
+                'invoice_line_ids': [fields.Command.create({
+                    'product_id': product.id,
+                    'agent_id': agent.id,
+                    'quantity': 1,
+                    'price_unit': 100.0,
+                    'tax_ids': False,
+                })],
+            })
+            template.action_post()
+        return template
+
+    # ------------------------------------------------------------
+    # Bulk invoices
+    # ------------------------------------------------------------
+
+    def count_lines(self):
+        self.env.cr.execute("""
+            SELECT COUNT(*)
+              FROM account_move_line
+             WHERE move_name LIKE %s
+               AND display_type = 'product'
+        """, [f'{self.NAME.upper()}%'])
+        return self.env.cr.fetchone()[0]
+
+    def generate(self, per_company, target_lines, batch_size=20000, commit=True):
+        """Insert posted invoices until there are ``target_lines`` generated agent lines."""
+        missing = target_lines - self.count_lines()
+        invoices = max(missing, 0) // self.lines_per_invoice
+        companies = list(per_company)
+        for index, company in enumerate(companies):
+            company_invoices = invoices // len(companies) + (index < invoices % len(companies))
+            done = 0
+            while done < company_invoices:
+                count = min(batch_size, company_invoices - done)
+                self._insert_invoices(company, per_company[company], count)
+                done += count
+                if commit:
+                    self.env.cr.commit()
+                _logger.info("Commission loadgen: %s/%s invoices for %s", done, company_invoices, company.name)
+
+    def _columns(self, table):
+        self.env.cr.execute("""
+            SELECT column_name
+              FROM information_schema.columns
+             WHERE table_name = %s
+             ORDER BY ordinal_position
+        """, [table])
+        return [column for column, in self.env.cr.fetchall()]
+
+    def _clone_sql(self, table, source_alias, overrides, skip=()):
+        """Return the column list and select list copying ``source_alias`` except for ``overrides``."""
+        columns = [column for column in self._columns(table) if column not in skip]
+        select = [overrides.get(column, f'{source_alias}."{column}"') for column in columns]
+        return ', '.join(f'"{column}"' for column in columns), ', '.join(select)
+
+    def _insert_invoices(self, company, data, count):
+        cr = self.env.cr
+        template = data['template']
+        product_line = template.invoice_line_ids[:1]
+        receivable_line = template.line_ids.filtered(lambda line: line.display_type == 'payment_term')[:1]
+        prefix = f'{self.NAME.upper()}{company.id}'
+        cr.execute("""
+            SELECT COALESCE(MAX(sequence_number), 0)
+              FROM account_move
+             WHERE journal_id = %s AND sequence_prefix = %s
+        """, [template.journal_id.id, f'{prefix}/'])
+        first = cr.fetchone()[0] + 1
+        params = {
+            'first': first,
+            'last': first + count - 1,
+            'prefix': prefix,
+            'today': self.date_from + timedelta(days=self.days),
+            'days': self.days,
+            'paid_pct': round(self.paid_ratio * 100),
+            'lines': self.lines_per_invoice,
+            'agent_ids': data['agents'].ids,
+            'product_ids': self.products.ids,
+            'template_move_id': template.id,
+            'product_line_id': product_line.id,
+            'receivable_line_id': receivable_line.id,
+        }
+        cr.execute("""
+            DROP TABLE IF EXISTS loadgen_move;
+            CREATE TEMP TABLE loadgen_move AS
+            SELECT nextval('account_move_id_seq') AS id,
+                   n AS number,
+                   %(prefix)s || '/' || n AS name,
+                   %(today)s::date - (n %% %(days)s) AS date,
+                   (n * 7 %% 100) < %(paid_pct)s AS paid
+              FROM generate_series(%(first)s, %(last)s) n;
+
+            DROP TABLE IF EXISTS loadgen_line;
+            CREATE TEMP TABLE loadgen_line AS
+            SELECT move.id AS move_id,
+                   seq,
+                   (%(agent_ids)s::int[])[1 + (move.number * 7919 + seq * 104729) %% cardinality(%(agent_ids)s::int[])] AS agent_id,
+                   (%(product_ids)s::int[])[1 + (move.number * 31 + seq * 17) %% cardinality(%(product_ids)s::int[])] AS product_id,
+                   (10 + (move.number * 37 + seq * 101) %% 990)::numeric AS amount
+              FROM loadgen_move move
+             CROSS JOIN generate_series(1, %(lines)s) seq;
+
+            DROP TABLE IF EXISTS loadgen_total;
+            CREATE TEMP TABLE loadgen_total AS
+            SELECT move_id, SUM(amount) AS amount FROM loadgen_line GROUP BY move_id;
+        """, params)
+
+        residual = "CASE WHEN move.paid THEN 0 ELSE total.amount END"
+        columns, select = self._clone_sql('account_move', 'tpl', {
+            'id': 'move.id',
+            'name': 'move.name',
+            'ref': 'NULL',
+            'payment_reference': 'move.name',
+            'date': 'move.date',
+            'invoice_date': 'move.date',
+            'invoice_date_due': 'move.date',
+            'sequence_prefix': "%(prefix)s || '/'",
+            'sequence_number': 'move.number',
+            'payment_state': "CASE WHEN move.paid THEN 'paid' ELSE 'not_paid' END",
+            'amount_untaxed': 'total.amount',
+            'amount_total': 'total.amount',
+            'amount_residual': residual,
+            'amount_untaxed_signed': 'total.amount',
+            'amount_untaxed_in_currency_signed': 'total.amount',
+            'amount_total_signed': 'total.amount',
+            'amount_total_in_currency_signed': 'total.amount',
+            'amount_residual_signed': residual,
+            'access_token': 'NULL',
+            'commission_bills_generated': 'FALSE',
+        })
+        cr.execute(f"""
+            INSERT INTO account_move ({columns})
+            SELECT {select}
+              FROM loadgen_move move
+              JOIN loadgen_total total ON total.move_id = move.id
+              JOIN account_move tpl ON tpl.id = %(template_move_id)s
+        """, params)
+
+        columns, select = self._clone_sql('account_move_line', 'tpl', {
+            'move_id': 'line.move_id',
+            'move_name': 'move.name',
+            'date': 'move.date',
+            'invoice_date': 'move.date',
+            'sequence': 'tpl.sequence + line.seq',
+            'name': "'Loadgen ' || line.seq",
+            'product_id': 'line.product_id',
+            'agent_id': 'line.agent_id',
+            'quantity': '1',
+            'price_unit': 'line.amount',
+            'price_subtotal': 'line.amount',
+            'price_total': 'line.amount',
+            'balance': '-line.amount',
+            'debit': '0',
+            'credit': 'line.amount',
+            'amount_currency': '-line.amount',
+            'amount_residual': '0',
+            'amount_residual_currency': '0',
+            'commission_plan_id': 'NULL',
+            'commission_rule_type': 'NULL',
+            'commission_rate': '0',
+            'commission_base': 'NULL',
+            'commission_amount': 'NULL',
+            'commission_locked': 'FALSE',
+        }, skip=('id',))
+        cr.execute(f"""
+            INSERT INTO account_move_line ({columns})
+            SELECT {select}
+              FROM loadgen_line line
+              JOIN loadgen_move move ON move.id = line.move_id
+              JOIN account_move_line tpl ON tpl.id = %(product_line_id)s
+        """, params)
+
+        columns, select = self._clone_sql('account_move_line', 'tpl', {
+            'move_id': 'move.id',
+            'move_name': 'move.name',
+            'date': 'move.date',
+            'invoice_date': 'move.date',
+            'date_maturity': 'move.date',
+            'price_unit': '-total.amount',
+            'balance': 'total.amount',
+            'debit': 'total.amount',
+            'credit': '0',
+            'amount_currency': 'total.amount',
+            'amount_residual': residual,
+            'amount_residual_currency': residual,
+            'reconciled': 'move.paid',
+            'full_reconcile_id': 'NULL',
+            'matching_number': 'NULL',
+        }, skip=('id',))
+        cr.execute(f"""
+            INSERT INTO account_move_line ({columns})
+            SELECT {select}
+              FROM loadgen_move move
+              JOIN loadgen_total total ON total.move_id = move.id
+              JOIN account_move_line tpl ON tpl.id = %(receivable_line_id)s
+        """, params)
+        cr.execute("DROP TABLE loadgen_move, loadgen_line, loadgen_total")
+
+
+class CommissionLoadgen(Command):
+    """Generate commission data at increasing scales and measure the commission pipeline at each step.
+
+    Meant for a disposable database of the docker-compose stack, with the
+    module installed::
+
+        docker compose exec web odoo -d loadgen -i sale_commission_partner --stop-after-init \\
+            --db_host db --db_user odoo --db_password odoo
+        docker compose exec web odoo commission_loadgen -d loadgen --steps 100000,1000000 \\
+            --db_host db --db_user odoo --db_password odoo
+
+    Other Odoo options (``--db_host``, ``--db_port``, ...) are passed through.
+    """
+    name = 'commission_loadgen'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__.split('\n', 1)[0],
+        )
+        parser.add_argument('-c', '--config', help="Odoo configuration file")
+        parser.add_argument('-d', '--database', help="Database to fill; it is modified")
+        parser.add_argument('--steps', default='100000,1000000', help="Comma-separated invoice line counts to reach and measure (default: 100000,1000000)")
+        parser.add_argument('--companies', type=int, default=2, help="Number of companies (default: 2)")
+        parser.add_argument('--agents', type=int, default=2000, help="Number of agents, spread over the companies (default: 2000)")
+        parser.add_argument('--products', type=int, default=1000, help="Number of products (default: 1000)")
+        parser.add_argument('--plans', type=int, default=10, help="Commission plans per company (default: 10)")
+        parser.add_argument('--category-depth', type=int, default=3, help="Levels of nested product categories (default: 3)")
+        parser.add_argument('--category-fanout', type=int, default=5, help="Subcategories per category (default: 5)")
+        parser.add_argument('--lines-per-invoice', type=int, default=5, help="Agent lines per invoice (default: 5)")
+        parser.add_argument('--days', type=int, default=365, help="Days of history (default: 365)")
+        parser.add_argument('--paid-ratio', type=float, default=0.7, help="Share of paid invoices (default: 0.7)")
+        parser.add_argument('--batch-size', type=int, default=20000, help="Invoices inserted per committed batch (default: 20000)")
+        parser.add_argument('--no-bench', action='store_true', help="Only generate the data")
+        parser.add_argument('--output', help="Append the measurements of each step to this JSON lines file")
+        opts, odoo_args = parser.parse_known_args(cmdargs)
+
+        config_args = list(odoo_args)
+        if opts.config:
+            config_args += ['-c', opts.config]
+        if opts.database:
+            config_args += ['-d', opts.database]
+        config.parse_config(config_args, setup_logging=True)
+        dbname = config['db_name']
+        if isinstance(dbname, list):
+            dbname = dbname[0] if dbname else None
+        if not dbname:
+            sys.exit("No database given; use -d/--database.")
+        steps = sorted(int(step) for step in opts.steps.split(','))
+
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            generator = CommissionDataGenerator(
+                env,
+                companies=opts.companies,
+                agents=opts.agents,
+                products=opts.products,
+                plans=opts.plans,
+                category_depth=opts.category_depth,
+                category_fanout=opts.category_fanout,
+                lines_per_invoice=opts.lines_per_invoice,
+                days=opts.days,
+                paid_ratio=opts.paid_ratio,
+            )
+            per_company = generator.setup()
+            for step in steps:
+                started = time.perf_counter()
+                generator.generate(per_company, step, batch_size=opts.batch_size)
+                results = {'lines': generator.count_lines(), 'generate': round(time.perf_counter() - started, 3)}
+                if not opts.no_bench:
+                    results.update(self._measure(env, generator))
+                _logger.info("Commission loadgen step %s: %s", step, results)
+                if opts.output:
+                    with open(opts.output, 'a', encoding='utf-8') as output:
+                        output.write(json.dumps({'step': step, **results}) + '\n')
+
+    @contextmanager
+    def _timed(self, results, key):
+        started = time.perf_counter()
+        yield
+        results[key] = round(time.perf_counter() - started, 3)
+
+    def _measure(self, env, generator):
+        """Time the backfill, the report and the bill generation on the current data."""
+        cr = env.cr
+        results = {}
+        with self._timed(results, 'backfill'):
+            env['account.move']._backfill_partner_commission_locks()
+        with self._timed(results, 'report_rebuild'):
+            results['report_rows'] = env['sale.commission.partner.summary']._rebuild()
+        with self._timed(results, 'ledger_sync'):
+            env['sale.commission.partner.ledger']._sync_all()
+        cr.commit()
+        env.invalidate_all()
+
+        Report = env['sale.commission.partner.report']
+        with self._timed(results, 'report_first_page'):
+            Report.search_read([], ['date', 'partner_id', 'plan_id', 'source_id', 'payment_state', 'achieved', 'commission'], limit=80)
+        with self._timed(results, 'report_by_agent'):
+            Report._read_group([], ['partner_id'], ['commission:sum'])
+        with self._timed(results, 'report_last_month'):
+            Report._read_group([('date', '>=', generator.date_from + timedelta(days=generator.days - 30))], ['partner_id'], ['commission:sum'])
+
+        # bills are rolled back, so every step bills the whole history
+        cr.execute("SAVEPOINT commission_loadgen_bills")
+        try:
+            with self._timed(results, 'bills'):
+                action = env['sale.commission.make.bill'].create({
+                    'date_from': generator.date_from,
+                    'date_to': generator.date_from + timedelta(days=generator.days),
+                    'product_id': env.ref('sale_commission_partner.product_commission_default').id,
+                }).action_generate_bills()
+                env.flush_all()
+            results['bills_created'] = len(action['domain'][0][2])
+        finally:
+            cr.execute("ROLLBACK TO SAVEPOINT commission_loadgen_bills")
+            env.invalidate_all()
+        return results
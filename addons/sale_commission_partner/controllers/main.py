@@ -0,0 +1,32 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import tempfile
+
+from werkzeug.wsgi import wrap_file
+
+from odoo import http
+from odoo.http import content_disposition, request, Response
+
+
+class SaleCommissionPartnerExport(http.Controller):
+
+    @http.route('/sale_commission_partner/export/<int:wizard_id>', type='http', auth='user')
+    def export_partner_commissions(self, wizard_id):
+        wizard = request.env['sale.commission.partner.export'].browse(wizard_id).exists()
+        if not wizard:
+            raise request.not_found()
+        # the file is spooled to disk while the report is read, then streamed
+        # from there; it is deleted when the response closes it
+        fileobj = tempfile.TemporaryFile()
+        filename, mimetype = wizard._write_export(fileobj)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        return Response(
+            wrap_file(request.httprequest.environ, fileobj),
+            headers=[
+                ('Content-Type', mimetype),
+                ('Content-Length', size),
+                ('Content-Disposition', content_disposition(filename)),
+            ],
+            direct_passthrough=True,
+        )
@@ -9,3 +9,5 @@ def post_init_hook(env):
         if not plan.company_ids:
             plan.company_ids = [Command.set(plan.company_id.ids)]
     env['sale.commission.plan.partner']._cleanup_orphan_records()
+    env['sale.commission.partner.summary']._rebuild()
+    env['sale.commission.partner.ledger']._sync_all()
@@ -0,0 +1,24 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+"""Throughput metrics of the partner commissions, exposed by ``base_metrics`` on ``/metrics``."""
+
+from odoo.addons.base_metrics.metrics import REGISTRY
+
+COMMISSION_LOCKS = REGISTRY.counter(
+    'sale_commission_partner_locks_total',
+    "Invoice lines whose partner commission was locked.",
+    ['mode'],
+)
+COMMISSION_BILLS = REGISTRY.counter(
+    'sale_commission_partner_bills_total',
+    "Vendor bills generated for partner commissions.",
+)
+COMMISSION_EVENTS_QUEUED = REGISTRY.counter(
+    'sale_commission_partner_events_queued_total',
+    "Invoice events queued for the partner commission worker.",
+    ['event_type'],
+)
+REPORT_QUERY_SECONDS = REGISTRY.histogram(
+    'sale_commission_partner_report_query_seconds',
+    "Duration of the partner commission report queries.",
+    ['query'],
+)
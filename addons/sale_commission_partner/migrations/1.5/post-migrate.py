@@ -0,0 +1,17 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+
+def migrate(cr, version):
+    from odoo import api, SUPERUSER_ID
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['sale.commission.partner.ledger']._sync_all()
+    # invoices billed by the paid-invoice automation must not be billed again
+    cr.execute("""
+        UPDATE sale_commission_partner_ledger ledger
+           SET billed = TRUE,
+               billed_before_ledger = TRUE
+          FROM account_move move
+         WHERE move.id = ledger.move_id
+           AND move.commission_bills_generated IS TRUE
+    """)
@@ -0,0 +1,20 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+
+def migrate(cr, version):
+    # fill the effective companies of existing plans, with the company_id fallback
+    cr.execute("""
+        INSERT INTO sale_commission_plan_effective_company_rel (plan_id, company_id)
+        SELECT rel.plan_id, rel.company_id
+          FROM sale_commission_plan_company_rel rel
+         UNION
+        SELECT plan.id, plan.company_id
+          FROM sale_commission_plan plan
+         WHERE plan.company_id IS NOT NULL
+           AND NOT EXISTS (
+               SELECT 1
+                 FROM sale_commission_plan_company_rel rel
+                WHERE rel.plan_id = plan.id
+           )
+        ON CONFLICT DO NOTHING
+    """)
@@ -0,0 +1,22 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+
+def migrate(cr, version):
+    from odoo import api, SUPERUSER_ID
+
+    # commission updates queued before the upgrade run as the user who requested them
+    cr.execute("""
+        UPDATE sale_commission_refresh_job
+           SET user_id = create_uid
+         WHERE create_uid IS NOT NULL
+    """)
+
+    # agents whose overlapping assignments were shortened by the pre-migration
+    cr.execute("SELECT to_regclass('pg_temp.sale_commission_partner_migrated_agents')")
+    if cr.fetchone()[0]:
+        cr.execute("SELECT partner_id FROM sale_commission_partner_migrated_agents")
+        partner_ids = [partner_id for partner_id, in cr.fetchall()]
+        cr.execute("DROP TABLE sale_commission_partner_migrated_agents")
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        env['sale.commission.partner.ledger']._sync(partner_ids=partner_ids)
+        env['sale.commission.partner.summary']._refresh(partner_ids=partner_ids)
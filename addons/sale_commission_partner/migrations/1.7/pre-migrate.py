@@ -0,0 +1,58 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    # The exclusion constraint on agent periods cannot be created while
+    # overlapping assignments exist: end each overlapping assignment the day
+    # before the next one of the same agent starts.
+    cr.execute("""
+        WITH ordered AS (
+            SELECT id, date_from, date_to,
+                   LEAD(date_from) OVER (PARTITION BY partner_id ORDER BY date_from, id) AS next_date_from
+              FROM sale_commission_plan_partner
+        )
+        UPDATE sale_commission_plan_partner plan_partner
+           SET date_to = ordered.next_date_from - 1
+          FROM ordered
+         WHERE plan_partner.id = ordered.id
+           AND ordered.next_date_from > ordered.date_from
+           AND (ordered.date_to IS NULL OR ordered.date_to >= ordered.next_date_from)
+     RETURNING plan_partner.id, plan_partner.partner_id, ordered.date_to, plan_partner.date_to
+    """)
+    truncated = cr.fetchall()
+    for assignment_id, partner_id, old_date_to, new_date_to in truncated:
+        _logger.warning(
+            "Agent %s: commission plan assignment %s overlapped the next one, it now ends on %s instead of %s",
+            partner_id, assignment_id, new_date_to, old_date_to or "no end date",
+        )
+    if truncated:
+        # the post-migration refreshes the commissions of these agents
+        cr.execute("CREATE TEMP TABLE sale_commission_partner_migrated_agents (partner_id integer)")
+        cr.execute(
+            "INSERT INTO sale_commission_partner_migrated_agents SELECT DISTINCT unnest(%s::int[])",
+            [[partner_id for _id, partner_id, _old, _new in truncated]],
+        )
+
+    # assignments starting on the same day cannot be told apart: report them
+    cr.execute("""
+        SELECT partner_id, array_agg(id ORDER BY id)
+          FROM sale_commission_plan_partner
+         GROUP BY partner_id, date_from
+        HAVING COUNT(*) > 1
+    """)
+    for partner_id, assignment_ids in cr.fetchall():
+        _logger.error(
+            "Agent %s: commission plan assignments %s start on the same day, "
+            "remove all but one to enable the period constraint",
+            partner_id, assignment_ids,
+        )
+    cr.execute("SELECT id FROM sale_commission_plan_partner WHERE date_to < date_from")
+    if invalid_ids := [assignment_id for assignment_id, in cr.fetchall()]:
+        _logger.error(
+            "Commission plan assignments %s end before they start, fix their dates to enable the date check",
+            invalid_ids,
+        )
@@ -0,0 +1,33 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    # bill runs queued before the upgrade run as the user who requested them
+    cr.execute("""
+        UPDATE sale_commission_bill_job
+           SET user_id = create_uid
+         WHERE create_uid IS NOT NULL
+    """)
+
+    # Entries flagged billed without a bill line were either billed before the
+    # ledger existed, or billed on a bill deleted since then, which used to
+    # leave them billed. They cannot be told apart: keep them billed, under
+    # their own flag, and report them for review.
+    cr.execute("""
+        UPDATE sale_commission_partner_ledger
+           SET billed_before_ledger = TRUE
+         WHERE billed IS TRUE
+           AND bill_line_id IS NULL
+           AND billed_before_ledger IS NOT TRUE
+     RETURNING id
+    """)
+    if entry_ids := [entry_id for entry_id, in cr.fetchall()]:
+        _logger.warning(
+            "%s commission ledger entries are billed without a bill line, e.g. entries %s: "
+            "they were billed before the ledger existed or on a bill deleted since then",
+            len(entry_ids), entry_ids[:20],
+        )
@@ -2,6 +2,15 @@ from . import res_partner
 from . import partner_commission_mixin
 from . import sale_commission_plan
 from . import sale_commission_plan_partner
+from . import product
 from . import sale_order
 from . import account_move
 from . import sale_commission_achievement
+from . import sale_commission_plan_achievement
+from . import sale_commission_partner_event
+from . import sale_commission_backfill_checkpoint
+from . import sale_commission_job_mixin
+from . import sale_commission_refresh_job
+from . import sale_commission_partner_maintenance
+from . import sale_commission_partner_ledger
+from . import sale_commission_bill_job
@@ -1,8 +1,18 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields, api, _
+import logging
+import time
 from collections import defaultdict
 
+from odoo import models, fields, api, _
+from odoo.tools.sql import create_index
+from ..metrics import COMMISSION_LOCKS
+from ..profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+PAID_QUEUE_KEY = 'sale_commission_partner.paid_moves'
+
 
 class AccountMoveLine(models.Model):
     _inherit = ['account.move.line', 'sale.commission.partner.mixin']
@@ -47,27 +57,49 @@ class AccountMoveLine(models.Model):
         readonly=True,
     )
 
+    def init(self):
+        super().init()
+        # agent lines are a small share of all journal items: the report and
+        # the lock queries only ever read them
+        create_index(
+            self.env.cr,
+            'account_move_line_partner_commission_agent_idx',
+            self._table,
+            ['agent_id', 'move_id'],
+            where="agent_id IS NOT NULL AND display_type = 'product'",
+        )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in self._get_partner_commission_summary_fields()):
+            self.move_id._queue_partner_commission_summary_refresh()
+        return res
+
+    @api.model
+    def _get_partner_commission_summary_fields(self):
+        """Line fields read by the partner commission summary."""
+        return (
+            'agent_id', 'commission_plan_id', 'commission_rule_type', 'commission_rate',
+            'commission_base', 'commission_amount', 'commission_locked',
+        )
+
     def _get_partner_commission_purchase_price(self):
         self.ensure_one()
         sol = self.sale_line_ids[:1]
         return sol.purchase_price if sol else 0.0
 
-    def _get_partner_commission_snapshot_values(self):
-        self.ensure_one()
-        if not self.agent_id or self.display_type != 'product' or not self.product_id:
-            return False
-        reference_date = self.move_id.date or fields.Date.context_today(self)
-        product = self.product_id
-        return self._get_partner_commission_snapshot(
-            self.agent_id,
-            product,
-            reference_date,
-            price_subtotal=self.price_subtotal,
-            quantity=self.quantity,
-            purchase_price=self._get_partner_commission_purchase_price(),
-            standard_price=product.standard_price,
-            company=self.company_id,
-        )
+    def _get_partner_commission_snapshots_values(self):
+        """Return the commission snapshot of each line, resolved for all lines at once."""
+        return self._get_partner_commission_snapshots([{
+            'agent': line.agent_id,
+            'product': line.product_id,
+            'reference_date': line.move_id.date or fields.Date.context_today(line),
+            'price_subtotal': line.price_subtotal,
+            'quantity': line.quantity,
+            'purchase_price': line._get_partner_commission_purchase_price(),
+            'standard_price': line.product_id.with_company(line.company_id).standard_price,
+            'company': line.company_id,
+        } for line in self])
 
     def _apply_partner_commission_sign(self, values):
         if self.move_id.move_type != 'out_refund':
@@ -77,16 +109,36 @@ class AccountMoveLine(models.Model):
         signed['commission_amount'] = -signed['commission_amount']
         return signed
 
-    def _lock_partner_commission(self):
-        for line in self:
-            if line.commission_locked or not line.agent_id or line.display_type != 'product':
-                continue
-            values = line._get_partner_commission_snapshot_values()
+    @api.ondelete(at_uninstall=False)
+    def _unlink_release_partner_commission_ledger(self):
+        self.env['sale.commission.partner.ledger']._release_bill_lines(self)
+
+    @profiled('lock_line')
+    def _lock_partner_commission(self, margin_invoice_paid=None):
+        """Lock the commission snapshot of the unlocked agent lines.
+
+        Snapshots are resolved for all lines at once, and lines with the same
+        values are written together. With ``margin_invoice_paid`` set, only the
+        lines whose rule is (``True``) or is not (``False``) of that type are
+        locked.
+        """
+        lines = self.filtered(
+            lambda line: line.agent_id and not line.commission_locked and line.display_type == 'product'
+        )
+        line_ids_by_values = defaultdict(list)
+        for line, values in zip(lines, lines._get_partner_commission_snapshots_values()):
             if not values:
                 continue
+            if margin_invoice_paid is not None and (values['commission_rule_type'] == 'margin_invoice_paid') != margin_invoice_paid:
+                continue
             values = line._apply_partner_commission_sign(values)
             values['commission_locked'] = True
-            line.write(values)
+            line_ids_by_values[tuple(sorted(values.items()))].append(line.id)
+        for values, line_ids in line_ids_by_values.items():
+            self.browse(line_ids).write(dict(values))
+        locked = sum(len(line_ids) for line_ids in line_ids_by_values.values())
+        if locked:
+            COMMISSION_LOCKS.inc_on_commit(self.env.cr, locked, mode='line')
 
 
 class AccountMove(models.Model):
@@ -100,15 +152,16 @@ class AccountMove(models.Model):
 
     @api.depends('amount_residual', 'move_type', 'state', 'company_id', 'reconciled_payment_ids.state')
     def _compute_payment_state(self):
-        commission_moves = self.filtered(lambda m: m.move_type in ('out_invoice', 'out_refund'))
-        old_states = {move.id: move.payment_state for move in commission_moves}
+        old_states = self._get_commission_payment_states()
         super()._compute_payment_state()
-        newly_paid = commission_moves.filtered(
-            lambda m: m.state == 'posted'
-            and old_states.get(m.id) != 'paid'
-            and m.payment_state == 'paid'
+        self._handle_commission_payment_transitions(old_states)
+
+    def button_cancel(self):
+        res = super().button_cancel()
+        self.env['sale.commission.partner.ledger']._release_bill_lines(
+            self.filtered(lambda move: move.state == 'cancel').invoice_line_ids
         )
-        newly_paid._action_partner_commission_on_paid()
+        return res
 
     def _post(self, soft=True):
         res = super()._post(soft=soft)
@@ -117,112 +170,311 @@ class AccountMove(models.Model):
         )._lock_partner_commissions_on_post()
         return res
 
+    @profiled('lock_on_post')
     def _lock_partner_commissions_on_post(self):
-        for move in self:
-            lines_to_lock = move.invoice_line_ids.filtered(
-                lambda line: line.agent_id
-                and not line.commission_locked
-                and line.display_type == 'product'
-            )
-            lines_to_lock.filtered(
-                lambda line: (line._get_partner_commission_snapshot_values() or {}).get('commission_rule_type') != 'margin_invoice_paid'
-            )._lock_partner_commission()
+        self.invoice_line_ids._lock_partner_commission(margin_invoice_paid=False)
 
+    @profiled('lock_on_payment')
     def _lock_partner_commissions_on_payment(self):
-        for move in self.filtered(lambda m: m.payment_state == 'paid'):
-            lines_to_lock = move.invoice_line_ids.filtered(
-                lambda line: line.agent_id
-                and not line.commission_locked
-                and line.display_type == 'product'
-            )
-            lines_to_lock.filtered(
-                lambda line: (line._get_partner_commission_snapshot_values() or {}).get('commission_rule_type') == 'margin_invoice_paid'
-            )._lock_partner_commission()
+        self.filtered(lambda m: m.payment_state == 'paid').invoice_line_ids._lock_partner_commission(margin_invoice_paid=True)
 
     def _action_partner_commission_on_paid(self):
-        for move in self:
-            move._lock_partner_commissions_on_payment()
-            move._generate_commission_bills()
+        mode = self._get_partner_commission_paid_mode()
+        if mode == 'queue':
+            self.env['sale.commission.partner.event']._enqueue(self, 'paid')
+        elif mode == 'commit':
+            self._queue_partner_commission_on_paid()
+        else:
+            self._process_partner_commission_on_paid()
+
+    def _process_partner_commission_on_paid(self):
+        self._lock_partner_commissions_on_payment()
+        self._generate_commission_bills()
+
+    @api.model
+    def _get_partner_commission_paid_mode(self):
+        """Return when commissions of newly paid invoices are locked and billed.
+
+        - ``queue`` (default): queued as events, processed after commit by a cron;
+        - ``commit``: collected for the whole transaction and processed right before commit;
+        - ``immediate``: processed within the payment itself.
+
+        Set with the ``partner_commission_paid_mode`` context key or the
+        ``sale_commission_partner.paid_mode`` system parameter.
+        """
+        mode = self.env.context.get('partner_commission_paid_mode') or self.env['ir.config_parameter'].sudo().get_param(
+            'sale_commission_partner.paid_mode', 'queue'
+        )
+        return mode if mode in ('queue', 'commit', 'immediate') else 'queue'
+
+    def _queue_partner_commission_on_paid(self):
+        precommit = self.env.cr.precommit
+        move_ids = precommit.data.get(PAID_QUEUE_KEY)
+        if move_ids is None:
+            move_ids = precommit.data[PAID_QUEUE_KEY] = set()
+            precommit.add(self._process_partner_commission_paid_queue)
+        move_ids.update(self.ids)
+
+    @api.model
+    def _process_partner_commission_paid_queue(self):
+        self.env.flush_all()
+        move_ids = self.env.cr.precommit.data.pop(PAID_QUEUE_KEY, set())
+        self.browse(sorted(move_ids)).exists().filtered(
+            lambda m: m.state == 'posted' and m.payment_state == 'paid'
+        )._process_partner_commission_on_paid()
+        self.env.flush_all()
 
     @api.model
     def _backfill_partner_commission_locks(self, force=False):
-        """Snapshot commissions on already posted/paid invoices missing a lock."""
-        moves = self.search([
-            ('move_type', 'in', ('out_invoice', 'out_refund')),
-            ('state', '=', 'posted'),
-        ])
+        """Snapshot commissions on already posted/paid invoices missing a lock.
+
+        Runs in the current transaction, shard by shard and chunk by chunk to
+        bound memory. Large databases should use the ``commission_backfill``
+        command instead, which commits per chunk and can resume.
+        """
+        for company_id, id_from, id_to, _count in self._get_partner_commission_backfill_shards():
+            self._backfill_partner_commission_shard(company_id, id_from, id_to, force=force)
+
+    @api.model
+    def _get_partner_commission_backfill_shards(self, block_size=50000):
+        """Split posted customer invoices in ``(company_id, id_from, id_to, count)`` blocks of ids."""
+        self.env.cr.execute("""
+            SELECT company_id, (id / %(block_size)s) * %(block_size)s AS id_from, COUNT(*)
+              FROM account_move
+             WHERE move_type IN ('out_invoice', 'out_refund')
+               AND state = 'posted'
+             GROUP BY 1, 2
+             ORDER BY 1, 2
+        """, {'block_size': block_size})
+        return [
+            (company_id, id_from, id_from + block_size, count)
+            for company_id, id_from, count in self.env.cr.fetchall()
+        ]
+
+    @api.model
+    def _backfill_partner_commission_shard(self, company_id, id_from, id_to, force=False, chunk_size=5000, commit=False, run='default'):
+        """Backfill the invoices of ``company_id`` with ``id_from <= id < id_to``.
+
+        With ``commit``, each chunk is committed and recorded in a checkpoint, so
+        an interrupted run resumes after the last committed chunk.
+        """
+        checkpoint = self.env['sale.commission.backfill.checkpoint']
+        last_id = id_from - 1
+        if commit:
+            checkpoint = checkpoint._get_checkpoint(run, company_id, id_from, id_to)
+            if checkpoint.done:
+                return 0
+            last_id = max(last_id, checkpoint.last_move_id)
+        processed = 0
+        started = time.monotonic()
+        while True:
+            moves = self.search([
+                ('company_id', '=', company_id),
+                ('move_type', 'in', ('out_invoice', 'out_refund')),
+                ('state', '=', 'posted'),
+                ('id', '>', last_id),
+                ('id', '<', id_to),
+            ], order='id', limit=chunk_size)
+            if not moves:
+                break
+            moves._backfill_partner_commission_chunk(force=force)
+            last_id = moves[-1].id
+            processed += len(moves)
+            if commit:
+                checkpoint.write({
+                    'last_move_id': last_id,
+                    'moves_processed': checkpoint.moves_processed + len(moves),
+                })
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            _logger.info(
+                "Commission backfill company %s ids [%s, %s): %s moves, %.1f moves/s",
+                company_id, id_from, id_to, processed, processed / max(time.monotonic() - started, 1e-6),
+            )
+        if commit:
+            checkpoint.done = True
+            self.env.cr.commit()
+        return processed
+
+    def _backfill_partner_commission_chunk(self, force=False):
+        self._lock_partner_commissions_sql(force=force)
+
+    @profiled('lock_sql')
+    def _lock_partner_commissions_sql(self, force=False):
+        """Lock the due commissions of these invoices with one ``UPDATE ... FROM``.
+
+        Set-based equivalent of ``_lock_partner_commissions_on_post`` and
+        ``_lock_partner_commissions_on_payment``, computed by the report's SQL
+        (see ``sale.commission.partner.report._query_invoice_snapshots``). With
+        ``force``, existing snapshots are cleared and recomputed first.
+
+        :return: number of locked invoice lines
+        """
+        if not self:
+            return 0
+        self.env.flush_all()
+        cr = self.env.cr
+        params = {'move_ids': self.ids, 'uid': self.env.uid}
         if force:
-            lines = moves.invoice_line_ids.filtered(lambda line: line.agent_id and line.display_type == 'product')
-            lines.write({
-                'commission_locked': False,
-                'commission_plan_id': False,
-                'commission_rule_type': False,
-                'commission_rate': 0.0,
-                'commission_base': 0.0,
-                'commission_amount': 0.0,
-            })
-        moves._lock_partner_commissions_on_post()
-        moves.filtered(lambda m: m.payment_state == 'paid')._lock_partner_commissions_on_payment()
+            cr.execute("""
+                UPDATE account_move_line
+                   SET commission_locked = FALSE,
+                       commission_plan_id = NULL,
+                       commission_rule_type = NULL,
+                       commission_rate = 0.0,
+                       commission_base = 0.0,
+                       commission_amount = 0.0,
+                       write_uid = %(uid)s,
+                       write_date = now() at time zone 'UTC'
+                 WHERE move_id = ANY(%(move_ids)s)
+                   AND agent_id IS NOT NULL
+                   AND display_type = 'product'
+            """, params)
+        snapshots = self.env['sale.commission.partner.report']._query_invoice_snapshots("move.id = ANY(%(move_ids)s)")
+        cr.execute(f"""
+            UPDATE account_move_line line
+               SET commission_locked = TRUE,
+                   commission_plan_id = snapshot.plan_id,
+                   commission_rule_type = snapshot.rule_type,
+                   commission_rate = snapshot.rate,
+                   commission_base = snapshot.base,
+                   commission_amount = snapshot.amount,
+                   write_uid = %(uid)s,
+                   write_date = now() at time zone 'UTC'
+              FROM ({snapshots}) snapshot
+             WHERE line.id = snapshot.line_id
+        """, params)
+        count = cr.rowcount
+        COMMISSION_LOCKS.inc_on_commit(cr, count, mode='sql')
+        self.env['account.move.line'].invalidate_model([
+            *self.env['account.move.line']._get_partner_commission_summary_fields(),
+            'write_uid', 'write_date',
+        ])
+        self._queue_partner_commission_summary_refresh()
+        return count
+
+    @api.model
+    def _fix_missing_partner_commission_locks(self):
+        """Lock the due commissions that missed their lock, e.g. invoices posted before install.
+
+        They are locked with the values the report shows for them today.
+
+        :return: number of locked invoice lines
+        """
+        self.env.flush_all()
+        snapshots = self.env['sale.commission.partner.report']._query_invoice_snapshots()
+        self.env.cr.execute(f"SELECT DISTINCT snapshot.move_id FROM ({snapshots}) snapshot")
+        move_ids = [move_id for move_id, in self.env.cr.fetchall()]
+        return self.browse(move_ids)._lock_partner_commissions_sql()
+
+    @api.model
+    def _count_missing_partner_commission_locks(self):
+        """Count and log the due commissions that missed their lock, without locking them.
+
+        :return: number of invoice lines missing their lock
+        """
+        self.env.flush_all()
+        snapshots = self.env['sale.commission.partner.report']._query_invoice_snapshots()
+        self.env.cr.execute(f"SELECT snapshot.line_id FROM ({snapshots}) snapshot ORDER BY snapshot.line_id")
+        line_ids = [line_id for line_id, in self.env.cr.fetchall()]
+        if line_ids:
+            _logger.warning(
+                "%s invoice line(s) miss their partner commission lock, e.g. lines %s",
+                len(line_ids), line_ids[:20],
+            )
+        return len(line_ids)
+
+    @api.model
+    def _count_stale_partner_commission_locks(self):
+        """Count commission snapshots left on invoices that are no longer posted."""
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT COUNT(*)
+              FROM account_move_line aml
+              JOIN account_move move ON move.id = aml.move_id
+             WHERE aml.commission_locked IS TRUE
+               AND move.state != 'posted'
+        """)
+        return self.env.cr.fetchone()[0]
 
     def write(self, vals):
-        old_payment_states = {move.id: move.payment_state for move in self}
+        if not any(field in vals for field in self._get_commission_payment_fields()):
+            return super().write(vals)
+        old_states = self._get_commission_payment_states()
         res = super().write(vals)
-        newly_paid = self.filtered(
-            lambda m: m.move_type in ('out_invoice', 'out_refund')
-            and m.state == 'posted'
-            and old_payment_states.get(m.id) != 'paid'
-            and m.payment_state == 'paid'
-        )
-        newly_paid._action_partner_commission_on_paid()
+        self._handle_commission_payment_transitions(old_states, state_changed='state' in vals)
         return res
 
-    def _generate_commission_bills(self):
-        """Generate vendor bills for commissions when invoice is paid."""
-        self.ensure_one()
-        if self.commission_bills_generated:
-            return
+    @api.model
+    def _get_commission_payment_fields(self):
+        """Fields whose direct write may change what partner commissions see of a move.
 
-        commission_product = self.env.ref('sale_commission_partner.product_commission_default', raise_if_not_found=False)
-        if not commission_product:
-            return
+        Payment state changes caused by reconciliation go through ``_compute_payment_state``.
+        """
+        return ('payment_state', 'state')
 
-        commissions = self.env['sale.commission.partner.report'].search([
-            ('source_id', '=', f'account.move,{self.id}'),
-            ('payment_state', '=', 'paid')
-        ])
-        if not commissions:
+    def _get_commission_payment_states(self):
+        """Return the current payment state of the customer invoices and refunds in ``self``."""
+        return {
+            move.id: move.payment_state
+            for move in self
+            if move.move_type in ('out_invoice', 'out_refund')
+        }
+
+    def _handle_commission_payment_transitions(self, old_states, state_changed=False):
+        """React to payment state transitions of the moves in ``old_states``.
+
+        Both ``write`` and ``_compute_payment_state`` may see the same transition,
+        and a move may be paid again after being unreconciled, or after a
+        savepoint rolled its payment back. Nothing is remembered in memory:
+        queued events are deduplicated by the unique index on pending events,
+        and processing skips locked lines and billed ledger entries.
+        """
+        if not old_states:
             return
+        moves = self.browse(old_states)
+        moves.filtered(
+            lambda m: state_changed or old_states[m.id] != m.payment_state
+        )._queue_partner_commission_summary_refresh()
+        moves.filtered(
+            lambda m: m.state == 'posted'
+            and old_states[m.id] != 'paid'
+            and m.payment_state == 'paid'
+        )._action_partner_commission_on_paid()
 
-        partner_commissions = defaultdict(lambda: {'total': 0.0, 'currency_id': False, 'date_from': False, 'date_to': False})
-        for comm in commissions:
-            partner_commissions[comm.partner_id]['total'] += comm.commission
-            partner_commissions[comm.partner_id]['currency_id'] = comm.currency_id.id
-            if not partner_commissions[comm.partner_id]['date_from'] or comm.date < partner_commissions[comm.partner_id]['date_from']:
-                partner_commissions[comm.partner_id]['date_from'] = comm.date
-            if not partner_commissions[comm.partner_id]['date_to'] or comm.date > partner_commissions[comm.partner_id]['date_to']:
-                partner_commissions[comm.partner_id]['date_to'] = comm.date
-
-        bills = self.env['account.move']
-        for partner, data in partner_commissions.items():
-            if data['total'] <= 0:
+    def _queue_partner_commission_summary_refresh(self):
+        moves = self.filtered(lambda m: m.move_type in ('out_invoice', 'out_refund'))
+        self.env['sale.commission.partner.summary']._queue_refresh(move_ids=moves.ids)
+
+    @profiled('generate_bills')
+    def _generate_commission_bills(self):
+        """Generate vendor bills for the unbilled commissions of paid invoices.
+
+        The unbilled ledger entries of all invoices in ``self`` are read in one
+        query, then one bill is created per agent and currency with one line per
+        source invoice.
+        """
+        moves = self.filtered(lambda m: m.payment_state == 'paid')
+        commission_product = self.env.ref('sale_commission_partner.product_commission_default', raise_if_not_found=False)
+        if not moves or not commission_product:
+            return self.env['account.move']
+
+        Ledger = self.env['sale.commission.partner.ledger'].sudo()
+        Ledger._sync(move_ids=moves.ids)
+        bill_groups = defaultdict(list)
+        billed_moves = self.env['account.move']
+        for partner, currency, move, total, entry_ids in Ledger._read_group(
+            [('move_id', 'in', moves.ids), ('billed', '=', False)],
+            groupby=['partner_id', 'currency_id', 'move_id'],
+            aggregates=['amount:sum', 'id:array_agg'],
+            order='move_id, partner_id',
+        ):
+            if currency.compare_amounts(total, 0.0) <= 0:
                 continue
-            date_from = data['date_from']
-            date_to = data['date_to']
-            description = _("Commission for period %s - %s (%s)") % (date_from, date_to, self.name)
-            bills += self.env['account.move'].create({
-                'move_type': 'in_invoice',
-                'partner_id': partner.id,
-                'invoice_date': fields.Date.context_today(self),
-                'currency_id': data['currency_id'],
-                'invoice_line_ids': [
-                    (0, 0, {
-                        'product_id': commission_product.id,
-                        'name': description,
-                        'quantity': 1,
-                        'price_unit': data['total'],
-                    })
-                ]
-            })
-
-        if bills:
-            self.commission_bills_generated = True
+            description = _("Commission for period %s - %s (%s)") % (move.date, move.date, move.name)
+            bill_groups[partner.id, currency.id].append((description, entry_ids))
+            billed_moves |= move
+
+        bills = Ledger._create_bills(bill_groups, commission_product)
+        billed_moves.commission_bills_generated = True
+        return bills
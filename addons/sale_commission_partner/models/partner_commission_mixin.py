@@ -1,23 +1,28 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import api, fields, models
+from collections import defaultdict
+
+from odoo import api, fields, models, tools
+from ..profiling import profiled
 
 
 class SaleCommissionPartnerMixin(models.AbstractModel):
     _name = 'sale.commission.partner.mixin'
     _description = 'Partner Commission Computation Helpers'
 
+    @api.model
+    def _get_category_ancestor_ids(self, category):
+        """Return the category and its parents, closest first, read from ``parent_path``."""
+        if not category or not category.parent_path:
+            return []
+        return [int(category_id) for category_id in reversed(category.parent_path.split('/')) if category_id]
+
     @api.model
     def _get_product_category_branch_ids(self, product):
         """Return the product category and all of its parent categories."""
         if not product or not product.categ_id:
             return []
-        category_ids = []
-        category = product.categ_id
-        while category:
-            category_ids.append(category.id)
-            category = category.parent_id
-        return category_ids
+        return self._get_category_ancestor_ids(product.categ_id)
 
     @api.model
     def _get_partner_plan_partner(self, agent, reference_date, company=None):
@@ -33,8 +38,25 @@ class SaleCommissionPartnerMixin(models.AbstractModel):
             ('date_to', '>=', reference_date),
         ]
         if company:
-            domain.append(('plan_id.company_ids', 'in', company.id))
-        return self.env['sale.commission.plan.partner'].search(domain, limit=1)
+            domain.append(('plan_id.effective_company_ids', 'in', company.id))
+        return self.env['sale.commission.plan.partner'].search(domain, order='date_from, id', limit=1)
+
+    @api.model
+    def _select_partner_commission_rule(self, rules, product, category_ids):
+        """Pick the most specific rule: product rules first, then the deepest matching category.
+
+        Mirrors the ``ORDER BY`` of the rule lookup in ``sale.commission.partner.report``.
+        """
+        rules = rules.filtered(
+            lambda rule: (not rule.product_id or rule.product_id == product)
+            and (not rule.product_categ_id or rule.product_categ_id.id in category_ids)
+        )
+
+        def rank(rule):
+            depth = category_ids.index(rule.product_categ_id.id) if rule.product_categ_id else len(category_ids)
+            return (not rule.product_id, depth, rule.id)
+
+        return min(rules, key=rank, default=rules.browse())
 
     @api.model
     def _get_partner_commission_rule(self, plan, product):
@@ -44,31 +66,113 @@ class SaleCommissionPartnerMixin(models.AbstractModel):
         category_domain = [('product_categ_id', '=', False)]
         if category_ids:
             category_domain = ['|', ('product_categ_id', '=', False), ('product_categ_id', 'in', category_ids)]
-        return self.env['sale.commission.plan.achievement'].search([
+        rules = self.env['sale.commission.plan.achievement'].search([
             ('plan_id', '=', plan.id),
             '|', ('product_id', '=', False), ('product_id', '=', product.id),
             *category_domain,
-        ], order='product_id DESC, product_categ_id DESC', limit=1)
+        ])
+        return self._select_partner_commission_rule(rules, product, category_ids)
 
     @api.model
     def _get_partner_commission_base(self, rule, *, price_subtotal, quantity, purchase_price=0.0, standard_price=0.0):
         if not rule:
             return 0.0
-        if rule.type in ('amount_sold', 'amount_invoiced'):
+        return self._get_partner_commission_base_for_type(
+            rule.type,
+            price_subtotal=price_subtotal,
+            quantity=quantity,
+            purchase_price=purchase_price,
+            standard_price=standard_price,
+        )
+
+    @api.model
+    def _get_partner_commission_base_for_type(self, rule_type, *, price_subtotal, quantity, purchase_price=0.0, standard_price=0.0):
+        if rule_type in ('amount_sold', 'amount_invoiced'):
             return price_subtotal
-        if rule.type in ('qty_sold', 'qty_invoiced'):
+        if rule_type in ('qty_sold', 'qty_invoiced'):
             return quantity
-        if rule.type in ('margin', 'margin_invoice_paid'):
+        if rule_type in ('margin', 'margin_invoice_paid'):
             cost = purchase_price * quantity if purchase_price else standard_price * quantity
             return price_subtotal - cost
         return price_subtotal
 
     @api.model
+    @profiled('snapshot')
     def _get_partner_commission_snapshot(self, agent, product, reference_date, *, price_subtotal, quantity, purchase_price=0.0, standard_price=0.0, company=None):
         plan_partner = self._get_partner_plan_partner(agent, reference_date, company=company)
         if not plan_partner:
             return False
         rule = self._get_partner_commission_rule(plan_partner.plan_id, product)
+        return self._prepare_partner_commission_snapshot(
+            plan_partner.plan_id,
+            rule,
+            price_subtotal=price_subtotal,
+            quantity=quantity,
+            purchase_price=purchase_price,
+            standard_price=standard_price,
+        )
+
+    @api.model
+    @profiled('snapshot_batch')
+    def _get_partner_commission_snapshots(self, entries):
+        """Batch version of ``_get_partner_commission_snapshot``.
+
+        ``entries`` is a list of dicts holding its arguments. Plans and rules of
+        all entries are fetched with one search each; returns the snapshots (or
+        ``False``) in the order of ``entries``.
+        """
+        dated_entries = [entry for entry in entries if entry['agent'] and entry['reference_date']]
+        if not dated_entries:
+            return [False] * len(entries)
+        dates = [entry['reference_date'] for entry in dated_entries]
+        agents = self.env['res.partner'].union(*(entry['agent'] for entry in dated_entries))
+        assignments = self.env['sale.commission.plan.partner'].search([
+            ('partner_id', 'in', agents.ids),
+            ('plan_id.active', '=', True),
+            ('plan_id.state', '=', 'approved'),
+            ('date_from', '<=', max(dates)),
+            '|',
+            ('date_to', '=', False),
+            ('date_to', '>=', min(dates)),
+        ], order='date_from, id')
+        assignments_by_agent = defaultdict(list)
+        for assignment in assignments:
+            assignments_by_agent[assignment.partner_id.id].append(assignment)
+        rule_ids_by_plan = defaultdict(list)
+        for rule in self.env['sale.commission.plan.achievement'].search([('plan_id', 'in', assignments.plan_id.ids)]):
+            rule_ids_by_plan[rule.plan_id.id].append(rule.id)
+
+        snapshots = []
+        for entry in entries:
+            reference_date, company = entry['reference_date'], entry.get('company')
+            plan_partner = entry['agent'] and reference_date and next((
+                assignment for assignment in assignments_by_agent[entry['agent'].id]
+                if assignment.date_from <= reference_date
+                and (not assignment.date_to or assignment.date_to >= reference_date)
+                and (not company or company in assignment.plan_id.effective_company_ids)
+            ), None)
+            if not plan_partner or not entry['product']:
+                snapshots.append(False)
+                continue
+            plan = plan_partner.plan_id
+            product = entry['product']
+            rule = self._select_partner_commission_rule(
+                self.env['sale.commission.plan.achievement'].browse(rule_ids_by_plan[plan.id]),
+                product,
+                self._get_product_category_branch_ids(product),
+            )
+            snapshots.append(self._prepare_partner_commission_snapshot(
+                plan,
+                rule,
+                price_subtotal=entry['price_subtotal'],
+                quantity=entry['quantity'],
+                purchase_price=entry.get('purchase_price', 0.0),
+                standard_price=entry.get('standard_price', 0.0),
+            ))
+        return snapshots
+
+    @api.model
+    def _prepare_partner_commission_snapshot(self, plan, rule, *, price_subtotal, quantity, purchase_price=0.0, standard_price=0.0):
         if not rule:
             return False
         base = self._get_partner_commission_base(
@@ -80,9 +184,108 @@ class SaleCommissionPartnerMixin(models.AbstractModel):
         )
         rate = rule.rate or 0.0
         return {
-            'commission_plan_id': plan_partner.plan_id.id,
+            'commission_plan_id': plan.id,
             'commission_rule_type': rule.type,
             'commission_rate': rate,
             'commission_base': base,
             'commission_amount': base * rate,
         }
+
+    @api.model
+    def _get_partner_commission_index(self):
+        """Return the approved agent plans and their rules as plain, cacheable data::
+
+            {
+                'assignments': {agent_id: ((date_from, date_to, plan_id, company_ids), ...)},
+                'rules': {plan_id: ((rule_id, product_id, categ_id, type, rate), ...)},
+            }
+
+        Assignments are in ``date_from, id`` order. The index is cached per
+        version, see :meth:`_invalidate_partner_commission_index`.
+        """
+        self.env.cr.execute("SELECT version FROM sale_commission_partner_index_version")
+        return self._get_partner_commission_index_for_version(self.env.cr.fetchone()[0])
+
+    @api.model
+    def _invalidate_partner_commission_index(self):
+        """Give the commission index a new version, when plans, their rules or their agents change.
+
+        The version is transactional: other workers keep their cached index
+        until the change is committed. It is drawn from a sequence, so the
+        version of a rolled back change is never used again.
+        """
+        self.env.cr.execute("""
+            UPDATE sale_commission_partner_index_version
+               SET version = nextval('sale_commission_partner_index_version_seq')
+        """)
+
+    @api.model
+    @tools.ormcache('version')
+    def _get_partner_commission_index_for_version(self, version):
+        assignments = self.env['sale.commission.plan.partner'].sudo().search([
+            ('plan_id.active', '=', True),
+            ('plan_id.state', '=', 'approved'),
+        ], order='date_from, id')
+        assignments_by_agent = defaultdict(list)
+        for assignment in assignments:
+            assignments_by_agent[assignment.partner_id.id].append((
+                assignment.date_from,
+                assignment.date_to,
+                assignment.plan_id.id,
+                frozenset(assignment.plan_id.effective_company_ids.ids),
+            ))
+        rules_by_plan = defaultdict(list)
+        for rule in self.env['sale.commission.plan.achievement'].sudo().search([('plan_id', 'in', assignments.plan_id.ids)], order='id'):
+            rules_by_plan[rule.plan_id.id].append((rule.id, rule.product_id.id, rule.product_categ_id.id, rule.type, rule.rate or 0.0))
+        return {
+            'assignments': {agent_id: tuple(values) for agent_id, values in assignments_by_agent.items()},
+            'rules': {plan_id: tuple(values) for plan_id, values in rules_by_plan.items()},
+        }
+
+    @api.model
+    def _preview_partner_commissions(self, entries, reference_date, company):
+        """Compute commissions from the cached plan index, without writing anything.
+
+        ``entries`` are dicts with ``agent_id``, ``product`` (a record),
+        ``price_subtotal``, ``quantity`` and optionally ``purchase_price``;
+        returns a snapshot dict or ``False`` per entry.
+        """
+        index = self._get_partner_commission_index()
+        previews = []
+        for entry in entries:
+            product = entry['product']
+            plan_id = next((
+                plan_id for date_from, date_to, plan_id, company_ids in index['assignments'].get(entry['agent_id'], ())
+                if date_from <= reference_date and (not date_to or date_to >= reference_date) and company.id in company_ids
+            ), None)
+            if not plan_id or not product:
+                previews.append(False)
+                continue
+            category_ids = self._get_product_category_branch_ids(product)
+            candidates = [
+                rule for rule in index['rules'].get(plan_id, ())
+                if (not rule[1] or rule[1] == product.id) and (not rule[2] or rule[2] in category_ids)
+            ]
+            if not candidates:
+                previews.append(False)
+                continue
+            _rule_id, _product_id, _categ_id, rule_type, rate = min(candidates, key=lambda rule: (
+                not rule[1],
+                category_ids.index(rule[2]) if rule[2] else len(category_ids),
+                rule[0],
+            ))
+            base = self._get_partner_commission_base_for_type(
+                rule_type,
+                price_subtotal=entry['price_subtotal'],
+                quantity=entry['quantity'],
+                purchase_price=entry.get('purchase_price') or 0.0,
+                standard_price=product.standard_price,
+            )
+            previews.append({
+                'commission_plan_id': plan_id,
+                'commission_rule_type': rule_type,
+                'commission_rate': rate,
+                'commission_base': base,
+                'commission_amount': base * rate,
+            })
+        return previews
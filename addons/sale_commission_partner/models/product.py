@@ -0,0 +1,29 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import models
+
+
+class ProductCategory(models.Model):
+    _inherit = 'product.category'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'parent_id' in vals:
+            # the rules matched by the products of the moved categories and their children change
+            self.env['sale.commission.partner.summary']._queue_refresh_unlocked_lines(
+                [('product_id.categ_id', 'child_of', self.ids)]
+            )
+        return res
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'standard_price' in vals:
+            # margin rules fall back on the product cost
+            self.env['sale.commission.partner.summary']._queue_refresh_unlocked_lines(
+                [('product_id', 'in', self.ids)]
+            )
+        return res
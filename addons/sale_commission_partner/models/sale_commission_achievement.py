@@ -1,9 +1,27 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields
+from odoo import api, models, fields
 
 class SaleCommissionAchievement(models.Model):
     _inherit = 'sale.commission.achievement'
 
-    add_partner_id = fields.Many2one('sale.commission.plan.partner', "Add to (Agent)", domain=[('plan_id.active', '=', True), ('plan_id.state', '=', 'approved')])
-    reduce_partner_id = fields.Many2one('sale.commission.plan.partner', "Reduce From (Agent)", domain=[('plan_id.active', '=', True), ('plan_id.state', '=', 'approved')])
+    add_partner_id = fields.Many2one('sale.commission.plan.partner', "Add to (Agent)", index='btree_not_null', domain=[('plan_id.active', '=', True), ('plan_id.state', '=', 'approved')])
+    reduce_partner_id = fields.Many2one('sale.commission.plan.partner', "Reduce From (Agent)", index='btree_not_null', domain=[('plan_id.active', '=', True), ('plan_id.state', '=', 'approved')])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        adjustments = super().create(vals_list)
+        adjustments._queue_partner_commission_summary_refresh()
+        return adjustments
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._queue_partner_commission_summary_refresh()
+        return res
+
+    def unlink(self):
+        self.env['sale.commission.partner.ledger']._clawback_adjustments(self)
+        return super().unlink()
+
+    def _queue_partner_commission_summary_refresh(self):
+        self.env['sale.commission.partner.summary']._queue_refresh(adjustment_ids=self.ids)
@@ -0,0 +1,39 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models
+
+
+class SaleCommissionBackfillCheckpoint(models.Model):
+    """Progress of one shard of a ``commission_backfill`` run."""
+    _name = 'sale.commission.backfill.checkpoint'
+    _description = "Commission Backfill Checkpoint"
+    _order = 'run, company_id, id_from'
+
+    run = fields.Char("Run", required=True, default='default')
+    company_id = fields.Many2one('res.company', "Company", required=True, ondelete='cascade')
+    id_from = fields.Integer("From Invoice Id", required=True)
+    id_to = fields.Integer("To Invoice Id", required=True)
+    last_move_id = fields.Integer("Last Processed Invoice Id", readonly=True)
+    moves_processed = fields.Integer("Invoices Processed", readonly=True)
+    done = fields.Boolean("Done", readonly=True)
+
+    _shard_uniq = models.Constraint(
+        'UNIQUE(run, company_id, id_from)',
+        "A backfill run can only have one checkpoint per shard.",
+    )
+
+    @api.model
+    def _get_checkpoint(self, run, company_id, id_from, id_to):
+        checkpoint = self.search([
+            ('run', '=', run),
+            ('company_id', '=', company_id),
+            ('id_from', '=', id_from),
+        ], limit=1)
+        if not checkpoint:
+            checkpoint = self.create({
+                'run': run,
+                'company_id': company_id,
+                'id_from': id_from,
+                'id_to': id_to,
+            })
+        return checkpoint
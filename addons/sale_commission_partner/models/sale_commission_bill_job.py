@@ -0,0 +1,99 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models, Command, _
+
+
+class SaleCommissionBillJob(models.Model):
+    """Commission vendor bill generation, run in chunks of agents by a cron.
+
+    Agents are walked by increasing id and each chunk is committed with the job
+    progress, so an interrupted run resumes after the last committed chunk.
+    Each chunk creates its bills with a single ``create`` and, when requested,
+    posts them in a single batch. Bills are created as the requesting user,
+    for the entries of the companies allowed when the run was requested, each
+    bill in the company of its entries.
+    """
+    _name = 'sale.commission.bill.job'
+    _inherit = ['sale.commission.job.mixin']
+    _description = "Commission Bill Run"
+    _order = 'id desc'
+
+    _CHUNK_SIZE = 200  # agents per chunk
+    _CRON_XMLID = 'sale_commission_partner.ir_cron_partner_commission_bill_jobs'
+    _PROGRESS_FIELDS = ('agents_total', 'agents_processed')
+
+    date_from = fields.Date("From", required=True, readonly=True)
+    date_to = fields.Date("To", required=True, readonly=True)
+    partner_ids = fields.Many2many('res.partner', string="Agents", readonly=True)
+    product_id = fields.Many2one('product.product', "Commission Product", required=True, readonly=True, ondelete='restrict')
+    auto_post = fields.Boolean("Post Bills", readonly=True)
+    agents_total = fields.Integer("Agents to Process", readonly=True)
+    agents_processed = fields.Integer("Agents Processed", readonly=True)
+    last_partner_id = fields.Integer("Last Processed Agent", readonly=True)
+    bill_ids = fields.Many2many('account.move', string="Bills", readonly=True)
+    bill_count = fields.Integer("Bills", compute='_compute_bill_count')
+
+    @api.depends('bill_ids')
+    def _compute_bill_count(self):
+        for job in self:
+            job.bill_count = len(job.bill_ids)
+
+    def _get_entry_domain(self):
+        self.ensure_one()
+        domain = [
+            ('date', '>=', self.date_from),
+            ('date', '<=', self.date_to),
+            ('company_id', 'in', self._get_companies().ids),
+        ]
+        if self.partner_ids:
+            domain.append(('partner_id', 'in', self.partner_ids.ids))
+        return domain
+
+    def _count_pending_partners(self):
+        self.ensure_one()
+        [(count,)] = self.env['sale.commission.partner.ledger']._read_group(
+            [*self._get_entry_domain(), ('billed', '=', False)], aggregates=['partner_id:count_distinct'],
+        )
+        return count
+
+    def _get_next_partner_ids(self, limit):
+        """Return the ids of the next ``limit`` agents with unbilled entries, after the last processed one."""
+        self.ensure_one()
+        groups = self.env['sale.commission.partner.ledger']._read_group(
+            [*self._get_entry_domain(), ('billed', '=', False), ('partner_id', '>', self.last_partner_id)],
+            groupby=['partner_id'], order='partner_id', limit=limit,
+        )
+        return [partner.id for partner, in groups]
+
+    def _prepare_start_values(self):
+        return {'agents_total': self._count_pending_partners()}
+
+    def _get_next_chunk(self):
+        return self._get_next_partner_ids(self._CHUNK_SIZE)
+
+    def _process_chunk(self, partner_ids):
+        Ledger = self._as_requester('sale.commission.partner.ledger')
+        description = _("Commission for period %s - %s") % (self.date_from, self.date_to)
+        bills = self.env['account.move']
+        for company in self._get_companies():
+            bill_groups = Ledger._get_bill_groups([
+                *self._get_entry_domain(), ('company_id', '=', company.id), ('partner_id', 'in', partner_ids),
+            ], description)
+            bills |= Ledger.with_company(company)._create_bills(bill_groups, self.product_id)
+        if self.auto_post:
+            bills.action_post()
+        return {
+            'last_partner_id': partner_ids[-1],
+            'agents_processed': self.agents_processed + len(partner_ids),
+            'bill_ids': [Command.link(bill.id) for bill in bills],
+        }
+
+    def action_open_bills(self):
+        self.ensure_one()
+        return {
+            'name': _('Generated Bills'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', self.bill_ids.ids)],
+        }
@@ -0,0 +1,110 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import time
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleCommissionJobMixin(models.AbstractModel):
+    """Background job run in chunks by a cron, as the user who requested it.
+
+    Pending jobs are processed by increasing id. Each chunk runs in a savepoint
+    and is committed with the job progress, so an interrupted job resumes after
+    the last committed chunk; a failing chunk marks the job failed. Jobs define
+    the chunks with :meth:`_get_next_chunk` and :meth:`_process_chunk`.
+    """
+    _name = 'sale.commission.job.mixin'
+    _description = "Partner Commission Background Job"
+
+    _CHUNK_SIZE = 500
+    _TIME_BUDGET = 60  # seconds per cron run
+    _CRON_XMLID = None
+    _PROGRESS_FIELDS = ()  # (total field, processed field)
+
+    user_id = fields.Many2one('res.users', "Requested By", required=True, readonly=True, default=lambda self: self.env.user)
+    company_ids = fields.Many2many('res.company', string="Allowed Companies", readonly=True, default=lambda self: self.env.companies)
+    state = fields.Selection([
+        ('pending', "Pending"),
+        ('running', "Running"),
+        ('done', "Done"),
+        ('failed', "Failed"),
+    ], "Status", required=True, default='pending', readonly=True, index=True)
+    progress = fields.Float("Progress", compute='_compute_progress')
+    date_done = fields.Datetime("Finished On", readonly=True)
+    last_error = fields.Text("Error", readonly=True)
+
+    @api.depends(lambda self: (*self._PROGRESS_FIELDS, 'state'))
+    def _compute_progress(self):
+        total_field, processed_field = self._PROGRESS_FIELDS
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job[total_field]:
+                job.progress = 100.0 * job[processed_field] / job[total_field]
+            else:
+                job.progress = 0.0
+
+    def _get_companies(self):
+        self.ensure_one()
+        return self.company_ids or self.user_id.company_id
+
+    def _as_requester(self, model_name):
+        """Return ``model_name`` for the requesting user, within the companies allowed at request time."""
+        self.ensure_one()
+        return self.env[model_name].with_user(self.user_id).with_context(allowed_company_ids=self._get_companies().ids)
+
+    @api.model
+    def _trigger(self):
+        self.env.ref(self._CRON_XMLID)._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        deadline = time.monotonic() + self._TIME_BUDGET
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            if not job._run(deadline):
+                self._trigger()
+                return
+
+    def _run(self, deadline):
+        """Process chunks until done or out of time; return whether the job finished."""
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', **self._prepare_start_values()})
+        while time.monotonic() < deadline:
+            chunk = self._get_next_chunk()
+            if not chunk:
+                self._finish()
+                return True
+            try:
+                with self.env.cr.savepoint():
+                    progress_values = self._process_chunk(chunk)
+                    self.env.flush_all()
+            except Exception as e:  # noqa: BLE001
+                _logger.warning("%s %s failed: %s", self._description, self.id, e)
+                self._fail(str(e))
+                return True
+            self.write(progress_values)
+            self.env.cr.commit()
+            self.env.invalidate_all()
+        return False
+
+    def _prepare_start_values(self):
+        """Return the values written when the job starts, e.g. its total."""
+        return {}
+
+    def _get_next_chunk(self):
+        """Return the next chunk to process, or a falsy value when done."""
+        raise NotImplementedError()
+
+    def _process_chunk(self, chunk):
+        """Process ``chunk`` and return the progress values to write."""
+        raise NotImplementedError()
+
+    def _finish(self):
+        self.write({'state': 'done', 'date_done': fields.Datetime.now()})
+
+    def _fail(self, error):
+        self.write({'state': 'failed', 'last_error': error})
@@ -0,0 +1,110 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models
+from ..metrics import COMMISSION_EVENTS_QUEUED
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleCommissionPartnerEvent(models.Model):
+    """Commission work queued by invoice payments and processed after commit by a cron.
+
+    Enqueuing is idempotent: an invoice has at most one pending event per type.
+    Processing is idempotent too, since locked lines and billed invoices are skipped.
+    """
+    _name = 'sale.commission.partner.event'
+    _description = "Partner Commission Event"
+    _order = 'id'
+
+    _MAX_ATTEMPTS = 5
+
+    move_id = fields.Many2one('account.move', "Invoice", required=True, index=True, ondelete='cascade')
+    event_type = fields.Selection([('paid', "Invoice Paid")], "Event", required=True, default='paid')
+    state = fields.Selection([
+        ('pending', "Pending"),
+        ('done', "Done"),
+        ('failed', "Failed"),
+    ], "Status", required=True, default='pending', index=True)
+    attempts = fields.Integer("Attempts", readonly=True)
+    next_attempt_date = fields.Datetime("Next Attempt", readonly=True, default=fields.Datetime.now)
+    last_error = fields.Text("Last Error", readonly=True)
+
+    _unique_pending = models.UniqueIndex("(move_id, event_type) WHERE state = 'pending'")
+
+    @api.model
+    def _enqueue(self, moves, event_type='paid'):
+        """Queue ``moves`` for processing after commit, skipping those already pending."""
+        if not moves:
+            return
+        self.env.cr.execute("""
+            INSERT INTO sale_commission_partner_event
+                   (move_id, event_type, state, attempts, next_attempt_date,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT move_id, %(event_type)s, 'pending', 0, now() at time zone 'UTC',
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM unnest(%(move_ids)s) AS move_id
+            ON CONFLICT (move_id, event_type) WHERE state = 'pending' DO NOTHING
+        """, {'event_type': event_type, 'move_ids': moves.ids, 'uid': self.env.uid})
+        COMMISSION_EVENTS_QUEUED.inc_on_commit(self.env.cr, self.env.cr.rowcount, event_type=event_type)
+        self.env.ref('sale_commission_partner.ir_cron_partner_commission_events')._trigger()
+
+    @api.model
+    def _cron_process_events(self, batch_size=200):
+        self.env.cr.execute("""
+            SELECT id
+              FROM sale_commission_partner_event
+             WHERE state = 'pending'
+               AND next_attempt_date <= %s
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [fields.Datetime.now(), batch_size + 1])
+        event_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.browse(event_ids[:batch_size])._process()
+        if len(event_ids) > batch_size:
+            self.env.ref('sale_commission_partner.ir_cron_partner_commission_events')._trigger()
+
+    def _process(self):
+        """Process events as one batch; on failure, retry them one by one to isolate the culprit."""
+        if not self:
+            return
+        try:
+            with self.env.cr.savepoint():
+                self._process_batch()
+        except Exception as e:  # noqa: BLE001
+            if len(self) == 1:
+                self._mark_failed(e)
+                return
+            for event in self:
+                event._process()
+
+    def _process_batch(self):
+        for event_type in set(self.mapped('event_type')):
+            events = self.filtered(lambda event: event.event_type == event_type)
+            if event_type == 'paid':
+                events.move_id.filtered(
+                    lambda m: m.state == 'posted' and m.payment_state == 'paid'
+                )._process_partner_commission_on_paid()
+        self.write({'state': 'done', 'last_error': False})
+
+    def _mark_failed(self, error):
+        self.ensure_one()
+        _logger.warning("Partner commission event %s for %s failed: %s", self.id, self.move_id.display_name, error)
+        attempts = self.attempts + 1
+        self.write({
+            'attempts': attempts,
+            'last_error': str(error),
+            'state': 'failed' if attempts >= self._MAX_ATTEMPTS else 'pending',
+            'next_attempt_date': fields.Datetime.now() + timedelta(minutes=2 ** attempts),
+        })
+
+    def action_retry(self):
+        self.write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_date': fields.Datetime.now(),
+        })
+        self.env.ref('sale_commission_partner.ir_cron_partner_commission_events')._trigger()
@@ -0,0 +1,260 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models, Command, _
+from odoo.exceptions import UserError
+from ..metrics import COMMISSION_BILLS
+from ..profiling import profiled
+
+
+class SaleCommissionPartnerLedger(models.Model):
+    """Append-only record of the commissions owed to agents.
+
+    Entries are never changed or deleted: when a locked commission or an
+    adjustment changes, the difference is appended as new entries (a clawback
+    of the previous amount, then the new amount). Vendor bills only read the
+    entries not linked to a bill line yet; deleting or cancelling a bill
+    releases its entries, to be billed again.
+    """
+    _name = 'sale.commission.partner.ledger'
+    _description = "Partner Commission Ledger"
+    _order = 'id'
+
+    partner_id = fields.Many2one('res.partner', "Agent", required=True, readonly=True, index=True, ondelete='restrict')
+    plan_id = fields.Many2one('sale.commission.plan', "Commission Plan", readonly=True, ondelete='set null')
+    company_id = fields.Many2one('res.company', "Company", required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', "Currency", required=True, readonly=True)
+    date = fields.Date("Date", required=True, readonly=True)
+    entry_type = fields.Selection([
+        ('lock', "Locked Commission"),
+        ('refund', "Refund"),
+        ('adjustment', "Adjustment"),
+        ('clawback', "Clawback"),
+    ], "Type", required=True, readonly=True)
+    amount = fields.Monetary("Amount", required=True, readonly=True, currency_field='currency_id')
+    move_id = fields.Many2one('account.move', "Invoice", readonly=True, index='btree_not_null', ondelete='set null')
+    move_line_id = fields.Many2one('account.move.line', "Invoice Line", readonly=True, index='btree_not_null', ondelete='set null')
+    adjustment_id = fields.Many2one('sale.commission.achievement', "Adjustment", readonly=True, index='btree_not_null', ondelete='set null')
+    bill_line_id = fields.Many2one('account.move.line', "Vendor Bill Line", readonly=True, index='btree_not_null', ondelete='set null')
+    billed_before_ledger = fields.Boolean("Billed Before Ledger", readonly=True)
+    billed = fields.Boolean("Billed", compute='_compute_billed', store=True, index=True)
+
+    @api.depends('bill_line_id', 'billed_before_ledger')
+    def _compute_billed(self):
+        # entries billed before the ledger existed are flagged by the 1.5 migration, without a bill line
+        for entry in self:
+            entry.billed = bool(entry.bill_line_id) or entry.billed_before_ledger
+
+    def write(self, vals):
+        if set(vals) - {'bill_line_id'}:
+            raise UserError(_("Commission ledger entries cannot be modified."))
+        return super().write(vals)
+
+    @api.ondelete(at_uninstall=False)
+    def _unlink_never(self):
+        raise UserError(_("Commission ledger entries cannot be deleted."))
+
+    @api.model
+    @profiled('ledger_sync')
+    def _sync(self, move_ids=(), adjustment_ids=(), partner_ids=()):
+        """Append the entries needed for the ledger to match the given invoices and adjustments."""
+        if not (move_ids or adjustment_ids or partner_ids):
+            return self
+        self.env.flush_all()
+        targets = self._read_invoice_targets(move_ids) + self._read_adjustment_targets(adjustment_ids, partner_ids)
+        current = self._read_current_balances(move_ids, adjustment_ids, partner_ids)
+
+        vals_list = []
+        target_keys = set()
+        for target in targets:
+            key = (target['move_line_id'], target['adjustment_id'], target['partner_id'])
+            target_keys.add(key)
+            balance = current.get(key)
+            amount = float(target['amount'] or 0.0)
+            currency = self.env['res.currency'].browse(target['currency_id'])
+            if balance and currency.is_zero(balance['amount'] - amount) and balance['plan_id'] == target['plan_id']:
+                continue
+            if balance and not currency.is_zero(balance['amount']):
+                vals_list.append(self._prepare_clawback(balance))
+            if not currency.is_zero(amount):
+                vals_list.append({**target, 'amount': amount})
+        for key, balance in current.items():
+            if key not in target_keys and not self.env['res.currency'].browse(balance['currency_id']).is_zero(balance['amount']):
+                vals_list.append(self._prepare_clawback(balance))
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def _clawback_adjustments(self, adjustments):
+        """Reverse the balances of adjustments about to be deleted."""
+        self.env.flush_all()
+        balances = self._read_current_balances((), adjustments.ids, ())
+        return self.sudo().create([
+            self._prepare_clawback(balance)
+            for balance in balances.values()
+            if not self.env['res.currency'].browse(balance['currency_id']).is_zero(balance['amount'])
+        ])
+
+    @api.model
+    def _sync_all(self):
+        """Bring the whole ledger in line with the locked commissions and adjustments."""
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT DISTINCT move_id FROM account_move_line WHERE commission_locked IS TRUE
+             UNION
+            SELECT move_id FROM sale_commission_partner_ledger WHERE move_id IS NOT NULL
+        """)
+        move_ids = [move_id for move_id, in self.env.cr.fetchall()]
+        self.env.cr.execute("SELECT id FROM sale_commission_achievement")
+        adjustment_ids = [adjustment_id for adjustment_id, in self.env.cr.fetchall()]
+        return self._sync(move_ids=move_ids, adjustment_ids=adjustment_ids)
+
+    @api.model
+    def _get_bill_groups(self, domain, description):
+        """Group the unbilled entries matching ``domain`` per agent and currency, for :meth:`_create_bills`.
+
+        Negative balances are left unbilled, to be netted in a later period.
+        """
+        return {
+            (partner.id, currency.id): [(description, entry_ids)]
+            for partner, currency, amount, entry_ids in self._read_group(
+                [*domain, ('billed', '=', False)],
+                groupby=['partner_id', 'currency_id'],
+                aggregates=['amount:sum', 'id:array_agg'],
+                order='partner_id, currency_id',
+            )
+            if currency.compare_amounts(amount, 0.0) > 0
+        }
+
+    @api.model
+    def _create_bills(self, bill_groups, product):
+        """Create one vendor bill per ``(partner_id, currency_id)`` and link the billed entries.
+
+        :param bill_groups: ``{(partner_id, currency_id): [(line_name, entry_ids), ...]}``
+        :return: the bills, created with a single ``create``
+        """
+        if not bill_groups:
+            return self.env['account.move']
+        amounts = {
+            entry.id: entry.amount
+            for entry in self.browse([entry_id for lines in bill_groups.values() for _name, entry_ids in lines for entry_id in entry_ids])
+        }
+        bills = self.env['account.move'].create([{
+            'move_type': 'in_invoice',
+            'partner_id': partner_id,
+            'invoice_date': fields.Date.context_today(self),
+            'currency_id': currency_id,
+            'invoice_line_ids': [Command.create({
+                'product_id': product.id,
+                'name': name,
+                'quantity': 1,
+                'price_unit': sum(amounts[entry_id] for entry_id in entry_ids),
+            }) for name, entry_ids in lines],
+        } for (partner_id, currency_id), lines in bill_groups.items()])
+        entry_ids, bill_line_ids = [], []
+        for bill, lines in zip(bills, bill_groups.values()):
+            product_lines = bill.invoice_line_ids.filtered(lambda line: line.display_type == 'product').sorted('id')
+            for bill_line, (_name, line_entry_ids) in zip(product_lines, lines):
+                entry_ids += line_entry_ids
+                bill_line_ids += [bill_line.id] * len(line_entry_ids)
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE sale_commission_partner_ledger ledger
+               SET bill_line_id = link.bill_line_id,
+                   billed = TRUE
+              FROM unnest(%s::int[], %s::int[]) AS link(entry_id, bill_line_id)
+             WHERE ledger.id = link.entry_id
+        """, [entry_ids, bill_line_ids])
+        self.invalidate_model(['bill_line_id', 'billed'])
+        COMMISSION_BILLS.inc_on_commit(self.env.cr, len(bills))
+        return bills
+
+    @api.model
+    def _release_bill_lines(self, bill_lines):
+        """Unlink the entries billed on ``bill_lines``, so that they are billed again.
+
+        Called before the bill lines are deleted or once their bill is cancelled:
+        the ``set null`` of a deleted line is applied by the database, which
+        would leave its entries flagged as billed.
+        """
+        if not bill_lines:
+            return self
+        entries = self.sudo().search([('bill_line_id', 'in', bill_lines.ids)])
+        entries.write({'bill_line_id': False})
+        return entries
+
+    @api.model
+    def _prepare_clawback(self, balance):
+        return {
+            **balance,
+            'entry_type': 'clawback',
+            'amount': -balance['amount'],
+            'date': fields.Date.context_today(self),
+        }
+
+    @api.model
+    def _read_invoice_targets(self, move_ids):
+        """Return the locked commission of each agent line of the given posted invoices."""
+        if not move_ids:
+            return []
+        self.env.cr.execute("""
+            SELECT aml.id AS move_line_id,
+                   aml.move_id AS move_id,
+                   NULL::integer AS adjustment_id,
+                   aml.agent_id AS partner_id,
+                   aml.commission_plan_id AS plan_id,
+                   move.company_id AS company_id,
+                   move.currency_id AS currency_id,
+                   move.date AS date,
+                   CASE WHEN move.move_type = 'out_refund' THEN 'refund' ELSE 'lock' END AS entry_type,
+                   aml.commission_amount AS amount
+              FROM account_move_line aml
+              JOIN account_move move ON move.id = aml.move_id
+             WHERE aml.move_id = ANY(%(move_ids)s)
+               AND aml.commission_locked IS TRUE
+               AND aml.agent_id IS NOT NULL
+               AND move.state = 'posted'
+               AND move.move_type IN ('out_invoice', 'out_refund')
+        """, {'move_ids': list(move_ids)})
+        return self.env.cr.dictfetchall()
+
+    @api.model
+    def _read_adjustment_targets(self, adjustment_ids, partner_ids):
+        """Return the amount of each adjustment per agent, as shown in the commission report."""
+        if not (adjustment_ids or partner_ids):
+            return []
+        query = self.env['sale.commission.partner.report']._query_adjustments(
+            "sca.id = ANY(%(adjustment_ids)s) OR plan_partner.partner_id = ANY(%(partner_ids)s)"
+        )
+        self.env.cr.execute(f"""
+            SELECT NULL::integer AS move_line_id,
+                   NULL::integer AS move_id,
+                   adjustment.adjustment_id,
+                   adjustment.partner_id,
+                   adjustment.plan_id,
+                   adjustment.company_id,
+                   adjustment.currency_id,
+                   adjustment.date,
+                   'adjustment' AS entry_type,
+                   adjustment.commission AS amount
+              FROM ({query}) adjustment
+        """, {'adjustment_ids': list(adjustment_ids), 'partner_ids': list(partner_ids)})
+        return self.env.cr.dictfetchall()
+
+    @api.model
+    def _read_current_balances(self, move_ids, adjustment_ids, partner_ids):
+        """Return the ledger balance per ``(move_line_id, adjustment_id, partner_id)`` in the synced scope."""
+        self.env.cr.execute("""
+            SELECT move_line_id, adjustment_id, partner_id,
+                   (array_agg(plan_id ORDER BY id DESC))[1] AS plan_id,
+                   MIN(move_id) AS move_id, MIN(company_id) AS company_id, MIN(currency_id) AS currency_id,
+                   SUM(amount) AS amount
+              FROM sale_commission_partner_ledger
+             WHERE move_id = ANY(%(move_ids)s)
+                OR adjustment_id = ANY(%(adjustment_ids)s)
+                OR (adjustment_id IS NOT NULL AND partner_id = ANY(%(partner_ids)s))
+             GROUP BY move_line_id, adjustment_id, partner_id
+        """, {'move_ids': list(move_ids), 'adjustment_ids': list(adjustment_ids), 'partner_ids': list(partner_ids)})
+        balances = {}
+        for row in self.env.cr.dictfetchall():
+            row['amount'] = float(row['amount'] or 0.0)
+            balances[row['move_line_id'], row['adjustment_id'], row['partner_id']] = row
+        return balances
@@ -0,0 +1,53 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import time
+
+from odoo import api, models
+from odoo.tools import str2bool
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleCommissionPartnerMaintenance(models.AbstractModel):
+    """Scheduled consistency checks of partner commission data.
+
+    Invoice lines that missed their commission lock are only reported, unless
+    the ``sale_commission_partner.maintenance_fix_locks`` system parameter is
+    set: they are then locked with the values the report shows for them today.
+    """
+    _name = 'sale.commission.partner.maintenance'
+    _description = "Partner Commission Maintenance"
+
+    @api.model
+    def _get_maintenance_steps(self):
+        """Return ``(label, method)`` pairs; each method returns the number of affected records."""
+        Move = self.env['account.move']
+        fix_locks = str2bool(self.env['ir.config_parameter'].sudo().get_param(
+            'sale_commission_partner.maintenance_fix_locks', 'False'
+        ), False)
+        return [
+            ("orphan agent assignments removed", self.env['sale.commission.plan.partner']._cleanup_orphan_records),
+            ("stale summary invoices refreshed", self.env['sale.commission.partner.summary']._refresh_stale),
+            ("missing commission locks fixed", Move._fix_missing_partner_commission_locks)
+            if fix_locks else
+            ("invoice lines missing their commission lock", Move._count_missing_partner_commission_locks),
+            ("commission locks on unposted invoices", Move._count_stale_partner_commission_locks),
+        ]
+
+    @api.model
+    def _cron_run_maintenance(self):
+        results = {}
+        for label, step in self._get_maintenance_steps():
+            started = time.monotonic()
+            try:
+                with self.env.cr.savepoint():
+                    results[label] = step()
+            except Exception:
+                _logger.exception("Partner commission maintenance: %s failed", label)
+                continue
+            _logger.info(
+                "Partner commission maintenance: %s: %s (%.2fs)",
+                label, results[label], time.monotonic() - started,
+            )
+        return results
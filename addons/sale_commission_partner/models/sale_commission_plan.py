@@ -29,6 +29,16 @@ class SaleCommissionPlan(models.Model):
         store=True,
         readonly=False,
     )
+    effective_company_ids = fields.Many2many(
+        'res.company',
+        'sale_commission_plan_effective_company_rel',
+        'plan_id',
+        'company_id',
+        string='Effective Companies',
+        compute='_compute_effective_company_ids',
+        store=True,
+        help="Companies where this plan applies, falling back on its company. Joined by the commission report.",
+    )
 
     @api.depends('company_ids')
     def _compute_company_id(self):
@@ -38,6 +48,11 @@ class SaleCommissionPlan(models.Model):
             else:
                 plan.company_id = False
 
+    @api.depends('company_ids', 'company_id')
+    def _compute_effective_company_ids(self):
+        for plan in self:
+            plan.effective_company_ids = plan.company_ids or plan.company_id
+
     def _inverse_company_id(self):
         for plan in self:
             if plan.company_id:
@@ -79,7 +94,20 @@ class SaleCommissionPlan(models.Model):
         if 'company_id' in vals or 'company_ids' in vals:
             vals = dict(vals)
             self._prepare_company_vals(vals)
-        return super().write(vals)
+        res = super().write(vals)
+        if any(field in vals for field in ('state', 'company_ids', 'achievement_ids')):
+            self._queue_partner_commission_summary_refresh()
+        if any(field in vals for field in ('state', 'active', 'company_ids', 'company_id', 'achievement_ids', 'partner_ids')):
+            self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return res
+
+    def unlink(self):
+        self._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return super().unlink()
+
+    def _queue_partner_commission_summary_refresh(self):
+        self.env['sale.commission.partner.summary']._queue_refresh(partner_ids=self.partner_ids.partner_id.ids)
 
     @api.constrains('team_id', 'user_type')
     def _constrains_team_id(self):
@@ -124,11 +152,7 @@ class SaleCommissionPlan(models.Model):
         }
 
     def action_cleanup_orphan_agents(self):
-        orphans = self.env['sale.commission.plan.partner'].search([
-            ('plan_id', 'in', self.ids),
-        ]).filtered(lambda record: not record.partner_id.exists())
-        removed = len(orphans)
-        orphans.unlink()
+        removed = self.env['sale.commission.plan.partner']._cleanup_orphan_records(plan_ids=self.ids)
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
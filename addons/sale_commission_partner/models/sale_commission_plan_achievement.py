@@ -0,0 +1,44 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, models
+from odoo.tools.sql import create_index
+
+
+class SaleCommissionPlanAchievement(models.Model):
+    _inherit = 'sale.commission.plan.achievement'
+
+    def init(self):
+        super().init()
+        # rule lookup of the report, per plan and product or category
+        create_index(
+            self.env.cr,
+            'sale_commission_plan_achievement_plan_product_idx',
+            self._table,
+            ['plan_id', 'product_id', 'product_categ_id'],
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        rules = super().create(vals_list)
+        rules.plan_id._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return rules
+
+    def write(self, vals):
+        if not any(field in vals for field in self._get_partner_commission_index_fields()):
+            return super().write(vals)
+        plans = self.plan_id
+        res = super().write(vals)
+        (plans | self.plan_id)._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return res
+
+    def unlink(self):
+        self.plan_id._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return super().unlink()
+
+    @api.model
+    def _get_partner_commission_index_fields(self):
+        """Rule fields read by the partner commissions."""
+        return ('plan_id', 'product_id', 'product_categ_id', 'type', 'rate')
@@ -1,7 +1,14 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+
+from psycopg2 import errors as pgerrors
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
 
 
 class SaleCommissionPlanPartner(models.Model):
@@ -17,47 +24,174 @@ class SaleCommissionPlanPartner(models.Model):
     date_to = fields.Date("To")
     name = fields.Char(compute='_compute_name', store=True)
 
+    _date_check = models.Constraint(
+        'CHECK(date_to IS NULL OR date_from <= date_to)',
+        "The start date must be before the end date.",
+    )
+    _partner_period_excl = models.Constraint(
+        """EXCLUDE USING GIST (
+            int4range(partner_id, partner_id, '[]') WITH =,
+            daterange(date_from, date_to, '[]') WITH &&
+        )""",
+        "The partner is already assigned to a plan for this period.",
+    )
+
+    def init(self):
+        # version of the cached commission index, see the mixin
+        self.env.cr.execute("""
+            CREATE SEQUENCE IF NOT EXISTS sale_commission_partner_index_version_seq;
+            CREATE TABLE IF NOT EXISTS sale_commission_partner_index_version (version bigint NOT NULL);
+            INSERT INTO sale_commission_partner_index_version (version)
+            SELECT nextval('sale_commission_partner_index_version_seq')
+             WHERE NOT EXISTS (SELECT 1 FROM sale_commission_partner_index_version);
+        """)
+        # agent lookup of the report and of the commission snapshots, by agent and document date
+        create_index(
+            self.env.cr,
+            'sale_commission_plan_partner_partner_dates_idx',
+            self._table,
+            ['partner_id', 'date_from', 'date_to'],
+        )
+
     @api.depends('partner_id', 'plan_id')
     def _compute_name(self):
-        for record in self:
-            partner_name = record.partner_id.display_name if record.partner_id.exists() else _("Deleted Partner")
-            plan_name = record.plan_id.name or ''
-            record.name = f"{partner_name} ({plan_name})"
+        for record, name in zip(self, self._get_assignment_names()):
+            record.name = name
 
     @api.depends('partner_id', 'plan_id')
     def _compute_display_name(self):
+        for record, name in zip(self, self._get_assignment_names()):
+            record.display_name = name
+
+    def _get_assignment_names(self):
+        existing_partners = self.partner_id.exists()
+        names = []
         for record in self:
-            partner_name = record.partner_id.display_name if record.partner_id.exists() else _("Deleted Partner")
+            partner_name = record.partner_id.display_name if record.partner_id in existing_partners else _("Deleted Partner")
             plan_name = record.plan_id.name or ''
-            record.display_name = f"{partner_name} ({plan_name})"
+            names.append(f"{partner_name} ({plan_name})")
+        return names
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        with self._raise_period_overlap():
+            plan_partners = super().create(vals_list)
+        plan_partners._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return plan_partners
+
+    def write(self, vals):
+        if not any(field in vals for field in ('plan_id', 'partner_id', 'date_from', 'date_to')):
+            return super().write(vals)
+        self._queue_partner_commission_summary_refresh()
+        if any(field in vals for field in ('partner_id', 'date_from', 'date_to')):
+            with self._raise_period_overlap():
+                res = super().write(vals)
+                self.flush_recordset(['partner_id', 'date_from', 'date_to'])
+        else:
+            res = super().write(vals)
+        self._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return res
 
     @api.model
-    def _cleanup_orphan_records(self):
-        orphans = self.search([]).filtered(lambda record: not record.partner_id.exists())
-        orphans.unlink()
-        return len(orphans)
-
-    def _check_plan_partner_overlap(self, mode):
-        """ Check if the partner is already assigned to a plan for the same period. """
-        for plan_partner in self:
-            domain = [
-                ('partner_id', '=', plan_partner.partner_id.id),
-                ('id', '!=', plan_partner.id),
-                ('date_from', '<=', plan_partner.date_to or fields.Date.today()),
-                '|',
-                ('date_to', '=', False),
-                ('date_to', '>=', plan_partner.date_from),
-            ]
-            if self.search_count(domain):
-                raise ValidationError(_("The partner is already assigned to a plan for this period."))
-
-    @api.constrains('date_from', 'date_to')
-    def _constrains_date(self):
-        for plan_partner in self:
-            if plan_partner.date_to and plan_partner.date_from > plan_partner.date_to:
+    def _bulk_assign(self, plan, assignments):
+        """Assign many agents to ``plan`` at once.
+
+        :param assignments: list of ``(partner_id, date_from, date_to)`` tuples,
+            ``date_to`` being ``False`` for an open-ended period
+        :return: the created assignments
+        """
+        if not assignments:
+            return self
+        self._check_bulk_assignments(assignments)
+        return self.create([{
+            'plan_id': plan.id,
+            'partner_id': partner_id,
+            'date_from': date_from,
+            'date_to': date_to or False,
+        } for partner_id, date_from, date_to in assignments])
+
+    @api.model
+    def _check_bulk_assignments(self, assignments):
+        """Validate a batch of assignments with a single query, reporting every offending agent."""
+        periods_by_partner = defaultdict(list)
+        for partner_id, date_from, date_to in assignments:
+            if date_to and date_from > date_to:
                 raise ValidationError(_("The start date must be before the end date."))
-            plan_partner._check_plan_partner_overlap('date')
+            periods_by_partner[partner_id].append((date_from, date_to or date.max))
+        overlapping_ids = set()
+        for partner_id, periods in periods_by_partner.items():
+            periods.sort()
+            if any(following[0] <= previous[1] for previous, following in zip(periods, periods[1:])):
+                overlapping_ids.add(partner_id)
+
+        self.flush_model(['partner_id', 'date_from', 'date_to'])
+        self.env.cr.execute("""
+            SELECT new.partner_id, partner.id IS NULL
+              FROM unnest(%s::int[], %s::date[], %s::date[]) AS new(partner_id, date_from, date_to)
+         LEFT JOIN res_partner partner ON partner.id = new.partner_id
+             WHERE partner.id IS NULL
+                OR EXISTS (
+                       SELECT 1
+                         FROM sale_commission_plan_partner plan_partner
+                        WHERE plan_partner.partner_id = new.partner_id
+                          AND daterange(plan_partner.date_from, plan_partner.date_to, '[]')
+                              && daterange(new.date_from, new.date_to, '[]')
+                   )
+        """, [
+            [partner_id for partner_id, _date_from, _date_to in assignments],
+            [date_from for _partner_id, date_from, _date_to in assignments],
+            [date_to or None for _partner_id, _date_from, date_to in assignments],
+        ])
+        missing_ids = set()
+        for partner_id, missing in self.env.cr.fetchall():
+            (missing_ids if missing else overlapping_ids).add(partner_id)
+        if missing_ids:
+            raise ValidationError(_("These agents do not exist: %s", ", ".join(map(str, sorted(missing_ids)))))
+        if overlapping_ids:
+            names = self.env['res.partner'].browse(sorted(overlapping_ids)).mapped('display_name')
+            raise ValidationError(_(
+                "These agents are already assigned to a plan for this period: %(names)s%(more)s",
+                names=", ".join(names[:20]),
+                more=_(" and %s more", len(names) - 20) if len(names) > 20 else "",
+            ))
 
-    @api.constrains('partner_id', 'plan_id')
-    def _constrains_partner_id(self):
-        self._check_plan_partner_overlap('partner')
+    @contextmanager
+    def _raise_period_overlap(self):
+        """Turn violations of the period constraints into a ``ValidationError``."""
+        try:
+            with self.env.cr.savepoint(flush=False):
+                yield
+        except pgerrors.ExclusionViolation:
+            raise ValidationError(_("The partner is already assigned to a plan for this period.")) from None
+        except pgerrors.CheckViolation as e:
+            if e.diag.constraint_name != f'{self._table}_date_check':
+                raise
+            raise ValidationError(_("The start date must be before the end date.")) from None
+
+    def unlink(self):
+        self._queue_partner_commission_summary_refresh()
+        self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return super().unlink()
+
+    def _queue_partner_commission_summary_refresh(self):
+        self.env['sale.commission.partner.summary']._queue_refresh(partner_ids=self.partner_id.ids)
+
+    @api.model
+    def _cleanup_orphan_records(self, plan_ids=None):
+        """Delete assignments whose agent no longer exists, optionally only for ``plan_ids``."""
+        self.flush_model()
+        plan_filter = "AND plan_partner.plan_id = ANY(%(plan_ids)s)" if plan_ids is not None else ""
+        self.env.cr.execute(f"""
+            DELETE FROM sale_commission_plan_partner plan_partner
+             WHERE NOT EXISTS (
+                 SELECT 1 FROM res_partner partner WHERE partner.id = plan_partner.partner_id
+             )
+             {plan_filter}
+        """, {'plan_ids': list(plan_ids or ())})
+        count = self.env.cr.rowcount
+        if count:
+            self.invalidate_model()
+            self.env['sale.commission.partner.mixin']._invalidate_partner_commission_index()
+        return count
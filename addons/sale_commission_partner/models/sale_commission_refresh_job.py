@@ -0,0 +1,73 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from ast import literal_eval
+
+from odoo import fields, models, _
+
+
+class SaleCommissionRefreshJob(models.Model):
+    """Commission update of sales order lines, run in chunks by a cron.
+
+    Lines are walked by increasing id and each chunk is committed with the job
+    progress, so an interrupted job resumes after the last committed chunk.
+    Lines are read and updated as the requesting user, within the companies
+    allowed when the update was requested. When done, a summary is posted on
+    the plan.
+    """
+    _name = 'sale.commission.refresh.job'
+    _inherit = ['sale.commission.job.mixin']
+    _description = "Partner Commission Update"
+    _order = 'id desc'
+
+    _CRON_XMLID = 'sale_commission_partner.ir_cron_partner_commission_refresh_jobs'
+    _PROGRESS_FIELDS = ('lines_total', 'lines_processed')
+
+    plan_id = fields.Many2one('sale.commission.plan', "Commission Plan", readonly=True, ondelete='cascade')
+    domain = fields.Char("Lines", required=True, readonly=True, default='[]')
+    include_locked = fields.Boolean("Include confirmed order lines", readonly=True)
+    lines_total = fields.Integer("Lines to Process", readonly=True)
+    lines_processed = fields.Integer("Lines Processed", readonly=True)
+    lines_updated = fields.Integer("Lines Updated", readonly=True)
+    last_line_id = fields.Integer("Last Processed Line", readonly=True)
+
+    def _get_line_domain(self):
+        self.ensure_one()
+        return literal_eval(self.domain)
+
+    def _prepare_start_values(self):
+        return {'lines_total': self._as_requester('sale.order.line').search_count(self._get_line_domain())}
+
+    def _get_next_chunk(self):
+        return self._as_requester('sale.order.line').search(
+            [*self._get_line_domain(), ('id', '>', self.last_line_id)], order='id', limit=self._CHUNK_SIZE,
+        )
+
+    def _process_chunk(self, lines):
+        updated = lines.refresh_partner_commission(force=self.include_locked)
+        return {
+            'last_line_id': lines[-1].id,
+            'lines_processed': self.lines_processed + len(lines),
+            'lines_updated': self.lines_updated + updated,
+        }
+
+    def _finish(self):
+        super()._finish()
+        self._post_summary()
+
+    def _fail(self, error):
+        super()._fail(error)
+        self._post_summary()
+
+    def _post_summary(self):
+        for job in self.filtered('plan_id'):
+            if job.state == 'done':
+                body = _(
+                    "Commission update finished: %(updated)s of %(processed)s sales order line(s) updated.",
+                    updated=job.lines_updated, processed=job.lines_processed,
+                )
+            else:
+                body = _(
+                    "Commission update failed after %(processed)s sales order line(s): %(error)s",
+                    processed=job.lines_processed, error=job.last_error,
+                )
+            job.plan_id.message_post(body=body)
@@ -1,6 +1,7 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 from odoo import models, fields, api
+from ..profiling import profiled
 
 
 class SaleOrder(models.Model):
@@ -18,6 +19,50 @@ class SaleOrder(models.Model):
         self.mapped('order_line')._lock_partner_commission_preview()
         return res
 
+    @api.model
+    def get_partner_commission_preview(self, lines, date_order=False, company_id=False, currency_id=False):
+        """Return the commission of in-progress order lines, without writing anything.
+
+        :param lines: list of dicts with ``product_id``, ``product_uom_qty``,
+            ``price_unit``, ``agent_id`` and optionally ``discount`` and ``purchase_price``
+        :return: ``{'lines': [{'commission_amount', 'commission_rate', 'commission_rule_type',
+            'commission_plan_id'}, ...], 'total': float}``, lines in the given order
+        """
+        # the plans are read with sudo from the cached index: only users who
+        # may edit orders get to see them
+        self.check_access('write')
+        company = self.env['res.company'].browse(company_id) if company_id else self.env.company
+        currency = self.env['res.currency'].browse(currency_id) if currency_id else company.currency_id
+        reference_date = fields.Datetime.to_datetime(date_order).date() if date_order else fields.Date.context_today(self)
+        Product = self.env['product.product'].with_company(company)
+        products = {product.id: product for product in Product.browse({line['product_id'] for line in lines if line.get('product_id')})}
+        entries = []
+        for line in lines:
+            quantity = line.get('product_uom_qty') or 0.0
+            price_unit = line.get('price_unit') or 0.0
+            discount = line.get('discount') or 0.0
+            entries.append({
+                'agent_id': line.get('agent_id') or False,
+                'product': products.get(line.get('product_id'), Product),
+                'price_subtotal': quantity * price_unit * (1 - discount / 100.0),
+                'quantity': quantity,
+                'purchase_price': line.get('purchase_price'),
+            })
+        previews = self.env['sale.order.line']._preview_partner_commissions(entries, reference_date, company)
+        result_lines = []
+        for preview in previews:
+            preview = preview or {'commission_plan_id': False, 'commission_rule_type': False, 'commission_rate': 0.0, 'commission_amount': 0.0}
+            result_lines.append({
+                'commission_plan_id': preview['commission_plan_id'],
+                'commission_rule_type': preview['commission_rule_type'],
+                'commission_rate': preview['commission_rate'],
+                'commission_amount': currency.round(preview['commission_amount']),
+            })
+        return {
+            'lines': result_lines,
+            'total': currency.round(sum(line['commission_amount'] for line in result_lines)),
+        }
+
 
 class SaleOrderLine(models.Model):
     _inherit = ['sale.order.line', 'sale.commission.partner.mixin']
@@ -60,41 +105,38 @@ class SaleOrderLine(models.Model):
         readonly=True,
     )
 
+    def write(self, vals):
+        res = super().write(vals)
+        if 'purchase_price' in vals:
+            # margin rules of the invoiced lines read the cost of their order line
+            self.env['sale.commission.partner.summary']._queue_refresh_unlocked_lines(
+                [('sale_line_ids', 'in', self.ids)]
+            )
+        return res
+
     @api.depends('agent_id', 'product_id', 'price_subtotal', 'product_uom_qty', 'purchase_price', 'commission_locked')
     def _compute_commission_amount(self):
-        for line in self:
-            if line.commission_locked:
-                continue
-            if not line.agent_id or not line.product_id:
-                line.commission_amount = 0.0
-                continue
-
-            reference_date = line.order_id.date_order.date() if line.order_id.date_order else fields.Date.context_today(line)
-            snapshot = line._get_partner_commission_snapshot(
-                line.agent_id,
-                line.product_id,
-                reference_date,
-                price_subtotal=line.price_subtotal,
-                quantity=line.product_uom_qty,
-                purchase_price=line.purchase_price,
-                standard_price=line.product_id.standard_price,
-                company=line.company_id,
-            )
+        lines = self.filtered(lambda line: not line.commission_locked)
+        for line, snapshot in zip(lines, lines._get_partner_commission_snapshots_values()):
             line.commission_amount = snapshot['commission_amount'] if snapshot else 0.0
 
+    def _get_partner_commission_snapshots_values(self):
+        """Return the commission snapshot of each line, resolved for all lines at once."""
+        return self._get_partner_commission_snapshots([{
+            'agent': line.agent_id,
+            'product': line.product_id,
+            'reference_date': line.order_id.date_order.date() if line.order_id.date_order else fields.Date.context_today(line),
+            'price_subtotal': line.price_subtotal,
+            'quantity': line.product_uom_qty,
+            'purchase_price': line.purchase_price,
+            'standard_price': line.product_id.standard_price,
+            'company': line.company_id,
+        } for line in self])
+
+    @profiled('lock_order_lines')
     def _lock_partner_commission_preview(self):
-        for line in self.filtered(lambda sol: sol.agent_id and not sol.commission_locked):
-            reference_date = line.order_id.date_order.date() if line.order_id.date_order else fields.Date.context_today(line)
-            snapshot = line._get_partner_commission_snapshot(
-                line.agent_id,
-                line.product_id,
-                reference_date,
-                price_subtotal=line.price_subtotal,
-                quantity=line.product_uom_qty,
-                purchase_price=line.purchase_price,
-                standard_price=line.product_id.standard_price,
-                company=line.company_id,
-            )
+        lines = self.filtered(lambda sol: sol.agent_id and not sol.commission_locked)
+        for line, snapshot in zip(lines, lines._get_partner_commission_snapshots_values()):
             if not snapshot:
                 continue
             snapshot['commission_locked'] = True
@@ -0,0 +1,92 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+"""Opt-in instrumentation of the partner commission hot paths.
+
+Methods decorated with :func:`profiled` record their call count, cumulative
+time and number of SQL queries in the current transaction when profiling is
+enabled, either for the whole database with the
+``sale_commission_partner.profiling`` system parameter, or only for the calls
+made with the ``partner_commission_profile`` context key: the context is
+checked on every call, so the other calls of the same transaction are not
+recorded. The totals are logged as one JSON line when the transaction ends.
+Times and queries are inclusive of nested profiled calls.
+
+When profiling is disabled, a decorated call costs a couple of dictionary lookups.
+"""
+
+import functools
+import json
+import logging
+import time
+
+from odoo.tools import str2bool
+
+_logger = logging.getLogger(__name__)
+
+PROFILE_CONTEXT_KEY = 'partner_commission_profile'
+PROFILE_PARAMETER = 'sale_commission_partner.profiling'
+_STATS_KEY = 'sale_commission_partner.profile'
+
+
+def get_profile_stats(env):
+    """Return ``{label: [calls, seconds, queries]}`` for the current transaction, or ``None`` if disabled for ``env``."""
+    data = env.cr.precommit.data
+    session = data.get(_STATS_KEY)
+    if session is None:
+        enabled = str2bool(env['ir.config_parameter'].sudo().get_param(PROFILE_PARAMETER, 'False'), False)
+        session = data[_STATS_KEY] = (enabled, _start(env) if enabled else None)
+    by_parameter, stats = session
+    if by_parameter:
+        return stats
+    if not env.context.get(PROFILE_CONTEXT_KEY):
+        return None
+    if stats is None:
+        stats = _start(env)
+        data[_STATS_KEY] = (False, stats)
+    return stats
+
+
+def _start(env):
+    stats = {}
+    cr = env.cr
+    started_at = time.perf_counter()
+    emitted = []
+
+    def emit():
+        if emitted or not stats:
+            return
+        emitted.append(True)
+        _logger.info("partner commission profile %s", json.dumps({
+            'db': cr.dbname,
+            'uid': env.uid,
+            'duration': round(time.perf_counter() - started_at, 6),
+            'calls': {
+                label: {'count': count, 'time': round(seconds, 6), 'queries': queries}
+                for label, (count, seconds, queries) in sorted(stats.items())
+            },
+        }, sort_keys=True))
+
+    cr.postcommit.add(emit)
+    cr.postrollback.add(emit)
+    return stats
+
+
+def profiled(label):
+    """Record the calls of the decorated model method under ``label`` when profiling is enabled."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = get_profile_stats(self.env)
+            if stats is None:
+                return method(self, *args, **kwargs)
+            cr = self.env.cr
+            queries = cr.sql_log_count
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                entry = stats.setdefault(label, [0, 0.0, 0])
+                entry[0] += 1
+                entry[1] += time.perf_counter() - started
+                entry[2] += cr.sql_log_count - queries
+        return wrapper
+    return decorator
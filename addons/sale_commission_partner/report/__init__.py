@@ -1 +1,2 @@
 from . import sale_commission_partner_report
+from . import sale_commission_partner_summary
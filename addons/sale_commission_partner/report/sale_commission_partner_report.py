@@ -1,7 +1,18 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import models, api, fields
+import csv
+import io
+import itertools
+import re
+import uuid
+import zipfile
+
+import xlsxwriter
+
+from odoo import models, api, fields, _
 from odoo.tools import SQL
+from ..metrics import REPORT_QUERY_SECONDS
+from ..profiling import profiled
 
 class SaleCommissionPartnerReport(models.Model):
     _name = 'sale.commission.partner.report'
@@ -9,6 +20,9 @@ class SaleCommissionPartnerReport(models.Model):
     _auto = False
     _order = 'date desc'
 
+    _EXPORT_BATCH_SIZE = 2000
+    _XLSX_MAX_ROWS = 1048575  # data rows per sheet, below the header
+
     plan_id = fields.Many2one('sale.commission.plan', "Commission Plan", readonly=True)
     partner_id = fields.Many2one('res.partner', "Agent", readonly=True)
     achieved = fields.Monetary("Achieved", readonly=True, currency_field='currency_id')
@@ -17,6 +31,8 @@ class SaleCommissionPartnerReport(models.Model):
     company_id = fields.Many2one('res.company', string='Company', readonly=True)
     date = fields.Date(string="Date", readonly=True)
     source_id = fields.Reference(selection=[('sale.order', 'Sale Order'), ('account.move', 'Invoice'), ('sale.commission.achievement', 'Adjustment')], string="Source", readonly=True)
+    related_res_model = fields.Char("Source Model", readonly=True)
+    related_res_id = fields.Many2oneReference("Source Record", model_field='related_res_model', readonly=True)
 
     payment_state = fields.Selection(selection=[
         ('not_paid', 'Not Paid'),
@@ -31,71 +47,99 @@ class SaleCommissionPartnerReport(models.Model):
     def _table_query(self):
         return SQL(self._query())
 
+    @api.model
+    @profiled('report_search')
+    def _search(self, domain, *args, **kwargs):
+        # only the rows changed by this transaction are refreshed, read-only
+        # transactions have nothing queued and do not write
+        self.env['sale.commission.partner.summary']._process_refresh_queue(sync_ledger=False)
+        return super()._search(domain, *args, **kwargs)
+
+    @api.model
+    @REPORT_QUERY_SECONDS.time(query='search')
+    def search_fetch(self, domain, field_names=None, offset=0, limit=None, order=None):
+        return super().search_fetch(domain, field_names, offset=offset, limit=limit, order=order)
+
+    @api.model
+    @REPORT_QUERY_SECONDS.time(query='read_group')
+    def _read_group(self, domain, groupby=(), aggregates=(), having=(), offset=0, limit=None, order=None):
+        return super()._read_group(domain, groupby, aggregates, having=having, offset=offset, limit=limit, order=order)
+
     def _query(self):
-        return f"""
+        """Read the report from the incrementally maintained summary table."""
+        return """
             SELECT
-                ROW_NUMBER() OVER () AS id,
-                sub.plan_id,
-                sub.partner_id,
-                sub.achieved,
-                sub.commission,
-                sub.currency_id,
-                sub.company_id,
-                sub.date,
-                sub.source_id,
-                sub.payment_state
-            FROM (
-                {self._query_invoices()}
-                UNION ALL
-                {self._query_adjustments()}
-            ) AS sub
+                summary.id,
+                summary.plan_id,
+                summary.partner_id,
+                summary.achieved,
+                summary.commission,
+                summary.currency_id,
+                summary.company_id,
+                summary.date,
+                summary.source_id,
+                summary.related_res_model,
+                summary.related_res_id,
+                summary.payment_state
+            FROM sale_commission_partner_summary summary
         """
 
+    def _query_commissions(self, invoice_filter='TRUE', adjustment_filter='TRUE'):
+        """Compute commission rows from the source documents.
+
+        Used to (re)fill ``sale.commission.partner.summary``; the filters restrict
+        the invoice and adjustment branches to the rows being refreshed. Row ids
+        are derived from the source row (see ``_row_id_sql``) so they survive
+        refreshes and rebuilds.
+        """
+        return f"""
+            {self._query_invoices(invoice_filter)}
+            UNION ALL
+            {self._query_adjustments(adjustment_filter)}
+        """
+
+    def _row_id_sql(self, id_sql, kind):
+        """Encode a source row id and its kind (0 invoice line, 1/2 adjustment add/reduce, 3 order line)."""
+        return f"({id_sql})::bigint * 4 + {kind}"
+
     def _product_cost_sql(self, product_alias='pp', company_alias='move'):
         """Return unit product cost from company-dependent standard_price storage."""
         return f"COALESCE(({product_alias}.standard_price->>{company_alias}.company_id::text)::numeric, 0)"
 
-    def _plan_company_filter_sql(self, plan_alias='plan', company_alias='move'):
-        """Restrict commission plans to the document company."""
+    def _plan_company_join_sql(self, plan_alias='plan', company_alias='move'):
+        """Join the plan to the document company, if the plan applies to it.
+
+        ``sale_commission_plan_effective_company_rel`` already folds in the
+        ``company_id`` fallback and holds one row per plan and company.
+        """
         return f"""
-            (
-                EXISTS (
-                    SELECT 1
-                    FROM sale_commission_plan_company_rel plan_company_rel
-                    WHERE plan_company_rel.plan_id = {plan_alias}.id
-                      AND plan_company_rel.company_id = {company_alias}.company_id
-                )
-                OR (
-                    NOT EXISTS (
-                        SELECT 1
-                        FROM sale_commission_plan_company_rel plan_company_rel
-                        WHERE plan_company_rel.plan_id = {plan_alias}.id
-                    )
-                    AND {plan_alias}.company_id = {company_alias}.company_id
-                )
-            )
+            JOIN sale_commission_plan_effective_company_rel plan_company
+              ON plan_company.plan_id = {plan_alias}.id
+             AND plan_company.company_id = {company_alias}.company_id
         """
 
-    def _product_category_match_sql(self, category_field='pt.categ_id', rule_alias='rule'):
+    def _product_category_ancestors_sql(self, category_alias='categ'):
+        """Return the category and its parents as an integer array, read from ``parent_path``."""
+        return f"string_to_array(rtrim({category_alias}.parent_path, '/'), '/')::int[]"
+
+    def _product_category_match_sql(self, category_alias='categ', rule_alias='rule'):
         """Match plan rules against the product category or any parent category."""
         return f"""
             (
                 {rule_alias}.product_categ_id IS NULL
-                OR {rule_alias}.product_categ_id IN (
-                    WITH RECURSIVE category_ancestors AS (
-                        SELECT id, parent_id
-                          FROM product_category
-                         WHERE id = {category_field}
-                        UNION ALL
-                        SELECT pc.id, pc.parent_id
-                          FROM product_category pc
-                          JOIN category_ancestors ca ON pc.id = ca.parent_id
-                    )
-                    SELECT id FROM category_ancestors
-                )
+                OR {rule_alias}.product_categ_id = ANY({self._product_category_ancestors_sql(category_alias)})
             )
         """
 
+    def _rule_order_sql(self, category_alias='categ', rule_alias='rule'):
+        """Prefer product rules, then the deepest matching category, then generic rules."""
+        ancestors = self._product_category_ancestors_sql(category_alias)
+        return f"""
+            {rule_alias}.product_id NULLS LAST,
+            array_position({ancestors}, {rule_alias}.product_categ_id) DESC NULLS LAST,
+            {rule_alias}.id
+        """
+
     def _commission_base_sql(self, line_alias='aml', sol_alias='sol', product_alias='pp', company_alias='move'):
         """Return the SQL expression for the commission base amount (unsigned)."""
         unit_cost = self._product_cost_sql(product_alias, company_alias)
@@ -104,7 +148,7 @@ class SaleCommissionPartnerReport(models.Model):
                 WHEN rule.type IN ('margin', 'margin_invoice_paid') THEN
                     {line_alias}.price_subtotal - (
                         COALESCE(
-                            {sol_alias}.purchase_price * {line_alias}.quantity,
+                            NULLIF({sol_alias}.purchase_price, 0) * {line_alias}.quantity,
                             {unit_cost} * {line_alias}.quantity,
                             0
                         )
@@ -116,14 +160,18 @@ class SaleCommissionPartnerReport(models.Model):
             END
         """
 
-    def _signed_commission_sql(self, base_sql, move_alias='move'):
-        """Return achieved and commission SQL columns with refund sign applied."""
-        signed_base = f"""
+    def _signed_base_sql(self, base_sql, move_alias='move'):
+        """Return the commission base with the refund sign applied."""
+        return f"""
             CASE
                 WHEN {move_alias}.move_type = 'out_refund' THEN -({base_sql})
                 ELSE ({base_sql})
             END
         """
+
+    def _signed_commission_sql(self, base_sql, move_alias='move'):
+        """Return achieved and commission SQL columns with refund sign applied."""
+        signed_base = self._signed_base_sql(base_sql, move_alias)
         dynamic_achieved = f"({signed_base})"
         dynamic_commission = f"({signed_base} * COALESCE(rule.rate, 0.0))"
         return f"""
@@ -137,60 +185,127 @@ class SaleCommissionPartnerReport(models.Model):
             END AS commission
         """
 
-    def _query_invoices(self):
-        base_sql = self._commission_base_sql()
-        commission_cols = self._signed_commission_sql(base_sql)
+    def _invoice_line_joins_sql(self, active_plans_only=False, rule_join='LEFT JOIN'):
+        """Join an invoice line ``aml`` of ``move`` to its agent ``plan``, ``rule`` and cost sources.
+
+        The plan already snapshot on the line wins, then the earliest assignment.
+        """
+        active_filter = "AND plan.active" if active_plans_only else ""
         return f"""
-            SELECT
-                COALESCE(aml.commission_plan_id, plan.id) AS plan_id,
-                aml.agent_id AS partner_id,
-                {commission_cols},
-                move.currency_id AS currency_id,
-                move.company_id AS company_id,
-                move.date AS date,
-                concat('account.move,', move.id) AS source_id,
-                move.payment_state AS payment_state
-            FROM account_move_line aml
-            JOIN account_move move ON aml.move_id = move.id
-            JOIN res_partner partner ON aml.agent_id = partner.id
-            JOIN sale_commission_plan_partner plan_partner ON plan_partner.partner_id = partner.id
-            JOIN sale_commission_plan plan ON plan_partner.plan_id = plan.id
+            JOIN LATERAL (
+                SELECT plan.id
+                FROM sale_commission_plan_partner plan_partner
+                JOIN sale_commission_plan plan ON plan_partner.plan_id = plan.id
+                {self._plan_company_join_sql()}
+                WHERE plan_partner.partner_id = aml.agent_id
+                  AND plan.state = 'approved'
+                  {active_filter}
+                  AND move.date BETWEEN plan_partner.date_from AND COALESCE(plan_partner.date_to, '2099-12-31')
+                ORDER BY plan.id IS NOT DISTINCT FROM aml.commission_plan_id DESC, plan_partner.date_from, plan_partner.id
+                LIMIT 1
+            ) plan ON TRUE
             LEFT JOIN product_product pp ON aml.product_id = pp.id
             LEFT JOIN product_template pt ON pp.product_tmpl_id = pt.id
+            LEFT JOIN product_category categ ON pt.categ_id = categ.id
             LEFT JOIN LATERAL (
                 SELECT sol.purchase_price
                 FROM sale_order_line_invoice_rel rel
                 JOIN sale_order_line sol ON sol.id = rel.order_line_id
                 WHERE rel.invoice_line_id = aml.id
+                ORDER BY sol.order_id, sol.sequence, sol.id
                 LIMIT 1
             ) sol ON TRUE
-            LEFT JOIN LATERAL (
+            {rule_join} LATERAL (
                 SELECT rule.rate, rule.type
                 FROM sale_commission_plan_achievement rule
                 WHERE rule.plan_id = plan.id
                   AND (rule.product_id IS NULL OR rule.product_id = aml.product_id)
                   AND {self._product_category_match_sql()}
-                ORDER BY rule.product_id NULLS LAST, rule.product_categ_id NULLS LAST
+                ORDER BY {self._rule_order_sql()}
                 LIMIT 1
             ) rule ON TRUE
+        """
+
+    def _query_invoice_snapshots(self, where='TRUE'):
+        """Compute the commission snapshot of unlocked invoice lines that are due for locking.
+
+        Set-based counterpart of ``account.move.line._lock_partner_commission``:
+        lines without a margin_invoice_paid rule are due once posted, the others
+        once their invoice is paid. Amounts are rounded like the monetary fields.
+        """
+        signed_base = self._signed_base_sql(self._commission_base_sql())
+        return f"""
+            SELECT
+                snapshot.line_id,
+                snapshot.move_id,
+                snapshot.plan_id,
+                snapshot.rule_type,
+                snapshot.rate,
+                ROUND(snapshot.base / snapshot.rounding) * snapshot.rounding AS base,
+                ROUND((snapshot.base * snapshot.rate)::numeric / snapshot.rounding) * snapshot.rounding AS amount
+            FROM (
+                SELECT
+                    aml.id AS line_id,
+                    aml.move_id AS move_id,
+                    plan.id AS plan_id,
+                    rule.type AS rule_type,
+                    COALESCE(rule.rate, 0.0) AS rate,
+                    ({signed_base})::numeric AS base,
+                    currency.rounding AS rounding
+                FROM account_move_line aml
+                JOIN account_move move ON aml.move_id = move.id
+                JOIN res_currency currency ON aml.currency_id = currency.id
+                {self._invoice_line_joins_sql(active_plans_only=True, rule_join='JOIN')}
+                WHERE move.move_type IN ('out_invoice', 'out_refund')
+                  AND move.state = 'posted'
+                  AND aml.display_type = 'product'
+                  AND aml.agent_id IS NOT NULL
+                  AND aml.product_id IS NOT NULL
+                  AND aml.commission_locked IS NOT TRUE
+                  AND (rule.type IS DISTINCT FROM 'margin_invoice_paid' OR move.payment_state = 'paid')
+                  AND ({where})
+            ) snapshot
+        """
+
+    def _query_invoices(self, where='TRUE'):
+        base_sql = self._commission_base_sql()
+        commission_cols = self._signed_commission_sql(base_sql)
+        return f"""
+            SELECT
+                {self._row_id_sql('aml.id', 0)} AS id,
+                COALESCE(aml.commission_plan_id, plan.id) AS plan_id,
+                aml.agent_id AS partner_id,
+                {commission_cols},
+                move.currency_id AS currency_id,
+                move.company_id AS company_id,
+                move.date AS date,
+                concat('account.move,', move.id) AS source_id,
+                'account.move' AS related_res_model,
+                move.id AS related_res_id,
+                move.payment_state AS payment_state,
+                move.id AS move_id,
+                aml.id AS move_line_id,
+                NULL::integer AS adjustment_id
+            FROM account_move_line aml
+            JOIN account_move move ON aml.move_id = move.id
+            {self._invoice_line_joins_sql()}
             WHERE move.move_type IN ('out_invoice', 'out_refund')
               AND move.state = 'posted'
-              AND plan.state = 'approved'
               AND aml.display_type = 'product'
               AND aml.agent_id IS NOT NULL
-              AND {self._plan_company_filter_sql()}
-              AND move.date BETWEEN plan_partner.date_from AND COALESCE(plan_partner.date_to, '2099-12-31')
               AND (
                   aml.commission_locked IS TRUE
                   OR rule.type IS DISTINCT FROM 'margin_invoice_paid'
                   OR move.payment_state = 'paid'
               )
+              AND ({where})
         """
 
     def _query_orders(self):
         base_sql = self._commission_base_sql(line_alias='sol', sol_alias='sol', product_alias='pp', company_alias='order_head')
         return f"""
             SELECT
+                {self._row_id_sql('sol.id', 3)} AS id,
                 plan.id AS plan_id,
                 sol.agent_id AS partner_id,
                 ({base_sql}) AS achieved,
@@ -199,52 +314,202 @@ class SaleCommissionPartnerReport(models.Model):
                 order_head.company_id AS company_id,
                 order_head.date_order::date AS date,
                 concat('sale.order,', order_head.id) AS source_id,
-                NULL AS payment_state
+                'sale.order' AS related_res_model,
+                order_head.id AS related_res_id,
+                NULL AS payment_state,
+                NULL::integer AS move_id,
+                NULL::integer AS move_line_id,
+                NULL::integer AS adjustment_id
             FROM sale_order_line sol
             JOIN sale_order order_head ON sol.order_id = order_head.id
             JOIN res_partner partner ON sol.agent_id = partner.id
             JOIN sale_commission_plan_partner plan_partner ON plan_partner.partner_id = partner.id
             JOIN sale_commission_plan plan ON plan_partner.plan_id = plan.id
+            {self._plan_company_join_sql(plan_alias='plan', company_alias='order_head')}
             LEFT JOIN product_product pp ON sol.product_id = pp.id
             LEFT JOIN product_template pt ON pp.product_tmpl_id = pt.id
+            LEFT JOIN product_category categ ON pt.categ_id = categ.id
             LEFT JOIN LATERAL (
                 SELECT rule.rate, rule.type
                 FROM sale_commission_plan_achievement rule
                 WHERE rule.plan_id = plan.id
                   AND (rule.product_id IS NULL OR rule.product_id = sol.product_id)
                   AND {self._product_category_match_sql()}
-                ORDER BY rule.product_id NULLS LAST, rule.product_categ_id NULLS LAST
+                ORDER BY {self._rule_order_sql()}
                 LIMIT 1
             ) rule ON TRUE
             WHERE order_head.state = 'sale'
               AND plan.state = 'approved'
               AND sol.display_type IS NULL
               AND sol.agent_id IS NOT NULL
-              AND {self._plan_company_filter_sql(plan_alias='plan', company_alias='order_head')}
               AND order_head.date_order::date BETWEEN plan_partner.date_from AND COALESCE(plan_partner.date_to, '2099-12-31')
         """
 
-    def _query_adjustments(self):
+    def _query_adjustments(self, where='TRUE'):
+        """Compute adjustment rows, one branch per side of the adjustment.
+
+        Each branch joins the agent assignment on its own column, so both can
+        use the ``add_partner_id`` / ``reduce_partner_id`` indexes. ``where``
+        may refer to ``sca``, ``plan_partner``, ``partner`` and ``plan``.
+        """
+        # an adjustment adding to and reducing from the same assignment only counts as added
+        reduce_where = f"({where}) AND sca.add_partner_id IS DISTINCT FROM sca.reduce_partner_id"
+        return f"""
+            {self._query_adjustment_side('add_partner_id', 1, 'sca.achieved', where)}
+            UNION ALL
+            {self._query_adjustment_side('reduce_partner_id', 2, '-sca.achieved', reduce_where)}
+        """
+
+    def _query_adjustment_side(self, partner_column, kind, commission_sql, where):
         return f"""
             SELECT
+                {self._row_id_sql('sca.id', kind)} AS id,
                 plan.id AS plan_id,
                 partner.id AS partner_id,
                 0.0 AS achieved,
-                CASE 
-                    WHEN sca.add_partner_id = plan_partner.id THEN sca.achieved 
-                    WHEN sca.reduce_partner_id = plan_partner.id THEN -sca.achieved 
-                    ELSE 0.0
-                END AS commission,
+                {commission_sql} AS commission,
                 sca.currency_id AS currency_id,
                 sca.company_id AS company_id,
                 sca.date AS date,
                 concat('sale.commission.achievement,', sca.id) AS source_id,
-                'paid' AS payment_state
+                'sale.commission.achievement' AS related_res_model,
+                sca.id AS related_res_id,
+                'paid' AS payment_state,
+                NULL::integer AS move_id,
+                NULL::integer AS move_line_id,
+                sca.id AS adjustment_id
             FROM sale_commission_achievement sca
-            JOIN sale_commission_plan_partner plan_partner ON (sca.add_partner_id = plan_partner.id OR sca.reduce_partner_id = plan_partner.id)
+            JOIN sale_commission_plan_partner plan_partner ON plan_partner.id = sca.{partner_column}
             JOIN res_partner partner ON plan_partner.partner_id = partner.id
             JOIN sale_commission_plan plan ON plan_partner.plan_id = plan.id
-            WHERE (sca.add_partner_id IS NOT NULL OR sca.reduce_partner_id IS NOT NULL)
-              AND plan.state = 'approved'
-              AND {self._plan_company_filter_sql(plan_alias='plan', company_alias='sca')}
+            {self._plan_company_join_sql(plan_alias='plan', company_alias='sca')}
+            WHERE plan.state = 'approved'
+              AND ({where})
+        """
+
+    # ------------------------------------------------------------
+    # Streaming export
+    # ------------------------------------------------------------
+
+    def _get_export_headers(self):
+        return [
+            _("Agent"), _("Agent Reference"), _("Commission Plan"), _("Date"), _("Source"),
+            _("Company"), _("Currency"), _("Achieved"), _("Commission"), _("Payment Status"),
+        ]
+
+    @api.model
+    def _iter_export_rows(self, domain):
+        """Yield ``(partner_id, partner_name, row)`` for the report lines matching ``domain``, grouped by agent.
+
+        Lines are read through a server-side cursor, ``_EXPORT_BATCH_SIZE`` at a
+        time, so the export never holds the whole report in memory.
         """
+        query = self._search(domain)
+        report = query.table
+        query.add_join('JOIN', 'export_partner', 'res_partner', SQL(
+            "export_partner.id = %s", SQL.identifier(report, 'partner_id'),
+        ))
+        query.add_join('LEFT JOIN', 'export_move', 'account_move', SQL(
+            "%s = 'account.move' AND export_move.id = %s",
+            SQL.identifier(report, 'related_res_model'), SQL.identifier(report, 'related_res_id'),
+        ))
+        query.add_join('LEFT JOIN', 'export_order', 'sale_order', SQL(
+            "%s = 'sale.order' AND export_order.id = %s",
+            SQL.identifier(report, 'related_res_model'), SQL.identifier(report, 'related_res_id'),
+        ))
+        query.order = SQL(
+            "%s, %s, %s",
+            SQL.identifier(report, 'partner_id'), SQL.identifier(report, 'date'), SQL.identifier(report, 'id'),
+        )
+        select = query.select(
+            SQL.identifier(report, 'partner_id'),
+            SQL("export_partner.name"),
+            SQL("export_partner.ref"),
+            SQL.identifier(report, 'plan_id'),
+            SQL.identifier(report, 'date'),
+            SQL("COALESCE(export_move.name, export_order.name, %s)", _("Adjustment")),
+            SQL.identifier(report, 'company_id'),
+            SQL.identifier(report, 'currency_id'),
+            SQL.identifier(report, 'achieved'),
+            SQL.identifier(report, 'commission'),
+            SQL.identifier(report, 'payment_state'),
+        )
+
+        names = {
+            model: {}
+            for model in ('sale.commission.plan', 'res.company', 'res.currency')
+        }
+
+        def display_name(model, record_id):
+            if record_id not in names[model]:
+                names[model][record_id] = self.env[model].browse(record_id).display_name if record_id else ''
+            return names[model][record_id]
+
+        payment_states = dict(self._fields['payment_state']._description_selection(self.env))
+        cr = self.env.cr
+        cursor = SQL.identifier(f'commission_export_{uuid.uuid4().hex}')
+        cr.execute(SQL("DECLARE %s NO SCROLL CURSOR FOR %s", cursor, select))
+        try:
+            while True:
+                cr.execute(SQL("FETCH FORWARD %s FROM %s", self._EXPORT_BATCH_SIZE, cursor))
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                for partner_id, partner_name, ref, plan_id, date, source, company_id, currency_id, achieved, commission, payment_state in rows:
+                    yield partner_id, partner_name, [
+                        partner_name, ref or '', display_name('sale.commission.plan', plan_id), date, source,
+                        display_name('res.company', company_id), display_name('res.currency', currency_id),
+                        float(achieved or 0.0), float(commission or 0.0), payment_states.get(payment_state, ''),
+                    ]
+        finally:
+            cr.execute(SQL("CLOSE %s", cursor))
+
+    @api.model
+    def _write_export(self, fileobj, domain, file_format='csv', per_agent=False):
+        """Write the report lines matching ``domain`` to the binary ``fileobj``, in one pass.
+
+        :param file_format: ``'csv'`` or ``'xlsx'``
+        :param per_agent: write a zip archive holding one statement file per agent
+        :return: ``(filename, mimetype)`` of the written file
+        """
+        rows = self._iter_export_rows(domain)
+        if not per_agent:
+            self._write_export_file(fileobj, (row for _partner_id, _name, row in rows), file_format)
+            mimetype = 'text/csv' if file_format == 'csv' else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            return f'partner_commissions.{file_format}', mimetype
+
+        used_names = set()
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for (partner_id, partner_name), agent_rows in itertools.groupby(rows, key=lambda row: row[:2]):
+                name = re.sub(r'[^\w\- ]+', '_', partner_name or '').strip() or str(partner_id)
+                if name in used_names:
+                    name = f'{name} ({partner_id})'
+                used_names.add(name)
+                with archive.open(f'{name}.{file_format}', 'w', force_zip64=True) as member:
+                    self._write_export_file(member, (row for _partner_id, _name, row in agent_rows), file_format)
+        return 'partner_commission_statements.zip', 'application/zip'
+
+    @api.model
+    def _write_export_file(self, fileobj, rows, file_format):
+        headers = self._get_export_headers()
+        if file_format == 'csv':
+            text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=True)
+            writer = csv.writer(text)
+            writer.writerow(headers)
+            writer.writerows(rows)
+            text.detach()
+            return
+
+        # constant_memory flushes each row to a temporary file once the next one starts
+        workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+        bold = workbook.add_format({'bold': True})
+        worksheet, row_index = None, self._XLSX_MAX_ROWS
+        for row in rows:
+            if row_index == self._XLSX_MAX_ROWS:
+                worksheet, row_index = workbook.add_worksheet(), 0
+                worksheet.write_row(0, 0, headers, bold)
+            row_index += 1
+            worksheet.write_row(row_index, 0, row)
+        if worksheet is None:
+            workbook.add_worksheet().write_row(0, 0, headers, bold)
+        workbook.close()
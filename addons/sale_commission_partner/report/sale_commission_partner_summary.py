@@ -0,0 +1,182 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+from ..profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleCommissionPartnerSummary(models.Model):
+    """Stored rows behind ``sale.commission.partner.report``.
+
+    One row per commissioned invoice line or adjustment, identified by an id
+    derived from that source row. Rows are refreshed for the documents,
+    adjustments or agents touched in a transaction, right before commit or
+    before the report is read, whichever comes first. The ledger is synced
+    for the same scope at commit only, so reading the report never writes
+    to the ledger.
+    """
+    _name = 'sale.commission.partner.summary'
+    _description = "Partner Commission Summary"
+    _log_access = False
+    _order = 'date desc'
+
+    _REFRESH_QUEUE_KEY = 'sale_commission_partner.summary_refresh'
+    _LEDGER_QUEUE_KEY = 'sale_commission_partner.ledger_sync'
+    _COLUMNS = (
+        'id', 'plan_id', 'partner_id', 'achieved', 'commission', 'currency_id', 'company_id',
+        'date', 'source_id', 'related_res_model', 'related_res_id', 'payment_state',
+        'move_id', 'move_line_id', 'adjustment_id',
+    )
+
+    plan_id = fields.Many2one('sale.commission.plan', "Commission Plan", readonly=True, index=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', "Agent", readonly=True, index=True, ondelete='cascade')
+    achieved = fields.Monetary("Achieved", readonly=True, currency_field='currency_id')
+    commission = fields.Monetary("Commission", readonly=True, currency_field='currency_id')
+    currency_id = fields.Many2one('res.currency', "Currency", readonly=True)
+    company_id = fields.Many2one('res.company', "Company", readonly=True)
+    date = fields.Date("Date", readonly=True, index=True)
+    source_id = fields.Char("Source", readonly=True)
+    related_res_model = fields.Char("Source Model", readonly=True)
+    related_res_id = fields.Many2oneReference("Source Record", model_field='related_res_model', readonly=True)
+    payment_state = fields.Char("Payment Status", readonly=True)
+    move_id = fields.Many2one('account.move', "Invoice", readonly=True, index='btree_not_null', ondelete='cascade')
+    move_line_id = fields.Many2one('account.move.line', "Invoice Line", readonly=True, index='btree_not_null', ondelete='cascade')
+    adjustment_id = fields.Many2one('sale.commission.achievement', "Adjustment", readonly=True, index='btree_not_null', ondelete='cascade')
+
+    def init(self):
+        # Row ids encode their source row (see report._row_id_sql) and need 64 bits.
+        self.env.cr.execute("""
+            SELECT data_type
+              FROM information_schema.columns
+             WHERE table_name = %s AND column_name = 'id'
+        """, [self._table])
+        if self.env.cr.fetchone()[0] != 'bigint':
+            self.env.cr.execute(f'ALTER TABLE "{self._table}" ALTER COLUMN id TYPE bigint')
+        create_index(
+            self.env.cr,
+            'sale_commission_partner_summary_related_res_idx',
+            self._table,
+            ['related_res_id', 'related_res_model'],
+        )
+
+    @api.model
+    def _queue_refresh(self, move_ids=(), adjustment_ids=(), partner_ids=()):
+        """Mark summary rows as stale; they are recomputed once per transaction."""
+        if not (move_ids or adjustment_ids or partner_ids):
+            return
+        precommit = self.env.cr.precommit
+        if self._LEDGER_QUEUE_KEY not in precommit.data:
+            precommit.add(self._process_refresh_queue)
+        for key in (self._REFRESH_QUEUE_KEY, self._LEDGER_QUEUE_KEY):
+            pending = precommit.data.setdefault(key, {
+                'move_ids': set(),
+                'adjustment_ids': set(),
+                'partner_ids': set(),
+            })
+            pending['move_ids'].update(move_ids)
+            pending['adjustment_ids'].update(adjustment_ids)
+            pending['partner_ids'].update(partner_ids)
+
+    @api.model
+    def _queue_refresh_unlocked_lines(self, line_domain):
+        """Queue the invoices whose unlocked agent lines match ``line_domain``.
+
+        Locked lines keep their snapshot, only unlocked lines read the current
+        products, categories and sale order lines.
+        """
+        lines = self.env['account.move.line'].sudo().search_fetch([
+            *line_domain,
+            ('agent_id', '!=', False),
+            ('commission_locked', '=', False),
+            ('display_type', '=', 'product'),
+            ('parent_state', '=', 'posted'),
+        ], ['move_id'])
+        self._queue_refresh(move_ids=lines.move_id.ids)
+
+    @api.model
+    def _process_refresh_queue(self, sync_ledger=True):
+        """Refresh the summary rows queued in this transaction.
+
+        :param sync_ledger: also sync the ledger for the queued scope; the
+            report refreshes its rows without it and leaves the ledger to the
+            commit of the transaction
+        """
+        # Flush first: pending recomputes (e.g. payment_state) may queue more rows.
+        self.env.flush_all()
+        data = self.env.cr.precommit.data
+        pending = data.pop(self._REFRESH_QUEUE_KEY, None)
+        if pending:
+            self._refresh(**pending)
+        if sync_ledger:
+            pending = data.pop(self._LEDGER_QUEUE_KEY, None)
+            if pending:
+                self.env['sale.commission.partner.ledger']._sync(**pending)
+
+    @api.model
+    @profiled('summary_refresh')
+    def _refresh(self, move_ids=(), adjustment_ids=(), partner_ids=()):
+        """Recompute the summary rows of the given invoices, adjustments and agents."""
+        self.env.flush_all()
+        params = {
+            'move_ids': list(move_ids),
+            'adjustment_ids': list(adjustment_ids),
+            'partner_ids': list(partner_ids),
+        }
+        self.env.cr.execute("""
+            DELETE FROM sale_commission_partner_summary
+             WHERE move_id = ANY(%(move_ids)s)
+                OR adjustment_id = ANY(%(adjustment_ids)s)
+                OR partner_id = ANY(%(partner_ids)s)
+        """, params)
+        report = self.env['sale.commission.partner.report']
+        query = report._query_commissions(
+            invoice_filter="move.id = ANY(%(move_ids)s) OR aml.agent_id = ANY(%(partner_ids)s)",
+            adjustment_filter="sca.id = ANY(%(adjustment_ids)s) OR plan_partner.partner_id = ANY(%(partner_ids)s)",
+        )
+        self._insert_rows(query, params)
+
+    @api.model
+    def _refresh_stale(self):
+        """Refresh the rows of invoices whose state or payment state no longer matches the summary.
+
+        :return: number of refreshed invoices
+        """
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT DISTINCT summary.move_id
+              FROM sale_commission_partner_summary summary
+              JOIN account_move move ON move.id = summary.move_id
+             WHERE move.state != 'posted'
+                OR summary.payment_state IS DISTINCT FROM move.payment_state
+        """)
+        move_ids = [move_id for move_id, in self.env.cr.fetchall()]
+        if move_ids:
+            self._refresh(move_ids=move_ids)
+        return len(move_ids)
+
+    @api.model
+    @profiled('summary_rebuild')
+    def _rebuild(self):
+        """Recompute the whole summary from the source documents."""
+        self.check_access('create')
+        self.env.flush_all()
+        self.env.cr.precommit.data.pop(self._REFRESH_QUEUE_KEY, None)
+        self.env.cr.execute("TRUNCATE sale_commission_partner_summary")
+        count = self._insert_rows(self.env['sale.commission.partner.report']._query_commissions())
+        _logger.info("Partner commission summary rebuilt: %s rows", count)
+        return count
+
+    def _insert_rows(self, query, params=None):
+        columns = ', '.join(self._COLUMNS)
+        self.env.cr.execute(f"""
+            INSERT INTO sale_commission_partner_summary ({columns})
+            SELECT {columns} FROM ({query}) AS commission_rows
+        """, params)
+        count = self.env.cr.rowcount
+        self.invalidate_model()
+        self.env['sale.commission.partner.report'].invalidate_model()
+        return count
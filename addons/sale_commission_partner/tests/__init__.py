@@ -1 +1,2 @@
 from . import test_sale_commission_partner
+from . import test_commission_performance
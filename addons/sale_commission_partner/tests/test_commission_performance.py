@@ -0,0 +1,229 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import time
+
+from odoo.tests import common, tagged
+from odoo import fields, Command
+
+
+@tagged('post_install', '-at_install')
+class TestCommissionPerformance(common.TransactionCase):
+    """Query count and latency budgets of the commission pipeline.
+
+    Each operation is measured on a small and a larger batch: the larger batch
+    must not run more queries than the small one, so a per-record query shows
+    up as soon as it is introduced. Payments and bills are reconciled, created
+    and posted per invoice or agent by the accounting: for those operations,
+    each additional record must not cost more queries than it costs the same
+    accounting documents without commissions.
+    """
+
+    _SIZES = (2, 10)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.customer = cls.env['res.partner'].create({'name': 'Performance Customer'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Performance Product',
+            'list_price': 100.0,
+            'standard_price': 50.0,
+            'type': 'service',
+        })
+        cls.commission_product = cls.env['product.product'].create({
+            'name': 'Performance Commission',
+            'type': 'service',
+        })
+        cls.commission_plan = cls.env['sale.commission.plan'].create({
+            'name': 'Performance Agents 10%',
+            'user_type': 'partner',
+            'company_id': cls.env.company.id,
+            'achievement_ids': [Command.create({
+                'type': 'amount_sold',
+                'rate': 0.10,
+            })],
+        })
+        cls.commission_plan.action_approve()
+
+    def _create_agents(self, count):
+        agents = self.env['res.partner'].create([{'name': f'Performance Agent {i}'} for i in range(count)])
+        self.env['sale.commission.plan.partner'].create([{
+            'plan_id': self.commission_plan.id,
+            'partner_id': agent.id,
+            'date_from': fields.Date.today(),
+        } for agent in agents])
+        return agents
+
+    def _create_order(self, agents, agent_lines=True):
+        return self.env['sale.order'].create({
+            'partner_id': self.customer.id,
+            'order_line': [Command.create({
+                'product_id': self.product.id,
+                'product_uom_qty': 1,
+                'price_unit': 100.0,
+                'agent_id': agent.id if agent_lines else False,
+            }) for agent in agents],
+        })
+
+    def _create_invoices(self, agents, agent_lines=True):
+        """Return one posted invoice per agent, without agent lines for the accounting baselines."""
+        orders = self.env['sale.order'].concat(*(self._create_order(agent, agent_lines) for agent in agents))
+        orders.action_confirm()
+        invoices = orders._create_invoices()
+        invoices.action_post()
+        self.env.cr.precommit.run()
+        return invoices
+
+    def _create_vendor_bills(self, agents):
+        """Return one draft bill per agent, as the commission bills but created directly."""
+        return self.env['account.move'].create([{
+            'move_type': 'in_invoice',
+            'partner_id': agent.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_line_ids': [Command.create({
+                'product_id': self.commission_product.id,
+                'quantity': 1,
+                'price_unit': 10.0,
+            })],
+        } for agent in agents])
+
+    def _register_payment(self, invoices):
+        self.env['account.payment.register'].with_context(
+            active_model='account.move',
+            active_ids=invoices.ids,
+        ).create({
+            'payment_date': fields.Date.today(),
+            'group_payment': True,
+        }).action_create_payments()
+
+    def _assert_constant_queries(self, prepare, operation, budget):
+        """Check that ``operation(prepare(n))`` runs as many queries for the larger size, within ``budget`` seconds."""
+        small, large = self._SIZES
+        # first run fills the caches and creates the sequences
+        operation(prepare(small))
+
+        records = prepare(small)
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.env.cr.sql_log_count
+        operation(records)
+        self.env.flush_all()
+        expected = self.env.cr.sql_log_count - start
+
+        records = prepare(large)
+        self.env.flush_all()
+        self.env.invalidate_all()
+        started_at = time.perf_counter()
+        with self.assertQueryCount(expected):
+            operation(records)
+        elapsed = time.perf_counter() - started_at
+        self.assertLess(elapsed, budget, f"{large} records took {elapsed:.2f}s, budget is {budget}s")
+
+    def _measure(self, prepare, operation, count):
+        """Return the queries and seconds of ``operation(prepare(count))``."""
+        records = prepare(count)
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.env.cr.sql_log_count
+        started_at = time.perf_counter()
+        operation(records)
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - start, time.perf_counter() - started_at
+
+    def _assert_baseline_queries(self, prepare, operation, baseline_prepare, baseline_operation, budget):
+        """Check that each record adds no more queries to ``operation`` than to ``baseline_operation``.
+
+        The baseline runs the same accounting without commissions. The larger
+        size of ``operation`` must also run within ``budget`` seconds.
+        """
+        small, large = self._SIZES
+        # first runs fill the caches and create the sequences
+        operation(prepare(small))
+        baseline_operation(baseline_prepare(small))
+
+        small_queries, _elapsed = self._measure(prepare, operation, small)
+        large_queries, elapsed = self._measure(prepare, operation, large)
+        baseline_small_queries, _elapsed = self._measure(baseline_prepare, baseline_operation, small)
+        baseline_large_queries, _elapsed = self._measure(baseline_prepare, baseline_operation, large)
+        per_record = (large_queries - small_queries) / (large - small)
+        baseline_per_record = (baseline_large_queries - baseline_small_queries) / (large - small)
+        self.assertLessEqual(
+            per_record, baseline_per_record,
+            f"Each record costs {per_record} queries, the accounting alone {baseline_per_record}",
+        )
+        self.assertLess(elapsed, budget, f"{large} records took {elapsed:.2f}s, budget is {budget}s")
+
+    def test_confirm_order_with_agent_lines(self):
+        def prepare(count):
+            return self._create_order(self._create_agents(count))
+
+        def operation(order):
+            order.action_confirm()
+
+        self._assert_constant_queries(prepare, operation, budget=5)
+
+    def test_post_invoice_with_agent_lines(self):
+        def prepare(count):
+            order = self._create_order(self._create_agents(count))
+            order.action_confirm()
+            return order._create_invoices()
+
+        def operation(invoice):
+            invoice.action_post()
+            self.env.cr.precommit.run()
+
+        self._assert_constant_queries(prepare, operation, budget=5)
+
+    def test_register_payment_on_invoices(self):
+        def prepare(count):
+            return self._create_invoices(self._create_agents(count))
+
+        def operation(invoices):
+            self._register_payment(invoices)
+            self.env.cr.precommit.run()
+            self.env['sale.commission.partner.event']._cron_process_events()
+
+        def baseline_prepare(count):
+            agents = self._create_agents(count)
+            return self._create_invoices(agents, agent_lines=False), agents
+
+        def baseline_operation(invoices_agents):
+            # paying the invoices, then creating the draft bills of their agents
+            invoices, agents = invoices_agents
+            self._register_payment(invoices)
+            self.env.cr.precommit.run()
+            self._create_vendor_bills(agents)
+
+        self._assert_baseline_queries(prepare, operation, baseline_prepare, baseline_operation, budget=10)
+
+    def test_generate_bills_for_agents(self):
+        def prepare(count):
+            agents = self._create_agents(count)
+            self._create_invoices(agents)
+            return agents
+
+        def operation(agents):
+            self.env['sale.commission.make.bill'].create({
+                'date_from': fields.Date.today(),
+                'date_to': fields.Date.today(),
+                'partner_ids': [Command.set(agents.ids)],
+                'product_id': self.commission_product.id,
+                'auto_post': True,
+            }).action_generate_bills()
+
+        def baseline_operation(agents):
+            self._create_vendor_bills(agents).action_post()
+
+        self._assert_baseline_queries(prepare, operation, self._create_agents, baseline_operation, budget=10)
+
+    def test_open_commission_report(self):
+        def prepare(count):
+            return self._create_invoices(self._create_agents(count))
+
+        def operation(invoices):
+            Report = self.env['sale.commission.partner.report']
+            domain = [('related_res_model', '=', 'account.move'), ('related_res_id', 'in', invoices.ids)]
+            Report.search_read(domain, ['date', 'partner_id', 'plan_id', 'source_id', 'payment_state', 'achieved', 'commission', 'company_id'])
+            Report._read_group(domain, ['partner_id'], ['commission:sum'])
+
+        self._assert_constant_queries(prepare, operation, budget=5)
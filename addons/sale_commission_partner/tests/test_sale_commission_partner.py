@@ -1,7 +1,19 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import base64
+import io
+import json
+import zipfile
+from datetime import timedelta
+from unittest.mock import patch
+
 from odoo.tests import common, tagged
 from odoo import fields, Command
+from odoo.exceptions import AccessError, UserError, ValidationError
+from odoo.tools import SQL
+from odoo.addons.base_metrics.metrics import REGISTRY
+from odoo.addons.sale_commission_partner.metrics import COMMISSION_BILLS, COMMISSION_LOCKS, REPORT_QUERY_SECONDS
+from odoo.addons.sale_commission_partner.profiling import get_profile_stats
 
 @tagged('post_install', '-at_install')
 class TestSaleCommissionPartner(common.TransactionCase):
@@ -42,6 +54,25 @@ class TestSaleCommissionPartner(common.TransactionCase):
             })]
         })
 
+    def _create_invoice(self, agent=None, qty=1, price=100.0):
+        """Return the draft invoice of a confirmed order with one agent line."""
+        so = self.env['sale.order'].create({
+            'partner_id': self.partner_customer.id,
+            'agent_id': (agent or self.partner_agent).id,
+            'order_line': [Command.create({
+                'product_id': self.product.id,
+                'product_uom_qty': qty,
+                'price_unit': price,
+            })],
+        })
+        so.action_confirm()
+        return so._create_invoices()
+
+    def _create_posted_invoice(self, agent=None, qty=1, price=100.0):
+        invoice = self._create_invoice(agent, qty, price)
+        invoice.action_post()
+        return invoice
+
     def test_commission_flow(self):
         # 1. Create Sale Order with Agent
         so = self.env['sale.order'].create({
@@ -135,6 +166,7 @@ class TestSaleCommissionPartner(common.TransactionCase):
             'payment_date': fields.Date.today(),
         })
         payment_register.action_create_payments()
+        self.env['sale.commission.partner.event']._cron_process_events()
         
         # 4. Verify Automatic Bill Generation
         bills_after = self.env['account.move'].search([
@@ -146,6 +178,85 @@ class TestSaleCommissionPartner(common.TransactionCase):
         self.assertAlmostEqual(bills_after.amount_total, 10.0, msg="Bill amount should be 10.0 (10% of 100)")
         self.assertIn("Commission for period", bills_after.invoice_line_ids[0].name, "Bill line should have commission period description")
 
+    def test_batched_bill_generation_on_payment(self):
+        """In commit mode, invoices paid in one transaction give one bill per agent with a line per invoice."""
+        self.env['ir.config_parameter'].sudo().set_param('sale_commission_partner.paid_mode', 'commit')
+        invoices = self.env['account.move']
+        for price in (100.0, 200.0):
+            invoices |= self._create_invoice(price=price)
+        invoices.action_post()
+
+        self.env['account.payment.register'].with_context(
+            active_model='account.move',
+            active_ids=invoices.ids,
+        ).create({'payment_date': fields.Date.today()}).action_create_payments()
+        Bill = self.env['account.move']
+        bill_domain = [('move_type', '=', 'in_invoice'), ('partner_id', '=', self.partner_agent.id)]
+        self.assertFalse(Bill.search(bill_domain), "Batched bills are only created when the transaction commits")
+
+        self.env.cr.precommit.run()
+        bill = Bill.search(bill_domain)
+        self.assertEqual(len(bill), 1)
+        self.assertEqual(len(bill.invoice_line_ids), 2)
+        self.assertAlmostEqual(bill.amount_total, 30.0)
+        self.assertTrue(all(invoices.mapped('commission_bills_generated')))
+
+    def test_paid_invoice_queues_commission_event(self):
+        """Payments only queue commission work; a failing event is retried without touching the payment."""
+        invoice = self._create_posted_invoice()
+        self.env['account.payment.register'].with_context(
+            active_model='account.move',
+            active_ids=invoice.ids,
+        ).create({'payment_date': fields.Date.today()}).action_create_payments()
+        self.assertEqual(invoice.payment_state, 'paid')
+
+        Event = self.env['sale.commission.partner.event']
+        event = Event.search([('move_id', '=', invoice.id)])
+        self.assertEqual(event.state, 'pending')
+        Event._enqueue(invoice)
+        self.assertEqual(Event.search_count([('move_id', '=', invoice.id)]), 1, "Enqueuing must be idempotent")
+        self.assertFalse(invoice.commission_bills_generated)
+
+        with patch.object(type(invoice), '_generate_commission_bills', side_effect=ValueError("boom")):
+            Event._cron_process_events()
+        self.assertEqual(event.state, 'pending')
+        self.assertEqual(event.attempts, 1)
+        self.assertIn("boom", event.last_error)
+        self.assertEqual(invoice.payment_state, 'paid', "A commission failure must not undo the payment")
+
+        event.next_attempt_date = fields.Datetime.now()
+        Event._cron_process_events()
+        self.assertEqual(event.state, 'done')
+        self.assertTrue(invoice.commission_bills_generated)
+
+    def test_paid_transition_queued_again_after_rollback(self):
+        """A payment rolled back by a savepoint, or undone, does not hide the next paid transition."""
+        invoice = self._create_posted_invoice()
+        Event = self.env['sale.commission.partner.event']
+
+        def pay():
+            self.env['account.payment.register'].with_context(
+                active_model='account.move',
+                active_ids=invoice.ids,
+            ).create({'payment_date': fields.Date.today()}).action_create_payments()
+
+        with self.assertRaises(ValueError), self.env.cr.savepoint():
+            pay()
+            raise ValueError("rolled back")
+        self.assertNotEqual(invoice.payment_state, 'paid')
+        self.assertFalse(Event.search([('move_id', '=', invoice.id)]))
+
+        pay()
+        event = Event.search([('move_id', '=', invoice.id)])
+        self.assertEqual(event.state, 'pending')
+        Event._cron_process_events()
+        self.assertEqual(event.state, 'done')
+
+        invoice.line_ids.remove_move_reconcile()
+        self.assertNotEqual(invoice.payment_state, 'paid')
+        pay()
+        self.assertEqual(Event.search([('move_id', '=', invoice.id), ('state', '=', 'pending')]).event_type, 'paid')
+
     def test_margin_invoice_paid_commission_on_invoice(self):
         """Commission on paid invoices must use margin, not subtotal."""
         margin_plan = self.env['sale.commission.plan'].create({
@@ -198,6 +309,7 @@ class TestSaleCommissionPartner(common.TransactionCase):
             active_ids=invoice.ids,
         ).create({'payment_date': fields.Date.today()})
         payment_register.action_create_payments()
+        self.env['sale.commission.partner.event']._cron_process_events()
         self.env.flush_all()
 
         report_paid = self.env['sale.commission.partner.report'].search([
@@ -249,6 +361,352 @@ class TestSaleCommissionPartner(common.TransactionCase):
         so.order_line.invalidate_recordset(['commission_amount'])
         self.assertAlmostEqual(so.order_line.commission_amount, 10.0, msg="Locked SO commission must ignore plan rate changes")
 
+    def test_backfill_shard_resumes_from_checkpoint(self):
+        """A committed backfill records its progress and skips finished shards."""
+        invoice = self._create_posted_invoice()
+        self.commission_plan.achievement_ids.rate = 0.20
+
+        Move = self.env['account.move']
+        with patch.object(type(self.env.cr), 'commit'):
+            processed = Move._backfill_partner_commission_shard(
+                invoice.company_id.id, invoice.id, invoice.id + 1, force=True, commit=True, run='test',
+            )
+            self.assertEqual(processed, 1)
+            checkpoint = self.env['sale.commission.backfill.checkpoint'].search([('run', '=', 'test')])
+            self.assertRecordValues(checkpoint, [{'last_move_id': invoice.id, 'moves_processed': 1, 'done': True}])
+            self.assertAlmostEqual(invoice.invoice_line_ids.filtered('agent_id').commission_amount, 20.0)
+
+            resumed = Move._backfill_partner_commission_shard(
+                invoice.company_id.id, invoice.id, invoice.id + 1, force=True, commit=True, run='test',
+            )
+            self.assertEqual(resumed, 0, "A finished shard must not be processed again")
+
+    def test_sql_commission_lock_matches_python_snapshot(self):
+        """The set-based lock writes the same snapshot as the line-by-line one."""
+        margin_product = self.env['product.product'].create({
+            'name': 'Margin Product',
+            'list_price': 10.0,
+            'standard_price': 3.33,
+            'type': 'service',
+        })
+        self.commission_plan.write({
+            'achievement_ids': [Command.create({
+                'type': 'margin',
+                'product_id': margin_product.id,
+                'rate': 0.075,
+            })],
+        })
+        invoices = self.env['account.move'].create([{
+            'move_type': move_type,
+            'partner_id': self.partner_customer.id,
+            'invoice_line_ids': [
+                Command.create({
+                    'product_id': self.product.id,
+                    'agent_id': self.partner_agent.id,
+                    'quantity': 3,
+                    'price_unit': 33.33,
+                }),
+                Command.create({
+                    'product_id': margin_product.id,
+                    'agent_id': self.partner_agent.id,
+                    'quantity': 7,
+                    'price_unit': 10.01,
+                }),
+            ],
+        } for move_type in ('out_invoice', 'out_refund')])
+        invoices.action_post()
+        fnames = ['commission_locked', 'commission_plan_id', 'commission_rule_type', 'commission_rate', 'commission_base', 'commission_amount']
+        lines = invoices.invoice_line_ids.filtered('agent_id')
+        python_values = lines.read(fnames)
+        self.assertTrue(all(values['commission_locked'] for values in python_values))
+
+        self.assertEqual(invoices._lock_partner_commissions_sql(force=True), 4)
+        self.assertEqual(lines.read(fnames), python_values)
+
+    def test_summary_follows_unlocked_margin_costs(self):
+        """Unlocked margin rows are refreshed when the product cost changes."""
+        margin_product = self.env['product.product'].create({
+            'name': 'Margin Product',
+            'list_price': 10.0,
+            'standard_price': 4.0,
+            'type': 'service',
+        })
+        self.commission_plan.write({
+            'achievement_ids': [Command.create({
+                'type': 'margin',
+                'product_id': margin_product.id,
+                'rate': 0.5,
+            })],
+        })
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_customer.id,
+            'invoice_line_ids': [Command.create({
+                'product_id': margin_product.id,
+                'agent_id': self.partner_agent.id,
+                'quantity': 1,
+                'price_unit': 10.0,
+            })],
+        })
+        invoice.action_post()
+        # lines posted before the module was installed are not locked
+        self.env.cr.execute("UPDATE account_move_line SET commission_locked = FALSE WHERE move_id = %s", [invoice.id])
+        self.env.invalidate_all()
+        self.env['sale.commission.partner.summary']._refresh(move_ids=invoice.ids)
+
+        Report = self.env['sale.commission.partner.report']
+        domain = [('source_id', '=', f'account.move,{invoice.id}')]
+        self.assertAlmostEqual(Report.search(domain).achieved, 6.0)
+        margin_product.standard_price = 7.0
+        self.assertAlmostEqual(Report.search(domain).achieved, 3.0)
+
+    def test_batch_commission_compute_matches_single_snapshot(self):
+        """Order lines resolved together get the same snapshot as when resolved one by one."""
+        special_product = self.env['product.product'].create({'name': 'Special Product', 'type': 'service'})
+        self.commission_plan.write({
+            'achievement_ids': [Command.create({
+                'type': 'qty_sold',
+                'product_id': special_product.id,
+                'rate': 2.0,
+            })],
+        })
+        so = self.env['sale.order'].create({
+            'partner_id': self.partner_customer.id,
+            'agent_id': self.partner_agent.id,
+            'order_line': [
+                Command.create({'product_id': product.id, 'product_uom_qty': 3, 'price_unit': 40.0})
+                for product in (self.product, special_product, self.product)
+            ],
+        })
+        self.assertEqual(so.order_line.mapped('commission_amount'), [12.0, 6.0, 12.0])
+        for line, snapshot in zip(so.order_line, so.order_line._get_partner_commission_snapshots_values()):
+            self.assertEqual(snapshot, line._get_partner_commission_snapshot(
+                line.agent_id,
+                line.product_id,
+                line.order_id.date_order.date(),
+                price_subtotal=line.price_subtotal,
+                quantity=line.product_uom_qty,
+                purchase_price=line.purchase_price,
+                standard_price=line.product_id.standard_price,
+                company=line.company_id,
+            ))
+
+    def test_partner_commission_preview(self):
+        """The preview prices unsaved lines from the cached plans, and sees plan changes."""
+        lines = [
+            {'product_id': self.product.id, 'product_uom_qty': 2, 'price_unit': 100.0, 'discount': 10.0, 'agent_id': self.partner_agent.id},
+            {'product_id': self.product.id, 'product_uom_qty': 1, 'price_unit': 100.0, 'agent_id': False},
+        ]
+        SaleOrder = self.env['sale.order']
+        preview = SaleOrder.get_partner_commission_preview(lines)
+        self.assertEqual([line['commission_amount'] for line in preview['lines']], [18.0, 0.0])
+        self.assertEqual(preview['lines'][0]['commission_plan_id'], self.commission_plan.id)
+        self.assertEqual(preview['total'], 18.0)
+
+        self.commission_plan.achievement_ids.rate = 0.20
+        self.assertEqual(SaleOrder.get_partner_commission_preview(lines)['total'], 36.0)
+
+        def index_version():
+            self.env.cr.execute("SELECT version FROM sale_commission_partner_index_version")
+            return self.env.cr.fetchone()[0]
+
+        version = index_version()
+        self.commission_plan.name = 'Agent 20%'
+        self.assertEqual(index_version(), version, "Changes the index does not read keep the cached index")
+        self.commission_plan.achievement_ids.rate = 0.30
+        self.assertNotEqual(index_version(), version)
+
+        portal_user = self.env['res.users'].create({
+            'login': 'preview_portal_user',
+            'name': 'Preview Portal User',
+            'group_ids': [Command.set(self.env.ref('base.group_portal').ids)],
+        })
+        with self.assertRaises(AccessError):
+            SaleOrder.with_user(portal_user).get_partner_commission_preview(lines)
+
+    def test_plan_partner_periods_cannot_overlap(self):
+        """The database rejects overlapping periods of an agent, with a readable error."""
+        agent = self.env['res.partner'].create({'name': 'Agent Overlap'})
+        today = fields.Date.today()
+        PlanPartner = self.env['sale.commission.plan.partner']
+        first = PlanPartner.create({
+            'plan_id': self.commission_plan.id,
+            'partner_id': agent.id,
+            'date_from': today,
+            'date_to': today + timedelta(days=9),
+        })
+        second = PlanPartner.create({
+            'plan_id': self.commission_plan.id,
+            'partner_id': agent.id,
+            'date_from': today + timedelta(days=10),
+        })
+        with self.assertRaisesRegex(ValidationError, "already assigned"):
+            PlanPartner.create({
+                'plan_id': self.commission_plan.id,
+                'partner_id': agent.id,
+                'date_from': today + timedelta(days=20),
+            })
+        with self.assertRaisesRegex(ValidationError, "already assigned"):
+            first.date_to = today + timedelta(days=10)
+        self.assertEqual(first.date_to, today + timedelta(days=9))
+        self.assertTrue(second.exists())
+
+    def test_bulk_agent_assignment(self):
+        """Agents are assigned in one batch, from a selection or a CSV file."""
+        agents = self.env['res.partner'].create([{'name': f'Agent {i}', 'ref': f'AG{i}'} for i in range(3)])
+        Wizard = self.env['sale.commission.plan.partner.wizard'].with_context(active_ids=self.commission_plan.ids)
+        Wizard.create({'partner_ids': [Command.set(agents[:2].ids)]}).submit()
+        self.assertEqual(self.commission_plan.partner_ids.filtered(lambda pp: pp.partner_id in agents).partner_id, agents[:2])
+
+        csv_file = f"partner_ref,partner_id,date_from,date_to\nAG2,,2030-01-01,2030-06-30\n,{agents[2].id},2030-07-01,\n"
+        Wizard.create({'mode': 'import', 'import_file': base64.b64encode(csv_file.encode())}).submit()
+        periods = self.commission_plan.partner_ids.filtered(lambda pp: pp.partner_id == agents[2]).sorted('date_from')
+        self.assertEqual(periods.mapped('date_to'), [fields.Date.to_date('2030-06-30'), False])
+        self.assertEqual(periods[0].name, f"Agent 2 ({self.commission_plan.name})")
+
+        with self.assertRaisesRegex(ValidationError, "Agent 0"):
+            Wizard.create({'partner_ids': [Command.set(agents.ids)]}).submit()
+
+    def test_commission_maintenance(self):
+        """The maintenance job reports missed locks, fixes them on request, and reports locks left on unposted invoices."""
+        invoice = self._create_posted_invoice()
+        line = invoice.invoice_line_ids.filtered('agent_id')
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE account_move_line SET commission_locked = FALSE WHERE id = %s", [line.id])
+        line.invalidate_recordset(['commission_locked'])
+
+        Maintenance = self.env['sale.commission.partner.maintenance']
+        results = Maintenance._cron_run_maintenance()
+        self.assertEqual(results["invoice lines missing their commission lock"], 1)
+        self.assertFalse(line.commission_locked, "Missed locks are only reported by default")
+
+        self.env['ir.config_parameter'].sudo().set_param('sale_commission_partner.maintenance_fix_locks', 'True')
+        results = Maintenance._cron_run_maintenance()
+        self.assertEqual(results["missing commission locks fixed"], 1)
+        self.assertTrue(line.commission_locked)
+
+        invoice.button_draft()
+        self.assertEqual(Maintenance._cron_run_maintenance()["commission locks on unposted invoices"], 1)
+
+    def test_commission_ledger_bills_each_entry_once(self):
+        """Locked commissions are billed once, whichever billing path runs first."""
+        invoice = self._create_posted_invoice()
+        self.env['sale.commission.partner.summary']._process_refresh_queue()
+        Ledger = self.env['sale.commission.partner.ledger']
+        entry = Ledger.search([('move_id', '=', invoice.id)])
+        self.assertRecordValues(entry, [{'entry_type': 'lock', 'amount': 10.0, 'billed': False}])
+
+        wizard_vals = {
+            'date_from': fields.Date.today(),
+            'date_to': fields.Date.today(),
+            'partner_ids': [Command.set([self.partner_agent.id])],
+            'product_id': self.commission_product.id,
+        }
+        self.env['sale.commission.make.bill'].create(wizard_vals).action_generate_bills()
+        self.assertTrue(entry.billed)
+        self.assertEqual(entry.bill_line_id.move_id.amount_total, 10.0)
+        with self.assertRaises(UserError):
+            self.env['sale.commission.make.bill'].create(wizard_vals).action_generate_bills()
+
+        self.env['account.payment.register'].with_context(
+            active_model='account.move',
+            active_ids=invoice.ids,
+        ).create({'payment_date': fields.Date.today()}).action_create_payments()
+        self.env['sale.commission.partner.event']._cron_process_events()
+        bills = self.env['account.move'].search([('move_type', '=', 'in_invoice'), ('partner_id', '=', self.partner_agent.id)])
+        self.assertEqual(len(bills), 1, "The paid invoice was already billed by the wizard")
+
+        with self.assertRaises(UserError):
+            entry.unlink()
+
+    def test_deleted_commission_bill_releases_ledger_entries(self):
+        """Entries of a deleted or cancelled commission bill are billed again."""
+        invoice = self._create_posted_invoice()
+        self.env['sale.commission.partner.summary']._process_refresh_queue()
+        entry = self.env['sale.commission.partner.ledger'].search([('move_id', '=', invoice.id)])
+        wizard_vals = {
+            'date_from': fields.Date.today(),
+            'date_to': fields.Date.today(),
+            'partner_ids': [Command.set([self.partner_agent.id])],
+            'product_id': self.commission_product.id,
+        }
+        Bill = self.env['account.move']
+
+        bill = Bill.search(self.env['sale.commission.make.bill'].create(wizard_vals).action_generate_bills()['domain'])
+        self.assertTrue(entry.billed)
+        bill.unlink()
+        self.assertFalse(entry.billed, "Deleting the bill releases its entries")
+
+        bill = Bill.search(self.env['sale.commission.make.bill'].create(wizard_vals).action_generate_bills()['domain'])
+        self.assertEqual(entry.bill_line_id.move_id, bill)
+        self.assertAlmostEqual(bill.amount_total, 10.0)
+        bill.button_cancel()
+        self.assertRecordValues(entry, [{'billed': False, 'bill_line_id': False}])
+
+    def test_streaming_commission_export(self):
+        """The report is exported in one pass, flat or as one statement per agent."""
+        second_agent = self.env['res.partner'].create({'name': 'Agent Jones'})
+        second_agent.commission_plan_ids = [Command.create({
+            'plan_id': self.commission_plan.id,
+            'date_from': fields.Date.today(),
+        })]
+        for agent in self.partner_agent | second_agent:
+            self._create_posted_invoice(agent)
+
+        wizard = self.env['sale.commission.partner.export'].create({
+            'date_from': fields.Date.today(),
+            'date_to': fields.Date.today(),
+            'partner_ids': [Command.set((self.partner_agent | second_agent).ids)],
+            'file_format': 'csv',
+        })
+        Report = self.env['sale.commission.partner.report']
+        with patch.object(type(Report), '_EXPORT_BATCH_SIZE', 1), io.BytesIO() as fileobj:
+            filename, _mimetype = wizard._write_export(fileobj)
+            lines = fileobj.getvalue().decode().splitlines()
+        self.assertEqual(filename, 'partner_commissions.csv')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['Agent Smith', 'Agent Jones'], "Lines are grouped by agent")
+        self.assertEqual(lines[1].split(',')[8], '10.0')
+
+        wizard.per_agent = True
+        with io.BytesIO() as fileobj:
+            filename, _mimetype = wizard._write_export(fileobj)
+            with zipfile.ZipFile(fileobj) as archive:
+                self.assertEqual(sorted(archive.namelist()), ['Agent Jones.csv', 'Agent Smith.csv'])
+                self.assertEqual(len(archive.read('Agent Jones.csv').decode().splitlines()), 2)
+        self.assertEqual(filename, 'partner_commission_statements.zip')
+
+    def test_make_bill_background_job(self):
+        """Bills generated by a background run are created and posted per chunk of agents."""
+        second_agent = self.env['res.partner'].create({'name': 'Agent Jones'})
+        second_agent.commission_plan_ids = [Command.create({
+            'plan_id': self.commission_plan.id,
+            'date_from': fields.Date.today(),
+        })]
+        for agent in self.partner_agent | second_agent:
+            self._create_posted_invoice(agent)
+
+        self.env['sale.commission.make.bill'].create({
+            'date_from': fields.Date.today(),
+            'date_to': fields.Date.today(),
+            'partner_ids': [Command.set((self.partner_agent | second_agent).ids)],
+            'product_id': self.commission_product.id,
+            'auto_post': True,
+            'in_background': True,
+        }).action_generate_bills()
+        job = self.env['sale.commission.bill.job'].search([], limit=1)
+        self.assertRecordValues(job, [{'state': 'pending', 'user_id': self.env.uid, 'company_ids': self.env.companies.ids}])
+
+        with patch.object(type(job), '_CHUNK_SIZE', 1), patch.object(type(self.env.cr), 'commit') as commit:
+            job._cron_process_jobs()
+        self.assertEqual(commit.call_count, 2, "Each chunk of agents is committed")
+        self.assertRecordValues(job, [{'state': 'done', 'agents_total': 2, 'agents_processed': 2, 'progress': 100.0}])
+        self.assertEqual(job.bill_ids.partner_id, self.partner_agent | second_agent)
+        self.assertEqual(job.bill_ids.company_id, self.env.company)
+        self.assertEqual(job.bill_ids.create_uid, self.env.user)
+        self.assertEqual(set(job.bill_ids.mapped('state')), {'posted'})
+        self.assertEqual(job.bill_ids.mapped('amount_total'), [10.0, 10.0])
+
     def test_sales_user_can_compute_partner_commission(self):
         """Sales users must read commission plan rules without Sales Administrator rights."""
         sales_user = self.env['res.users'].create({
@@ -354,6 +812,144 @@ class TestSaleCommissionPartner(common.TransactionCase):
         })
         self.assertAlmostEqual(so_company_c.order_line.commission_amount, 0.0)
 
+    def test_plan_effective_companies(self):
+        """The effective companies joined by the report follow the plan companies."""
+        company_b = self.env['res.company'].create({'name': 'Commission Company B'})
+        self.assertEqual(self.commission_plan.effective_company_ids, self.env.company)
+
+        self.commission_plan.company_ids = [Command.set([self.env.company.id, company_b.id])]
+        self.env.flush_all()
+        self.env.cr.execute(
+            "SELECT company_id FROM sale_commission_plan_effective_company_rel WHERE plan_id = %s ORDER BY company_id",
+            [self.commission_plan.id],
+        )
+        self.assertEqual([company_id for company_id, in self.env.cr.fetchall()], sorted([self.env.company.id, company_b.id]))
+        self.assertNotIn('sale_commission_plan_company_rel', self.env['sale.commission.partner.report']._query_commissions())
+
+    def test_report_hot_paths_use_indexes(self):
+        """Reading the report for an agent and refreshing its summary rows go through indexes."""
+        self._create_posted_invoice()
+        self.env.flush_all()
+        Report = self.env['sale.commission.partner.report']
+
+        def seq_scans(query):
+            self.env.cr.execute(SQL("EXPLAIN (FORMAT JSON) %s", query))
+            [explain] = self.env.cr.fetchone()[0]
+            nodes = [explain['Plan']]
+            for node in nodes:
+                nodes.extend(node.get('Plans', ()))
+            return {node.get('Relation Name') for node in nodes if node['Node Type'] == 'Seq Scan'}
+
+        # seeded tables are tiny, so sequential scans would always be cheapest:
+        # disabling them only leaves a sequential scan where no index applies,
+        # and rolling back the savepoint restores the setting
+        with self.env.cr.savepoint(flush=False) as savepoint:
+            self.env.cr.execute("SET LOCAL enable_seqscan = off")
+            read_scans = seq_scans(Report._search([('partner_id', '=', self.partner_agent.id)]).select())
+            refresh_scans = seq_scans(SQL(Report._query_commissions()))
+            savepoint.rollback()
+
+        self.assertNotIn('sale_commission_partner_summary', read_scans, "The report read should not scan the summary sequentially")
+        self.assertFalse(refresh_scans & {
+            'account_move_line',
+            'sale_commission_plan_partner',
+            'sale_commission_plan_achievement',
+            'sale_order_line_invoice_rel',
+        }, "The summary refresh should not scan these tables sequentially")
+
+    def test_adjustment_rows_scale_linearly(self):
+        """Benchmark: the adjustment query work grows with the adjustments, not adjustments × assignments."""
+        Report = self.env['sale.commission.partner.report']
+
+        def seed(count):
+            agents = self.env['res.partner'].create([{'name': f'Adjusted Agent {i}'} for i in range(count)])
+            assignments = self.env['sale.commission.plan.partner'].create([{
+                'plan_id': self.commission_plan.id,
+                'partner_id': agent.id,
+                'date_from': fields.Date.today(),
+            } for agent in agents])
+            self.env['sale.commission.achievement'].create([{
+                'achieved': 5.0,
+                'note': 'Transfer',
+                'add_partner_id': add.id,
+                'reduce_partner_id': reduce.id,
+            } for add, reduce in zip(assignments, assignments[1:] + assignments[:1])])
+            self.env.flush_all()
+
+        def nodes(node):
+            yield node
+            for child in node.get('Plans', ()):
+                yield from nodes(child)
+
+        def measure():
+            self.env.cr.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {Report._query_adjustments()}")
+            [explain] = self.env.cr.fetchone()[0]
+            rows = explain['Plan']['Actual Rows']
+            work = sum(
+                (node['Actual Rows'] + node.get('Rows Removed by Filter', 0) + node.get('Rows Removed by Join Filter', 0))
+                * node['Actual Loops']
+                for node in nodes(explain['Plan'])
+            )
+            return rows, work
+
+        seed(50)
+        rows_50, work_50 = measure()
+        seed(50)
+        rows_100, work_100 = measure()
+        self.assertEqual(rows_100 - rows_50, 100, "Each adjustment gives an add row and a reduce row")
+        self.assertLess(work_100, 2.5 * work_50, "Doubling the adjustments should about double the work")
+
+    def test_commission_profiling(self):
+        """Calls made with the profiling context are recorded, with their nested calls, and logged at commit."""
+        invoice = self._create_invoice()
+        self.assertIsNone(get_profile_stats(self.env), "Profiling is disabled by default")
+
+        profiled_invoice = invoice.with_context(partner_commission_profile=True)
+        profiled_invoice.action_post()
+        self.assertIsNone(get_profile_stats(self.env), "Calls without the context are not profiled")
+        stats = get_profile_stats(profiled_invoice.env)
+        self.assertEqual(stats['lock_on_post'][0], 1)
+        self.assertEqual(stats['lock_line'][0], 1)
+        self.assertGreaterEqual(stats['lock_on_post'][1], stats['lock_line'][1], "Nested calls are included in the time")
+
+        invoice.button_draft()
+        invoice.action_post()
+        self.assertEqual(stats['lock_on_post'][0], 1, "Later calls of the transaction without the context are not recorded")
+
+        with self.assertLogs('odoo.addons.sale_commission_partner.profiling', 'INFO') as logs:
+            self.env.cr.postcommit.run()
+        [output] = logs.output
+        profile = json.loads(output.split('partner commission profile ', 1)[1])
+        self.assertEqual(profile['calls']['lock_on_post']['count'], 1)
+        self.assertEqual(profile['db'], self.env.cr.dbname)
+
+    def test_commission_metrics(self):
+        """Locks and bills are counted once committed, report queries as they run."""
+        locks = COMMISSION_LOCKS.get(mode='line')
+        bills = COMMISSION_BILLS.get()
+        searches = REPORT_QUERY_SECONDS.get(query='search')[0]
+
+        self._create_posted_invoice()
+        self.assertEqual(COMMISSION_LOCKS.get(mode='line'), locks, "Locks are only counted on commit")
+        self.env.cr.postcommit.run()
+        self.assertEqual(COMMISSION_LOCKS.get(mode='line'), locks + 1)
+
+        self.env['sale.commission.partner.report'].search([('partner_id', '=', self.partner_agent.id)])
+        self.assertEqual(REPORT_QUERY_SECONDS.get(query='search')[0], searches + 1)
+
+        self.env['sale.commission.make.bill'].create({
+            'date_from': fields.Date.today(),
+            'date_to': fields.Date.today(),
+            'partner_ids': [Command.set([self.partner_agent.id])],
+            'product_id': self.commission_product.id,
+        }).action_generate_bills()
+        self.env.cr.postcommit.run()
+        self.assertEqual(COMMISSION_BILLS.get(), bills + 1)
+
+        output = REGISTRY.render()
+        self.assertIn('# TYPE sale_commission_partner_locks_total counter', output)
+        self.assertIn('# TYPE sale_commission_partner_report_query_seconds histogram', output)
+
     def test_commission_rule_matches_parent_category(self):
         """Plan rules on a parent category apply to products in child categories."""
         parent_category = self.env['product.category'].create({'name': 'Microsoft CSP'})
@@ -395,6 +991,67 @@ class TestSaleCommissionPartner(common.TransactionCase):
         })
         self.assertAlmostEqual(so.order_line.commission_amount, 15.0)
 
+    def test_commission_rule_prefers_deepest_category(self):
+        """The rule on the closest category wins over rules on its ancestors, in Python and SQL."""
+        root_category = self.env['product.category'].create({'name': 'Cloud'})
+        parent_category = self.env['product.category'].create({'name': 'Microsoft CSP', 'parent_id': root_category.id})
+        child_category = self.env['product.category'].create({'name': 'Microsoft 365', 'parent_id': parent_category.id})
+        product = self.env['product.product'].create({
+            'name': 'M365 E3',
+            'categ_id': child_category.id,
+            'list_price': 100.0,
+            'type': 'service',
+        })
+        self.commission_plan.write({
+            'achievement_ids': [
+                Command.create({'type': 'amount_sold', 'product_categ_id': root_category.id, 'rate': 0.05}),
+                Command.create({'type': 'amount_sold', 'product_categ_id': parent_category.id, 'rate': 0.15}),
+            ],
+        })
+        so = self.env['sale.order'].create({
+            'partner_id': self.partner_customer.id,
+            'agent_id': self.partner_agent.id,
+            'order_line': [Command.create({
+                'product_id': product.id,
+                'product_uom_qty': 1,
+                'price_unit': 100.0,
+            })],
+        })
+        self.assertAlmostEqual(so.order_line.commission_amount, 15.0)
+
+        so.action_confirm()
+        invoice = so._create_invoices()
+        invoice.action_post()
+        invoice_line = invoice.invoice_line_ids.filtered('agent_id')
+        self.assertAlmostEqual(invoice_line.commission_amount, 15.0)
+
+        # Unlocked lines are rated by the report query itself.
+        invoice_line.commission_locked = False
+        self.env.flush_all()
+        report_line = self.env['sale.commission.partner.report'].search([
+            ('partner_id', '=', self.partner_agent.id),
+            ('source_id', '=', f'account.move,{invoice.id}'),
+        ])
+        self.assertAlmostEqual(report_line.commission, 15.0)
+
+    def test_commission_summary_follows_invoice_state(self):
+        """The report summary is refreshed on post and reset to draft, and a rebuild gives the same rows."""
+        invoice = self._create_posted_invoice()
+        Report = self.env['sale.commission.partner.report']
+        domain = [('source_id', '=', f'account.move,{invoice.id}')]
+        self.assertAlmostEqual(Report.search(domain).commission, 10.0)
+
+        invoice.button_draft()
+        self.assertFalse(Report.search(domain), "Draft invoices must leave the report")
+
+        invoice.action_post()
+        incremental = Report.search_read(domain, ['partner_id', 'plan_id', 'commission'])
+        self.env['sale.commission.partner.summary']._rebuild()
+        rebuilt = Report.search_read(domain, ['partner_id', 'plan_id', 'commission'])
+        self.assertEqual(incremental, rebuilt, "Rows, including their ids, must survive a rebuild")
+        invoice_line = invoice.invoice_line_ids.filtered('agent_id')
+        self.assertEqual([row['id'] for row in rebuilt], [invoice_line.id * 4])
+
     def test_bulk_refresh_partner_commissions(self):
         """Existing sale order lines can be recomputed in bulk after plan changes."""
         so = self.env['sale.order'].create({
@@ -414,6 +1071,15 @@ class TestSaleCommissionPartner(common.TransactionCase):
             'include_locked': False,
         })
         wizard.action_refresh()
+        job = self.env['sale.commission.refresh.job'].search([('plan_id', '=', self.commission_plan.id)])
+        self.assertRecordValues(job, [{'state': 'pending', 'user_id': self.env.user.id, 'company_ids': self.env.companies.ids}])
+        self.assertIn(('order_id', 'any', [('state', 'in', ['draft', 'sent', 'sale'])]), job._get_line_domain())
+
+        with patch.object(type(self.env.cr), 'commit') as commit:
+            self.env['sale.commission.refresh.job']._cron_process_jobs()
+        self.assertEqual(commit.call_count, 1)
+        self.assertRecordValues(job, [{'state': 'done', 'lines_total': 1, 'lines_processed': 1, 'lines_updated': 1}])
+        self.assertIn("1 of 1", self.commission_plan.message_ids[:1].body)
         so.order_line.invalidate_recordset(['commission_amount'])
         self.assertAlmostEqual(so.order_line.commission_amount, 20.0)
 
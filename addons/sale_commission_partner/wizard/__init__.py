@@ -1,3 +1,4 @@
 from . import sale_commission_make_bill
 from . import sale_commission_add_multiple_partner
 from . import sale_commission_refresh
+from . import sale_commission_partner_export
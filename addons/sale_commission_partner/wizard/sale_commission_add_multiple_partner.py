@@ -1,14 +1,74 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields, Command
+import base64
+import csv
+import io
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
 
 
 class SaleCommissionPlanPartnerWizard(models.TransientModel):
     _name = 'sale.commission.plan.partner.wizard'
     _description = 'Wizard for selecting multiple partners'
 
+    mode = fields.Selection([
+        ('select', "Select Agents"),
+        ('import', "Import CSV"),
+    ], string="Mode", default='select', required=True)
     partner_ids = fields.Many2many('res.partner', string="Agents")
+    date_from = fields.Date("From", default=fields.Date.today)
+    date_to = fields.Date("To")
+    import_file = fields.Binary("CSV File")
+    import_filename = fields.Char("File Name")
 
     def submit(self):
         plan_id = self.env['sale.commission.plan'].browse(self.env.context.get('active_ids'))
-        plan_id.partner_ids = [Command.create({'partner_id': partner_id.id, 'plan_id': plan_id.id}) for partner_id in self.partner_ids]
+        if self.mode == 'import':
+            assignments = self._read_import_file()
+        else:
+            assignments = [(partner.id, self.date_from or fields.Date.today(), self.date_to) for partner in self.partner_ids]
+        self.env['sale.commission.plan.partner']._bulk_assign(plan_id, assignments)
+
+    def _read_import_file(self):
+        """Read ``(partner_id, date_from, date_to)`` rows from the uploaded CSV.
+
+        Agents are given by database id (``partner_id`` column) or by internal
+        reference (``partner_ref`` column); ``date_from`` and ``date_to`` are
+        ISO dates, ``date_from`` defaulting to the wizard date.
+        """
+        self.ensure_one()
+        if not self.import_file:
+            raise UserError(_("Please upload a CSV file."))
+        try:
+            content = base64.b64decode(self.import_file).decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise UserError(_("The file must be UTF-8 encoded.")) from None
+        rows = list(csv.DictReader(io.StringIO(content)))
+        if not rows:
+            raise UserError(_("The file contains no agent."))
+
+        refs = {row['partner_ref'].strip() for row in rows if (row.get('partner_ref') or '').strip()}
+        partner_ids_by_ref = {}
+        if refs:
+            for partner in self.env['res.partner'].search_fetch([('ref', 'in', list(refs))], ['ref']):
+                if partner_ids_by_ref.setdefault(partner.ref, partner.id) != partner.id:
+                    raise UserError(_("Several agents have the reference %s.", partner.ref))
+
+        assignments = []
+        for line_number, row in enumerate(rows, start=2):
+            partner_id = (row.get('partner_id') or '').strip()
+            partner_ref = (row.get('partner_ref') or '').strip()
+            try:
+                if partner_id:
+                    partner_id = int(partner_id)
+                elif partner_ref in partner_ids_by_ref:
+                    partner_id = partner_ids_by_ref[partner_ref]
+                else:
+                    raise ValueError(_("unknown agent %s", partner_ref or _("(empty)")))
+                date_from = fields.Date.to_date((row.get('date_from') or '').strip() or None) or self.date_from or fields.Date.today()
+                date_to = fields.Date.to_date((row.get('date_to') or '').strip() or None) or False
+            except ValueError as e:
+                raise UserError(_("Line %(line)s: %(error)s", line=line_number, error=e)) from None
+            assignments.append((partner_id, date_from, date_to))
+        return assignments
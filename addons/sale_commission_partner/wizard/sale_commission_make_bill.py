@@ -1,6 +1,6 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError
 
 class SaleCommissionMakeBill(models.TransientModel):
@@ -11,53 +11,55 @@ class SaleCommissionMakeBill(models.TransientModel):
     date_to = fields.Date("To", required=True, default=fields.Date.context_today)
     partner_ids = fields.Many2many('res.partner', string="Agents", help="Leave empty to generate for all agents with commissions.")
     product_id = fields.Many2one('product.product', string="Commission Product", required=True, domain=[('type', '=', 'service')])
+    auto_post = fields.Boolean("Post Bills", help="Confirm the generated bills in a single batch.")
+    in_background = fields.Boolean("Run in Background", help="Generate the bills in a background job, for large numbers of agents.")
 
-    def action_generate_bills(self):
+    def _get_entry_domain(self):
         self.ensure_one()
-        
-        # 1. Fetch Commission Data
         domain = [
             ('date', '>=', self.date_from),
             ('date', '<=', self.date_to),
         ]
         if self.partner_ids:
             domain.append(('partner_id', 'in', self.partner_ids.ids))
-            
-        groups = self.env['sale.commission.partner.report']._read_group(
-            domain,
-            groupby=['partner_id', 'currency_id'],
-            aggregates=['commission:sum']
-        )
-
-        if not groups:
-            raise UserError(_("No commissions found for the selected criteria."))
+        return domain
 
-        moves = self.env['account.move']
-        
-        # 2. Group by Partner and Currency
-        for partner, currency, amount in groups:
-            if amount <= 0:
-                continue
+    def action_generate_bills(self):
+        self.ensure_one()
+        # Sync the ledger with the invoices and adjustments changed in this transaction
+        self.env['sale.commission.partner.summary']._process_refresh_queue()
 
-            # 3. Create Vendor Bill
-            move_vals = {
-                'move_type': 'in_invoice',
-                'partner_id': partner.id,
-                'invoice_date': fields.Date.context_today(self),
-                'currency_id': currency.id,
-                'invoice_line_ids': [
-                    (0, 0, {
-                        'product_id': self.product_id.id,
-                        'name': _("Commission for period %s - %s") % (self.date_from, self.date_to),
-                        'quantity': 1,
-                        'price_unit': amount,
-                    })
-                ]
+        if self.in_background:
+            job = self.env['sale.commission.bill.job'].create({
+                'date_from': self.date_from,
+                'date_to': self.date_to,
+                'partner_ids': [Command.set(self.partner_ids.ids)],
+                'product_id': self.product_id.id,
+                'auto_post': self.auto_post,
+            })
+            job._trigger()
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Bill generation started'),
+                    'message': _('Commission bills are generated in the background; follow the progress in Commission Bill Runs.'),
+                    'type': 'info',
+                    'sticky': False,
+                    'next': {'type': 'ir.actions.act_window_close'},
+                },
             }
-            moves += self.env['account.move'].create(move_vals)
 
-        if not moves:
-             raise UserError(_("No bills were generated. Check if commission amounts are positive."))
+        Ledger = self.env['sale.commission.partner.ledger']
+        description = _("Commission for period %s - %s") % (self.date_from, self.date_to)
+        bill_groups = Ledger._get_bill_groups(self._get_entry_domain(), description)
+        if not bill_groups:
+            raise UserError(_("No commissions found for the selected criteria."))
+
+        moves = Ledger._create_bills(bill_groups, self.product_id)
+        if self.auto_post:
+            # posting the whole batch at once numbers the bills under a single sequence lock
+            moves.action_post()
 
         return {
             'name': _('Generated Bills'),
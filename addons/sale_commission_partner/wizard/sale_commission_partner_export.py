@@ -0,0 +1,44 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import fields, models
+
+
+class SaleCommissionPartnerExport(models.TransientModel):
+    _name = 'sale.commission.partner.export'
+    _description = "Export Partner Commissions"
+
+    date_from = fields.Date("From", required=True, default=lambda self: fields.Date.context_today(self).replace(month=1, day=1))
+    date_to = fields.Date("To", required=True, default=fields.Date.context_today)
+    partner_ids = fields.Many2many('res.partner', string="Agents", help="Leave empty to export all agents.")
+    plan_id = fields.Many2one('sale.commission.plan', "Commission Plan", domain=[('user_type', '=', 'partner')])
+    file_format = fields.Selection([
+        ('csv', "CSV"),
+        ('xlsx', "Excel (XLSX)"),
+    ], "Format", default='xlsx', required=True)
+    per_agent = fields.Boolean("One Statement per Agent", help="Download a zip archive holding one statement file per agent.")
+
+    def _get_report_domain(self):
+        self.ensure_one()
+        domain = [
+            ('date', '>=', self.date_from),
+            ('date', '<=', self.date_to),
+        ]
+        if self.partner_ids:
+            domain.append(('partner_id', 'in', self.partner_ids.ids))
+        if self.plan_id:
+            domain.append(('plan_id', '=', self.plan_id.id))
+        return domain
+
+    def _write_export(self, fileobj):
+        self.ensure_one()
+        return self.env['sale.commission.partner.report']._write_export(
+            fileobj, self._get_report_domain(), file_format=self.file_format, per_agent=self.per_agent,
+        )
+
+    def action_export(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/sale_commission_partner/export/{self.id}',
+            'target': 'download',
+        }
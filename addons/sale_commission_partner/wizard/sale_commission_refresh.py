@@ -34,15 +34,12 @@ class SaleCommissionRefreshWizard(models.TransientModel):
         help="Unlock and recalculate commission on confirmed sales order lines, then lock them again.",
     )
 
-    def _get_target_lines(self):
+    def _get_target_line_domain(self):
+        """Return the domain of the lines to update, with the orders as a subquery."""
         self.ensure_one()
         line_domain = [('agent_id', '!=', False), ('display_type', '=', False)]
         if self.plan_id:
-            agent_ids = self.plan_id.partner_ids.partner_id.ids
-            if agent_ids:
-                line_domain.append(('agent_id', 'in', agent_ids))
-            else:
-                return self.env['sale.order.line']
+            line_domain.append(('agent_id', 'any', [('commission_plan_ids.plan_id', '=', self.plan_id.id)]))
         if self.order_ids:
             line_domain.append(('order_id', 'in', self.order_ids.ids))
         else:
@@ -54,25 +51,31 @@ class SaleCommissionRefreshWizard(models.TransientModel):
             else:
                 order_domain.append(('state', 'in', ['draft', 'sent', 'sale']))
             if self.date_from:
-                order_domain.append(('date_order', '>=', fields.Datetime.to_datetime(self.date_from)))
+                order_domain.append(('date_order', '>=', fields.Datetime.to_string(fields.Datetime.to_datetime(self.date_from))))
             if self.date_to:
-                order_domain.append(('date_order', '<=', fields.Datetime.end_of(self.date_to, 'day')))
-            if order_domain:
-                orders = self.env['sale.order'].search(order_domain)
-                line_domain.append(('order_id', 'in', orders.ids))
-        return self.env['sale.order.line'].search(line_domain)
+                order_domain.append(('date_order', '<=', fields.Datetime.to_string(fields.Datetime.end_of(self.date_to, 'day'))))
+            line_domain.append(('order_id', 'any', order_domain))
+        return line_domain
+
+    def _get_target_lines(self):
+        return self.env['sale.order.line'].search(self._get_target_line_domain())
 
     def action_refresh(self):
         self.ensure_one()
-        lines = self._get_target_lines()
-        updated = lines.refresh_partner_commission(force=self.include_locked)
+        job = self.env['sale.commission.refresh.job'].create({
+            'plan_id': self.plan_id.id,
+            'domain': repr(self._get_target_line_domain()),
+            'include_locked': self.include_locked,
+        })
+        job._trigger()
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
-                'title': _('Commissions updated'),
-                'message': _('%s sales order line(s) updated.', updated),
-                'type': 'success',
+                'title': _('Commission update started'),
+                'message': _('Sales order lines are updated in the background; a summary will be posted on the plan.'),
+                'type': 'info',
                 'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
             },
         }